@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+import cv2
+import psutil
+import utils
+import pdf_writer
+import capture_engine
+import frame_spool
+
+STAGES = ['grab', 'resize', 'encode', 'write', 'pdf_page']
+
+def percentile(samples, pct):
+    """Return the pct-th percentile of a list of samples (nearest-rank)"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+def summarize(samples):
+    """Return latency statistics in milliseconds for a list of durations in seconds"""
+    ms = [s * 1000 for s in samples]
+    return {
+        'count': len(ms),
+        'mean_ms': sum(ms) / len(ms) if ms else 0.0,
+        'p50_ms': percentile(ms, 50),
+        'p90_ms': percentile(ms, 90),
+        'p99_ms': percentile(ms, 99),
+        'max_ms': max(ms) if ms else 0.0
+    }
+
+class PeakRSS:
+    """Track the peak resident set size of this process between samples"""
+
+    def __init__(self):
+        self.process = psutil.Process()
+        self.peak = 0
+
+    def sample(self):
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+def bench_quality(quality, frames, source_size, work_dir, encoding, pdf_workers=1, target=None,
+                  fit='letterbox', interpolation='area'):
+    """Run grab -> resize -> encode -> spool -> PDF for one quality preset and return its results"""
+    frame_dir = os.path.join(work_dir, quality)
+    os.makedirs(frame_dir)
+    grabber = capture_engine.SyntheticGrabber(source_size, textured=True)
+    engine = capture_engine.CaptureEngine(grabber=grabber, target=target, fit=fit, interpolation=interpolation)
+    timings = {stage: [] for stage in STAGES}
+    rss = PeakRSS()
+    rss.sample()
+
+    spool = frame_spool.FrameSpool(frame_dir)
+    intermediate_bytes = 0
+    incremental_path = os.path.join(work_dir, f"incremental_{quality}.pdf")
+    writer = pdf_writer.IncrementalPDFWriter(incremental_path)
+    wall_start = time.perf_counter()
+    for i in range(frames):
+        t0 = time.perf_counter()
+        grabbed = grabber.grab(engine.target.resolve(grabber))
+        t1 = time.perf_counter()
+        canvas = engine.process(grabbed, quality)
+        t2 = time.perf_counter()
+        image_format = encoding.choose_format(canvas)
+        ok, encoded = cv2.imencode(utils.IMAGE_FORMATS[image_format], canvas, encoding.params(image_format))
+        if not ok:
+            raise RuntimeError("cv2.imencode failed")
+        t3 = time.perf_counter()
+        height, width = canvas.shape[:2]
+        entry = spool.append(encoded, width, height, datetime.now(), quality, image_format)
+        t4 = time.perf_counter()
+        writer.add_spooled_page(spool, entry, caption=utils.screenshot_caption(None, entry))
+        t5 = time.perf_counter()
+
+        timings['grab'].append(t1 - t0)
+        timings['resize'].append(t2 - t1)
+        timings['encode'].append(t3 - t2)
+        timings['write'].append(t4 - t3)
+        timings['pdf_page'].append(t5 - t4)
+        intermediate_bytes += len(encoded)
+        rss.sample()
+    capture_elapsed = time.perf_counter() - wall_start
+
+    t0 = time.perf_counter()
+    writer.close()
+    pdf_finish = time.perf_counter() - t0
+    rss.sample()
+
+    # The batch FPDF path is what the server's /stop_capture still uses
+    fpdf_path = os.path.join(work_dir, f"fpdf_{quality}.pdf")
+    t0 = time.perf_counter()
+    utils.create_pdf_with_fpdf(spool.entries(), fpdf_path, workers=pdf_workers, spool=spool)
+    fpdf_build = time.perf_counter() - t0
+    rss.sample()
+
+    spool.close()
+    engine.close()
+    return {
+        'frames': frames,
+        'resolution': [width, height],
+        'stages': {stage: summarize(samples) for stage, samples in timings.items()},
+        'throughput_fps': frames / capture_elapsed if capture_elapsed else 0.0,
+        'pdf_finish_ms': pdf_finish * 1000,
+        'fpdf_build_ms': fpdf_build * 1000,
+        # Peak for the whole process so far, so presets run later include earlier allocations
+        'peak_rss_mb': rss.peak / (1024 * 1024),
+        'intermediate_bytes': intermediate_bytes,
+        'incremental_pdf_bytes': os.path.getsize(incremental_path),
+        'fpdf_pdf_bytes': os.path.getsize(fpdf_path)
+    }
+
+# Metrics compared against a baseline, and whether a higher value is better
+COMPARED_METRICS = {
+    'throughput_fps': True,
+    'pdf_finish_ms': False,
+    'fpdf_build_ms': False,
+    'peak_rss_mb': False,
+    'incremental_pdf_bytes': False
+}
+
+def compare(results, baseline, tolerance):
+    """Return a list of regression messages for metrics that got worse by more than tolerance percent"""
+    regressions = []
+    for quality, current in results['qualities'].items():
+        previous = baseline.get('qualities', {}).get(quality)
+        if not previous:
+            continue
+        checks = [(name, current[name], previous[name], higher_is_better)
+                  for name, higher_is_better in COMPARED_METRICS.items() if name in previous]
+        checks += [(f"{stage}.p50_ms", current['stages'][stage]['p50_ms'], previous['stages'][stage]['p50_ms'], False)
+                   for stage in STAGES if stage in previous.get('stages', {})]
+        for name, now, before, higher_is_better in checks:
+            # Ignore sub-millisecond jitter on timings that are near zero
+            if not before or (name.endswith('_ms') and abs(now - before) < 1.0):
+                continue
+            change = (now - before) / before * 100
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append(f"{quality} {name}: {before:.2f} -> {now:.2f} ({change:+.1f}%)")
+    return regressions
+
+def print_report(results):
+    for quality, result in results['qualities'].items():
+        print(f"\n{quality} {result['resolution'][0]}x{result['resolution'][1]}, {result['frames']} frames")
+        print(f"  {'stage':<10} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for stage, stats in result['stages'].items():
+            print(f"  {stage:<10} {stats['p50_ms']:>9.2f} {stats['p90_ms']:>9.2f} {stats['p99_ms']:>9.2f} {stats['max_ms']:>9.2f}")
+        print(f"  throughput: {result['throughput_fps']:.2f} fps, peak RSS: {result['peak_rss_mb']:.1f} MB")
+        print(f"  PDF finish (incremental): {result['pdf_finish_ms']:.1f} ms, FPDF batch build: {result['fpdf_build_ms']:.1f} ms")
+        print(f"  sizes: intermediates {result['intermediate_bytes'] / 1e6:.1f} MB, "
+              f"incremental PDF {result['incremental_pdf_bytes'] / 1e6:.1f} MB, FPDF PDF {result['fpdf_pdf_bytes'] / 1e6:.1f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the capture -> resize -> encode -> PDF path on synthetic frames (no display needed)')
+    parser.add_argument('-q', '--quality', type=str, nargs='+', default=list(capture_engine.QUALITY_PRESETS),
+                        help='Quality settings to benchmark: presets or custom ones such as 1600x900, 50%% or native (default: all presets)')
+    parser.add_argument('-f', '--frames', type=int, default=20,
+                        help='Frames per quality preset (default: 20)')
+    parser.add_argument('--source', type=str, default='3840x2160',
+                        help='Size of the synthetic screen, WIDTHxHEIGHT (default: 3840x2160)')
+    parser.add_argument('--fit', type=str, default='letterbox',
+                        help='letterbox (pad to the quality size) or fit (no padding) (default: letterbox)')
+    parser.add_argument('--interpolation', type=str, default='area',
+                        help='Resize interpolation: nearest, linear, area, cubic or lanczos (default: area)')
+    parser.add_argument('--target', type=str, default='screen',
+                        help='Part of the synthetic screen to grab: screen, monitor:1 or region:X,Y,WIDTH,HEIGHT (default: screen)')
+    parser.add_argument('--format', type=str, default='png',
+                        help='Screenshot format to encode: png, jpeg, webp or auto (default: png)')
+    parser.add_argument('--jpeg-quality', type=int, default=90,
+                        help='JPEG and WebP quality, 1-100 (default: 90)')
+    parser.add_argument('--png-compression', type=int, default=None,
+                        help='PNG compression level, 0-9 (default: OpenCV default)')
+    parser.add_argument('--pdf-workers', type=int, default=1,
+                        help='Worker processes for the batch FPDF build (default: 1, i.e. serial)')
+    parser.add_argument('-o', '--output', type=str, default=None,
+                        help='Write machine-readable results to this JSON file')
+    parser.add_argument('--compare', type=str, default=None,
+                        help='Baseline JSON from a previous run; exit with status 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=10.0,
+                        help='Allowed change in percent before a metric counts as a regression (default: 10)')
+    args = parser.parse_args()
+
+    try:
+        for quality in args.quality:
+            capture_engine.parse_quality(quality)
+    except ValueError as e:
+        print(f"Error: {str(e)}")
+        return 2
+    if args.fit not in capture_engine.FIT_MODES or args.interpolation not in capture_engine.INTERPOLATIONS:
+        print(f"Error: Fit must be one of {', '.join(capture_engine.FIT_MODES)} and interpolation "
+              f"one of {', '.join(capture_engine.INTERPOLATIONS)}")
+        return 2
+    try:
+        source_size = tuple(int(v) for v in args.source.lower().split('x'))
+        if len(source_size) != 2:
+            raise ValueError
+    except ValueError:
+        print("Error: Source size must look like 1920x1080")
+        return 2
+
+    try:
+        target = capture_engine.CaptureTarget.parse(args.target)
+    except ValueError as e:
+        print(f"Error: {str(e)}")
+        return 2
+
+    try:
+        encoding = utils.EncodingPolicy(args.format, jpeg_quality=args.jpeg_quality, png_compression=args.png_compression)
+    except ValueError as e:
+        print(f"Error: {str(e)}")
+        return 2
+
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'source': list(source_size),
+        'target': str(target),
+        'fit': args.fit,
+        'interpolation': args.interpolation,
+        'encoding': encoding.describe(),
+        'pdf_workers': args.pdf_workers,
+        'qualities': {}
+    }
+
+    work_dir = tempfile.mkdtemp(prefix='snip_bench_')
+    try:
+        for quality in args.quality:
+            print(f"Benchmarking {quality}...")
+            results['qualities'][quality] = bench_quality(quality, args.frames, source_size, work_dir, encoding,
+                                                          args.pdf_workers, target, args.fit, args.interpolation)
+            # Free this preset's files before the next one so disk use stays bounded
+            for name in os.listdir(work_dir):
+                path = os.path.join(work_dir, name)
+                shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to: {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nRegressions against {args.compare} (tolerance {args.tolerance}%):")
+            for message in regressions:
+                print(f"  {message}")
+            return 1
+        print(f"\nNo regressions against {args.compare} (tolerance {args.tolerance}%)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+import threading
+
+# What a capture does when it reaches a budget: stop capturing, finish the PDF and carry on
+# in a new part, or drop every other frame captured so far
+BUDGET_POLICIES = ['stop', 'rollover', 'thin']
+
+MB = 1024 * 1024
+
+class CaptureBudget:
+    """Limits on the frames, spooled bytes and PDF bytes one capture holds, and its policy at a limit
+
+    The capture updates the usage after every frame, and applies its policy when exceeded()
+    gives a reason. Usage counts what the capture is still working on: the frames in its
+    spool and the PDF part being written, not parts already finished by a rollover. With a
+    pool, the disk budget shared with other captures applies as well. None disables a limit.
+    """
+
+    def __init__(self, max_frames=None, max_spool_bytes=None, max_pdf_bytes=None, policy='stop', pool=None):
+        if policy not in BUDGET_POLICIES:
+            raise ValueError(f"Invalid budget policy: {policy}")
+        self.max_frames = max_frames
+        self.max_spool_bytes = max_spool_bytes
+        self.max_pdf_bytes = max_pdf_bytes
+        self.policy = policy
+        self.pool = pool
+        self.frames = 0
+        self.spool_bytes = 0
+        self.pdf_bytes = 0
+        # PDF parts finished by rollovers, and frames dropped by thinning
+        self.parts = []
+        self.thinned = 0
+        # Why the capture stopped, once the stop policy was applied
+        self.stopped_reason = None
+
+    @classmethod
+    def from_args(cls, args, pool=None):
+        """Build the budget of a capture from build_parser() settings"""
+        return cls(max_frames=args.max_frames,
+                   max_spool_bytes=int(args.max_spool_mb * MB) if args.max_spool_mb is not None else None,
+                   max_pdf_bytes=int(args.max_pdf_mb * MB) if args.max_pdf_mb is not None else None,
+                   policy=args.budget_policy, pool=pool)
+
+    def update(self, frames, spool_bytes, pdf_bytes):
+        self.frames = frames
+        self.spool_bytes = spool_bytes
+        self.pdf_bytes = pdf_bytes
+
+    def disk_bytes(self):
+        return self.spool_bytes + self.pdf_bytes
+
+    def exceeded(self):
+        """Return why the capture is over budget, or None"""
+        if self.max_frames is not None and self.frames >= self.max_frames:
+            return f"{self.frames} frames (limit {self.max_frames})"
+        if self.max_spool_bytes is not None and self.spool_bytes >= self.max_spool_bytes:
+            return f"{self.spool_bytes / MB:.1f} MB spooled (limit {self.max_spool_bytes / MB:.1f} MB)"
+        if self.max_pdf_bytes is not None and self.pdf_bytes >= self.max_pdf_bytes:
+            return f"{self.pdf_bytes / MB:.1f} MB of PDF (limit {self.max_pdf_bytes / MB:.1f} MB)"
+        if self.pool is not None:
+            return self.pool.exceeded(self)
+        return None
+
+    def to_dict(self):
+        return {
+            'policy': self.policy,
+            'frames': self.frames,
+            'max_frames': self.max_frames,
+            'spool_mb': round(self.spool_bytes / MB, 1),
+            'max_spool_mb': round(self.max_spool_bytes / MB, 1) if self.max_spool_bytes is not None else None,
+            'pdf_mb': round(self.pdf_bytes / MB, 1),
+            'max_pdf_mb': round(self.max_pdf_bytes / MB, 1) if self.max_pdf_bytes is not None else None,
+            'parts': list(self.parts),
+            'thinned': self.thinned,
+            'stopped_reason': self.stopped_reason
+        }
+
+class BudgetPool:
+    """Disk budget shared by the captures of one process (the server's sessions)
+
+    When the captures together hold more than max_disk_bytes, the ones holding at least an
+    even share of it apply their policy, so a small capture isn't stopped, thinned or rolled
+    over because of a big one.
+    """
+
+    def __init__(self, max_disk_bytes=None):
+        self.max_disk_bytes = max_disk_bytes
+        self.lock = threading.Lock()
+        self.budgets = set()
+
+    def add(self, budget):
+        with self.lock:
+            self.budgets.add(budget)
+
+    def remove(self, budget):
+        with self.lock:
+            self.budgets.discard(budget)
+
+    def disk_bytes(self):
+        with self.lock:
+            return sum(budget.disk_bytes() for budget in self.budgets)
+
+    def exhausted(self):
+        return self.max_disk_bytes is not None and self.disk_bytes() >= self.max_disk_bytes
+
+    def exceeded(self, budget):
+        """Return why budget's capture is over the shared budget, or None"""
+        if self.max_disk_bytes is None:
+            return None
+        with self.lock:
+            used = sum(member.disk_bytes() for member in self.budgets)
+            share = self.max_disk_bytes / max(1, len(self.budgets))
+        if used >= self.max_disk_bytes and budget.disk_bytes() >= share:
+            return f"{used / MB:.1f} MB used by all captures (limit {self.max_disk_bytes / MB:.1f} MB)"
+        return None
@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+import subprocess
+import sys
+import time
+from startup import lazy_import
+
+# OpenCV and NumPy load on first use, so importing the presets stays cheap
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+# Quality presets (width, height)
+QUALITY_PRESETS = {
+    '480p': (854, 480),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+    '2k': (2560, 1440),
+    '4k': (3840, 2160)
+}
+
+# Ways to fit a frame into a WIDTHxHEIGHT quality: 'letterbox' pads it to exactly that size with
+# black bars, 'fit' scales it to fit inside without padding (so the output keeps the frame's aspect)
+FIT_MODES = ['letterbox', 'fit']
+
+# Resize interpolation (cv2 constant names), roughly fastest first; 'area' gives the best
+# downscaled text but costs the most at 4k
+INTERPOLATIONS = {
+    'nearest': 'INTER_NEAREST',
+    'linear': 'INTER_LINEAR',
+    'area': 'INTER_AREA',
+    'cubic': 'INTER_CUBIC',
+    'lanczos': 'INTER_LANCZOS4'
+}
+
+# Largest custom quality size, in pixels per side
+MAX_QUALITY_SIDE = 16384
+
+# Screen size assumed when estimating memory for qualities that follow the captured area
+ESTIMATE_SOURCE_SIZE = (3840, 2160)
+
+QUALITY_HELP = ', '.join(QUALITY_PRESETS) + ', WIDTHxHEIGHT, a percentage such as 50% or native'
+
+def parse_quality(quality):
+    """Return how a quality setting sizes frames; raises ValueError if it is invalid
+
+    ('box', (width, height)) for a preset or WIDTHxHEIGHT, ('scale', factor) for a
+    percentage of the captured area (e.g. 50%), or ('native', None) for no resize.
+    """
+    if quality in QUALITY_PRESETS:
+        return 'box', QUALITY_PRESETS[quality]
+    # Frame spools store the setting in 16 bytes
+    if not isinstance(quality, str) or len(quality) > 16:
+        raise ValueError(f"Invalid quality setting. Must be one of: {QUALITY_HELP}")
+    if quality == 'native':
+        return 'native', None
+    try:
+        if quality.endswith('%'):
+            percent = float(quality[:-1])
+            if 0 < percent <= 100:
+                return 'scale', percent / 100
+        else:
+            width, height = (int(side) for side in quality.lower().split('x'))
+            if 0 < width <= MAX_QUALITY_SIDE and 0 < height <= MAX_QUALITY_SIDE:
+                return 'box', (width, height)
+    except (AttributeError, ValueError):
+        pass
+    raise ValueError(f"Invalid quality setting. Must be one of: {QUALITY_HELP}")
+
+def output_size(quality, source_width, source_height, fit='letterbox'):
+    """Return ((canvas width, height), (scaled frame width, height)) for a frame of the given size"""
+    kind, value = parse_quality(quality)
+    if kind == 'native':
+        return (source_width, source_height), (source_width, source_height)
+    if kind == 'scale':
+        size = (max(1, round(source_width * value)), max(1, round(source_height * value)))
+        return size, size
+
+    target_width, target_height = value
+    aspect_ratio = source_width / source_height
+
+    # Calculate new dimensions while maintaining aspect ratio
+    if aspect_ratio > (target_width / target_height):
+        # Width is the limiting factor
+        new_width = target_width
+        new_height = max(1, int(target_width / aspect_ratio))
+    else:
+        # Height is the limiting factor
+        new_height = target_height
+        new_width = max(1, int(target_height * aspect_ratio))
+    if fit == 'fit':
+        return (new_width, new_height), (new_width, new_height)
+    return (target_width, target_height), (new_width, new_height)
+
+def estimated_frame_size(quality):
+    """Return the largest (width, height) a quality setting produces, assuming a 4k screen where it follows the screen"""
+    kind, value = parse_quality(quality)
+    if kind == 'box':
+        return value
+    return output_size(quality, *ESTIMATE_SOURCE_SIZE)[0]
+
+# Conversion from each grabber's native channel order to OpenCV's BGR (cv2 constant names)
+TO_BGR = {
+    'BGRA': 'COLOR_BGRA2BGR',
+    'RGB': 'COLOR_RGB2BGR',
+    'BGR': None
+}
+
+# Grabbers describe screen areas as mss does: dicts with 'left', 'top', 'width' and 'height'
+# in virtual desktop coordinates. monitors() lists the whole desktop first, then each monitor.
+
+class MSSGrabber:
+    """Grab the screen with mss, exposing its BGRA buffer to NumPy without copying"""
+    name = 'mss'
+    channels = 'BGRA'
+
+    def __init__(self):
+        import mss
+        self._mss = mss
+        self._sct = None
+
+    def _handle(self):
+        # mss handles are bound to the thread that created them, so open lazily on first use
+        if self._sct is None:
+            self._sct = self._mss.mss()
+        return self._sct
+
+    def monitors(self):
+        return self._handle().monitors
+
+    def grab(self, region=None):
+        """Grab region (the whole virtual desktop by default); only that area is copied from the screen"""
+        sct = self._handle()
+        shot = sct.grab(region or sct.monitors[0])
+        return np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+
+    def close(self):
+        if self._sct is not None:
+            self._sct.close()
+            self._sct = None
+
+class PyAutoGUIGrabber:
+    """Grab the screen with pyautogui (one PIL -> NumPy copy per frame)"""
+    name = 'pyautogui'
+    channels = 'RGB'
+
+    def __init__(self):
+        import pyautogui
+        self._pyautogui = pyautogui
+
+    def monitors(self):
+        # pyautogui only knows the primary screen
+        width, height = self._pyautogui.size()
+        screen = {'left': 0, 'top': 0, 'width': width, 'height': height}
+        return [screen, dict(screen)]
+
+    def grab(self, region=None):
+        if region is None:
+            return np.asarray(self._pyautogui.screenshot())
+        return np.asarray(self._pyautogui.screenshot(
+            region=(region['left'], region['top'], region['width'], region['height'])))
+
+    def close(self):
+        pass
+
+class SyntheticGrabber:
+    """Produce synthetic frames with a moving bar, for headless testing and benchmarks
+
+    With textured=True the background looks more like a real screen (windows, text lines
+    and a gradient), which matters when measuring encode time and file size. The screen is
+    split side by side into monitor_count monitors and has one window, titled WINDOW_TITLE.
+    """
+    name = 'synthetic'
+    channels = 'BGR'
+    WINDOW_TITLE = 'Synthetic Window'
+
+    def __init__(self, size=(1920, 1080), textured=False, seed=0, monitor_count=1):
+        width, height = size
+        self.size = size
+        self.frame = np.empty((height, width, 3), dtype=np.uint8)
+        self.background = make_screen_background(size, seed) if textured else None
+        self.bar_width = max(1, width // 20)
+        self.monitor_count = monitor_count
+        self.count = 0
+
+    def monitors(self):
+        width, height = self.size
+        monitor_width = width // self.monitor_count
+        return [{'left': 0, 'top': 0, 'width': width, 'height': height}] + [
+            {'left': i * monitor_width, 'top': 0, 'width': monitor_width, 'height': height}
+            for i in range(self.monitor_count)]
+
+    def find_window(self, title):
+        if title.lower() not in self.WINDOW_TITLE.lower():
+            return None
+        width, height = self.size
+        return {'left': width // 8, 'top': height // 8, 'width': width // 2, 'height': height // 2}
+
+    def grab(self, region=None):
+        # Redraw only the grabbed area, in place, so grabbing never allocates and costs what a real grab of it would
+        width, height = self.size
+        if region is None:
+            region = {'left': 0, 'top': 0, 'width': width, 'height': height}
+        rows = slice(region['top'], region['top'] + region['height'])
+        columns = slice(region['left'], region['left'] + region['width'])
+        frame = self.frame[rows, columns]
+        if self.background is None:
+            frame[:] = (48, 48, 48)
+        else:
+            np.copyto(frame, self.background[rows, columns])
+        x = (self.count * self.bar_width) % width - region['left']
+        if x + self.bar_width > 0 and x < region['width']:
+            frame[:, max(0, x):x + self.bar_width] = (255, 128, 0)
+        self.count += 1
+        return frame
+
+    def close(self):
+        pass
+
+def make_screen_background(size, seed=0):
+    """Draw a desktop-like image: a gradient wallpaper with a few windows full of text lines"""
+    width, height = size
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(40, 160, width, dtype=np.uint8)
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[:] = gradient[np.newaxis, :, np.newaxis]
+
+    scale = height / 1080
+    for _ in range(6):
+        x0 = int(rng.integers(0, width * 3 // 4))
+        y0 = int(rng.integers(0, height * 3 // 4))
+        x1 = min(width - 1, x0 + int(rng.integers(width // 6, width // 2)))
+        y1 = min(height - 1, y0 + int(rng.integers(height // 6, height // 2)))
+        cv2.rectangle(image, (x0, y0), (x1, y1), (245, 245, 245), -1)
+        cv2.rectangle(image, (x0, y0), (x1, y0 + int(28 * scale)), tuple(int(c) for c in rng.integers(0, 255, 3)), -1)
+        line_height = max(8, int(22 * scale))
+        for y in range(y0 + int(50 * scale), y1 - line_height, line_height):
+            words = ' '.join('lorem' if rng.random() < 0.5 else 'ipsum' for _ in range(int(rng.integers(3, 12))))
+            cv2.putText(image, words, (x0 + 10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5 * scale, (30, 30, 30), 1, cv2.LINE_AA)
+    return image
+
+def find_window(title):
+    """Return the area of the first visible window whose title contains title, or None
+
+    Uses pygetwindow (installed with pyautogui on Windows and macOS) or, on Linux, wmctrl.
+    """
+    try:
+        import pygetwindow
+        for window in pygetwindow.getWindowsWithTitle(title):
+            if window.width > 0 and window.height > 0 and not getattr(window, 'isMinimized', False):
+                return {'left': window.left, 'top': window.top, 'width': window.width, 'height': window.height}
+        return None
+    except (ImportError, NotImplementedError, AttributeError):
+        if not sys.platform.startswith('linux'):
+            raise RuntimeError("Window capture needs the pygetwindow package")
+    try:
+        output = subprocess.run(['wmctrl', '-lG'], capture_output=True, text=True, timeout=2, check=True).stdout
+    except (OSError, subprocess.SubprocessError):
+        raise RuntimeError("Window capture on Linux needs wmctrl")
+    for line in output.splitlines():
+        # Window ID, desktop, x, y, width, height, host, title
+        fields = line.split(None, 7)
+        if len(fields) == 8 and title.lower() in fields[7].lower():
+            left, top, width, height = (int(value) for value in fields[2:6])
+            return {'left': left, 'top': top, 'width': width, 'height': height}
+    return None
+
+class CaptureTarget:
+    """What to capture: the whole virtual desktop, one monitor, a fixed rectangle or a window
+
+    Parsed from 'screen', 'monitor:N' (1 is the first monitor), 'region:X,Y,W,H' or
+    'window:TITLE'. resolve() returns the area to grab, clipped to the desktop, so only
+    that area is ever grabbed and resized. Window areas are looked up again at most every
+    refresh_interval seconds, so a moved window is followed without a lookup per frame.
+    """
+    KINDS = ['screen', 'monitor', 'region', 'window']
+
+    def __init__(self, kind='screen', value=None, refresh_interval=1.0):
+        self.kind = kind
+        self.value = value
+        self.refresh_interval = refresh_interval
+        self.cached_area = None
+        self.resolved_at = None
+
+    @classmethod
+    def parse(cls, spec):
+        """Parse a target spec; raises ValueError if it is malformed"""
+        kind, _, value = (spec or 'screen').partition(':')
+        kind = kind.strip().lower()
+        if kind not in cls.KINDS:
+            raise ValueError("Invalid capture target. Must be one of: screen, monitor:N, region:X,Y,W,H, window:TITLE")
+        if kind == 'screen':
+            return cls()
+        if kind == 'monitor':
+            try:
+                number = int(value)
+            except ValueError:
+                number = 0
+            if number < 1:
+                raise ValueError("Invalid monitor. Use monitor:N with N starting at 1")
+            return cls(kind, number)
+        if kind == 'region':
+            try:
+                left, top, width, height = (int(part) for part in value.split(','))
+            except ValueError:
+                raise ValueError("Invalid region. Use region:X,Y,WIDTH,HEIGHT in pixels")
+            if width <= 0 or height <= 0:
+                raise ValueError("Invalid region. Width and height must be greater than 0")
+            return cls(kind, {'left': left, 'top': top, 'width': width, 'height': height})
+        if not value.strip():
+            raise ValueError("Invalid window. Use window:TITLE")
+        return cls(kind, value.strip())
+
+    def __str__(self):
+        if self.kind == 'screen':
+            return 'screen'
+        if self.kind == 'region':
+            return f"region:{self.value['left']},{self.value['top']},{self.value['width']},{self.value['height']}"
+        return f"{self.kind}:{self.value}"
+
+    def resolve(self, grabber):
+        """Return the area to grab with grabber, or None for the whole virtual desktop"""
+        if self.kind == 'screen':
+            return None
+        now = time.monotonic()
+        if self.cached_area is not None and (self.kind != 'window' or now - self.resolved_at < self.refresh_interval):
+            return self.cached_area
+
+        monitors = grabber.monitors()
+        if self.kind == 'monitor':
+            if self.value >= len(monitors):
+                raise RuntimeError(f"Monitor {self.value} not found ({len(monitors) - 1} connected)")
+            area = monitors[self.value]
+        elif self.kind == 'region':
+            area = self.value
+        else:
+            lookup = getattr(grabber, 'find_window', find_window)
+            area = lookup(self.value)
+            if area is None:
+                raise RuntimeError(f"No window titled '{self.value}' found")
+
+        # Grabbing outside the desktop fails on most platforms, so keep to the part that is on screen
+        desktop = monitors[0]
+        left = max(area['left'], desktop['left'])
+        top = max(area['top'], desktop['top'])
+        right = min(area['left'] + area['width'], desktop['left'] + desktop['width'])
+        bottom = min(area['top'] + area['height'], desktop['top'] + desktop['height'])
+        if right <= left or bottom <= top:
+            raise RuntimeError(f"Capture target {self} is off screen")
+        self.cached_area = {'left': left, 'top': top, 'width': right - left, 'height': bottom - top}
+        self.resolved_at = now
+        return self.cached_area
+
+GRABBER_BACKENDS = {
+    'mss': MSSGrabber,
+    'pyautogui': PyAutoGUIGrabber,
+    'synthetic': SyntheticGrabber
+}
+
+def create_grabber(backend='auto'):
+    """Create a grabber by name; 'auto' prefers mss and falls back to pyautogui"""
+    if backend == 'auto':
+        try:
+            return MSSGrabber()
+        except ImportError:
+            return PyAutoGUIGrabber()
+    if backend not in GRABBER_BACKENDS:
+        raise ValueError(f"Invalid capture backend: {backend}")
+    return GRABBER_BACKENDS[backend]()
+
+def clear_outside(canvas, roi):
+    """Zero the parts of a canvas outside roi (the letterbox bars), leaving the rest as it is"""
+    rows, columns = roi
+    canvas[:rows.start] = 0
+    canvas[rows.stop:] = 0
+    canvas[rows, :columns.start] = 0
+    canvas[rows, columns.stop:] = 0
+
+class CaptureEngine:
+    """Grab frames and scale them to a quality setting in reusable buffers
+
+    The resize and colour conversion write straight into preallocated buffers, so a
+    steady-state capture allocates nothing at the target resolution. The array
+    returned by capture() is reused by the next call for the same quality. target is
+    the CaptureTarget grabbed when capture() isn't given one (the whole desktop by default).
+    fit and interpolation are the defaults for FIT_MODES and INTERPOLATIONS. With metrics
+    (a metrics.Metrics), the grab and resize time of every capture() is recorded.
+    """
+
+    def __init__(self, backend='auto', grabber=None, target=None, fit='letterbox', interpolation='area', metrics=None):
+        self.grabber = grabber if grabber is not None else create_grabber(backend)
+        self.target = target or CaptureTarget()
+        self.fit = fit
+        self.interpolation = interpolation
+        self.metrics = metrics
+        self.buffers = {}
+
+    @property
+    def backend(self):
+        return self.grabber.name
+
+    def _buffers_for(self, quality, fit, source_shape):
+        """Return (canvas, resized, roi) for a quality setting, reallocating only if the source size changed"""
+        cached = self.buffers.get((quality, fit))
+        if cached is not None and cached[0] == source_shape:
+            return cached[1:]
+
+        original_height, original_width, channels = source_shape
+        (canvas_width, canvas_height), (new_width, new_height) = output_size(
+            quality, original_width, original_height, fit)
+
+        # Centred region of the canvas that the resized frame occupies; in letterbox mode the rest stays black
+        x_offset = (canvas_width - new_width) // 2
+        y_offset = (canvas_height - new_height) // 2
+        roi = (slice(y_offset, y_offset + new_height), slice(x_offset, x_offset + new_width))
+
+        # Resize in the grabber's own channel layout, then convert the (smaller) result into the canvas
+        canvas = np.zeros((canvas_height, canvas_width, 3), dtype=np.uint8)
+        resized = np.empty((new_height, new_width, channels), dtype=np.uint8)
+
+        self.buffers[(quality, fit)] = (source_shape, canvas, resized, roi)
+        return canvas, resized, roi
+
+    def new_canvas(self, quality, fit=None):
+        """Allocate a black canvas for a quality setting, e.g. for callers that keep their own buffer pool
+
+        Sizes that follow the captured area (fit mode, native, percentages) aren't known before
+        a grab, so those get an empty placeholder that capture() replaces.
+        """
+        kind, value = parse_quality(quality)
+        if kind == 'box' and (fit or self.fit) == 'letterbox':
+            target_width, target_height = value
+            return np.zeros((target_height, target_width, 3), dtype=np.uint8)
+        return np.zeros((0, 0, 3), dtype=np.uint8)
+
+    def capture(self, quality='720p', out=None, target=None, fit=None, interpolation=None):
+        """Grab a frame of the target and return it scaled to the quality setting as a BGR array
+
+        Pass out (from new_canvas) to fill a caller-owned buffer instead of the engine's own
+        canvas; if out is the wrong size (the captured area changed size, or it is a placeholder)
+        a new buffer is returned in its place, so always use the returned array.
+        """
+        parse_quality(quality)
+        region = (target or self.target).resolve(self.grabber)
+        started = time.perf_counter()
+        frame = self.grabber.grab(region)
+        grabbed = time.perf_counter()
+        canvas = self.process(frame, quality, out=out, fit=fit, interpolation=interpolation)
+        if self.metrics is not None:
+            self.metrics.observe('snip_stage_seconds', grabbed - started, stage='grab')
+            self.metrics.observe('snip_stage_seconds', time.perf_counter() - grabbed, stage='resize')
+        return canvas
+
+    def process(self, frame, quality='720p', out=None, fit=None, interpolation=None):
+        """Scale an already grabbed frame (in the grabber's channel order) to the quality setting"""
+        fit = fit or self.fit
+        canvas, resized, roi = self._buffers_for(quality, fit, frame.shape)
+        if out is not None:
+            if out.shape == canvas.shape:
+                # A reused buffer may hold a frame letterboxed differently, so its bars are cleared
+                canvas = out
+                clear_outside(canvas, roi)
+            else:
+                canvas = np.zeros_like(canvas)
+        conversion = TO_BGR[self.grabber.channels]
+        if conversion is not None:
+            conversion = getattr(cv2, conversion)
+        full_canvas = resized.shape[:2] == canvas.shape[:2]
+        if conversion is None and full_canvas:
+            # Nothing to convert and no padding: scale straight into the output
+            resized = canvas
+
+        if resized.shape[:2] == frame.shape[:2]:
+            # Source already matches the target, skip the resize
+            if resized is canvas:
+                np.copyto(canvas, frame)
+                return canvas
+            resized = frame
+        else:
+            interpolation = getattr(cv2, INTERPOLATIONS[interpolation or self.interpolation])
+            cv2.resize(frame, (resized.shape[1], resized.shape[0]), dst=resized, interpolation=interpolation)
+            if resized is canvas:
+                return canvas
+
+        if conversion is None:
+            canvas[roi] = resized
+        elif full_canvas:
+            cv2.cvtColor(resized, conversion, dst=canvas)
+        else:
+            cv2.cvtColor(resized, conversion, dst=canvas[roi])
+        return canvas
+
+    def close(self):
+        self.grabber.close()
+        self.buffers.clear()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+import itertools
+import json
+import queue
+import threading
+import time
+
+class Subscription:
+    """One listener's queue of events; closed if the listener falls too far behind"""
+
+    def __init__(self, queue_size):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.closed = False
+
+    def get(self, timeout=None):
+        """Return the next event, or None if none arrived within timeout seconds"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class EventBus:
+    """Fan out capture and PDF events to every subscriber (one per /events stream)
+
+    Events are dicts with an increasing 'id', a 'type', the 'session_id' they concern (or
+    None), a 'time' and the event's own fields. publish() never blocks the capture: a
+    subscriber whose queue is full is closed instead, and its client reconnects and starts
+    again from a fresh snapshot.
+    """
+
+    def __init__(self, queue_size=1024):
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.subscriptions = set()
+        self.ids = itertools.count(1)
+
+    def subscribe(self):
+        subscription = Subscription(self.queue_size)
+        with self.lock:
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def publish(self, event_type, session_id=None, **data):
+        event = dict(data, id=next(self.ids), type=event_type, session_id=session_id, time=round(time.time(), 3))
+        with self.lock:
+            for subscription in list(self.subscriptions):
+                try:
+                    subscription.queue.put_nowait(event)
+                except queue.Full:
+                    subscription.closed = True
+                    self.subscriptions.discard(subscription)
+        return event
+
+def format_sse(event):
+    """Encode an event as a server-sent events message"""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
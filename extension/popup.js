@@ -12,9 +12,17 @@ document.addEventListener('DOMContentLoaded', function() {
   const newFolderName = document.getElementById('newFolderName');
   
   let selectedDirectory = '';
+  // The capture session this popup controls (the server can run several at once)
+  let currentSessionId = null;
+  // The PDF job started by our last stop, and jobs that finished before we learned their ID
+  let currentJobId = null;
+  const finishedJobs = {};
+  // Frames of the current session the server did not keep
+  let skippedFrames = 0;
+  let droppedFrames = 0;
   
-  // Check the status when popup opens
-  checkStatus();
+  // Follow the server's session events from when the popup opens
+  subscribeEvents();
   
   startButton.addEventListener('click', function() {
     // Get form values
@@ -35,7 +43,8 @@ document.addEventListener('DOMContentLoaded', function() {
     const url = 'http://localhost:5000/start_capture';
     const params = {
       quality: quality,
-      rate: rate,
+      rate: parseFloat(rate),
+      high_frequency: parseFloat(rate) < 1,
       duration: duration,
       output: output,
       name: name || null
@@ -57,6 +66,7 @@ document.addEventListener('DOMContentLoaded', function() {
     .then(response => response.json())
     .then(data => {
       if (data.success) {
+        followSession(data.session_id);
         statusMsg.textContent = 'Screenshot capture started successfully!';
         statusMsg.className = 'status success';
         updateButtonVisibility(true);
@@ -85,6 +95,7 @@ document.addEventListener('DOMContentLoaded', function() {
         'Content-Type': 'application/json',
       },
       body: JSON.stringify({
+        session_id: currentSessionId,
         output: output,
         name: name || null
       }),
@@ -92,12 +103,21 @@ document.addEventListener('DOMContentLoaded', function() {
     .then(response => response.json())
     .then(data => {
       if (data.success) {
-        statusMsg.textContent = 'Capture stopped and PDF saved successfully.';
-        statusMsg.className = 'status success';
+        currentSessionId = null;
         updateButtonVisibility(false);
+        if (data.job_id) {
+          // The PDF is built in the background; its progress arrives as pdf_progress events
+          currentJobId = data.job_id;
+          statusMsg.textContent = 'Capture stopped. Saving PDF...';
+          if (finishedJobs[data.job_id]) {
+            showPdfJob(finishedJobs[data.job_id]);
+          }
+        } else {
+          statusMsg.textContent = 'Capture stopped and PDF saved successfully.';
+          statusMsg.className = 'status success';
+        }
       } else {
         showError(data.message || 'Failed to stop capture');
-        checkStatus(); // Double-check status
       }
     })
     .catch(error => {
@@ -124,7 +144,7 @@ document.addEventListener('DOMContentLoaded', function() {
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({ quality: quality }),
+      body: JSON.stringify({ session_id: currentSessionId, quality: quality }),
     })
     .then(response => response.json())
     .then(data => {
@@ -253,24 +273,184 @@ document.addEventListener('DOMContentLoaded', function() {
     });
   });
   
-  function checkStatus() {
-    fetch('http://localhost:5000/status', {
-      method: 'GET',
-    })
-    .then(response => response.json())
-    .then(data => {
+  function subscribeEvents() {
+    // The server pushes session and PDF job events; EventSource reconnects by itself and
+    // every connection starts with a snapshot of the running captures
+    const source = new EventSource('http://localhost:5000/events');
+    let connectionLost = false;
+    
+    source.addEventListener('snapshot', event => {
+      const data = JSON.parse(event.data);
+      if (connectionLost) {
+        connectionLost = false;
+        statusMsg.style.display = 'none';
+      }
       if (data.status === 'active') {
+        // Keep controlling our session if it is still running, otherwise pick up the oldest one
+        const sessionIds = data.sessions.map(session => session.session_id);
+        if (!sessionIds.includes(currentSessionId)) {
+          followSession(sessionIds[0]);
+        }
         updateButtonVisibility(true);
-        statusMsg.textContent = 'A screenshot capture is currently running.';
+        statusMsg.textContent = sessionIds.length > 1
+          ? `${sessionIds.length} screenshot captures are currently running.`
+          : 'A screenshot capture is currently running.';
         statusMsg.className = 'status success';
         statusMsg.style.display = 'block';
       } else {
+        currentSessionId = null;
         updateButtonVisibility(false);
       }
-    })
-    .catch(error => {
-      console.error('Error checking status:', error);
+      // The PDF we are waiting for may have progressed or finished while we were disconnected
+      data.pdf_jobs.forEach(job => {
+        if (job.status !== 'running') {
+          finishedJobs[job.job_id] = job;
+        }
+        if (job.job_id === currentJobId) {
+          showPdfJob(job);
+        }
+      });
     });
+    
+    source.addEventListener('session_started', event => {
+      const data = JSON.parse(event.data);
+      if (currentSessionId === null) {
+        followSession(data.session_id);
+        updateButtonVisibility(true);
+      }
+    });
+    
+    source.addEventListener('frame_captured', event => {
+      const data = JSON.parse(event.data);
+      if (data.session_id === currentSessionId && !data.manual) {
+        showCaptureProgress(`${data.pages} screenshots captured`);
+      }
+    });
+    
+    source.addEventListener('frame_skipped', event => {
+      const data = JSON.parse(event.data);
+      if (data.session_id === currentSessionId) {
+        skippedFrames++;
+        showCaptureProgress(`screenshot ${data.shot}/${data.screenshots} skipped (no change)`);
+      }
+    });
+    
+    source.addEventListener('frame_dropped', event => {
+      const data = JSON.parse(event.data);
+      if (data.session_id === currentSessionId) {
+        droppedFrames++;
+        showCaptureProgress(`screenshot ${data.shot}/${data.screenshots} dropped (encoder busy)`);
+      }
+    });
+    
+    source.addEventListener('schedule_changed', event => {
+      const data = JSON.parse(event.data);
+      if (data.session_id === currentSessionId) {
+        const direction = data.action === 'speed_up' ? 'screen busy' : 'screen idle';
+        showCaptureProgress(`${direction}, now every ${data.interval} seconds`);
+      }
+    });
+    
+    source.addEventListener('capture_error', event => {
+      const data = JSON.parse(event.data);
+      if (data.session_id === currentSessionId) {
+        showError(data.message);
+      }
+    });
+    
+    source.addEventListener('budget_reached', event => {
+      const data = JSON.parse(event.data);
+      if (data.session_id !== currentSessionId) {
+        return;
+      }
+      if (data.policy === 'rollover') {
+        showCaptureProgress(`budget reached, PDF part saved to ${data.pdf_path}`);
+      } else if (data.policy === 'thin') {
+        showCaptureProgress(`budget reached, kept every other screenshot (${data.frames_kept})`);
+      } else {
+        showCaptureProgress(`budget reached (${data.reason}), stopping`);
+      }
+    });
+    
+    source.addEventListener('session_finished', event => {
+      const data = JSON.parse(event.data);
+      if (data.session_id !== currentSessionId) {
+        return;
+      }
+      // The capture ended on its own (its duration ran out); it wrote its own PDF
+      currentSessionId = null;
+      updateButtonVisibility(false);
+      if (data.pdf_path) {
+        statusMsg.textContent = `Capture finished and PDF saved to ${data.pdf_path}`;
+        statusMsg.className = 'status success';
+        statusMsg.style.display = 'block';
+      } else {
+        showError('Capture finished without creating a PDF');
+      }
+    });
+    
+    source.addEventListener('pdf_progress', event => {
+      const data = JSON.parse(event.data);
+      if (data.job_id === currentJobId) {
+        showPdfJob(data);
+      }
+    });
+    
+    source.addEventListener('pdf_finished', event => {
+      const data = JSON.parse(event.data);
+      finishedJobs[data.job_id] = data;
+      if (data.job_id === currentJobId) {
+        showPdfJob(data);
+      }
+    });
+    
+    source.onerror = function() {
+      if (source.readyState !== EventSource.OPEN) {
+        connectionLost = true;
+        showError('Cannot connect to local server. Make sure the Python server is running.');
+      }
+    };
+  }
+  
+  function followSession(sessionId) {
+    if (sessionId !== currentSessionId) {
+      currentSessionId = sessionId;
+      skippedFrames = 0;
+      droppedFrames = 0;
+    }
+  }
+  
+  function showCaptureProgress(text) {
+    const counts = [];
+    if (skippedFrames) {
+      counts.push(`${skippedFrames} skipped`);
+    }
+    if (droppedFrames) {
+      counts.push(`${droppedFrames} dropped`);
+    }
+    statusMsg.textContent = `Capturing: ${text}` + (counts.length ? ` (${counts.join(', ')} so far)` : '');
+    statusMsg.className = 'status success';
+    statusMsg.style.display = 'block';
+  }
+  
+  function showPdfJob(job) {
+    if (job.status === 'running') {
+      let text = `Saving PDF: ${job.pages_done}/${job.pages_total} pages`;
+      if (job.eta_seconds !== null) {
+        text += ` (about ${Math.ceil(job.eta_seconds)}s left)`;
+      }
+      statusMsg.textContent = text;
+      statusMsg.className = 'status';
+      statusMsg.style.display = 'block';
+    } else if (job.status === 'done') {
+      currentJobId = null;
+      statusMsg.textContent = `Capture stopped and PDF saved to ${job.pdf_path}`;
+      statusMsg.className = 'status success';
+      statusMsg.style.display = 'block';
+    } else {
+      currentJobId = null;
+      showError(job.message || 'Failed to create PDF');
+    }
   }
   
   function updateButtonVisibility(isCapturing) {
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+import io
+import mmap
+import os
+import struct
+import threading
+from datetime import datetime
+
+# Every record in frames.spool is this header followed by the encoded image:
+# magic, frame ID, payload length, capture time (epoch seconds), width, height, quality, format
+RECORD_MAGIC = b'FRM1'
+RECORD_HEADER = struct.Struct('<4sQIdII16s8s')
+# frames.idx repeats the header fields plus the payload offset, one fixed-size entry per frame,
+# so the index loads without touching the frame data
+INDEX_ENTRY = struct.Struct('<QQIdII16s8s')
+
+class FrameSpool:
+    """Append-only container of encoded frames (frames.spool) with an index of offsets (frames.idx)
+
+    Frames get monotonic integer IDs in the order they are appended. Entries are dicts with
+    'id', 'offset', 'length', 'width', 'height', 'captured_at' (ISO format), 'quality' and
+    'format'. read() returns a zero-copy view of a frame
+    through a memory map of the spool, so consumers never open one file per frame.
+    """
+    DATA_FILENAME = 'frames.spool'
+    INDEX_FILENAME = 'frames.idx'
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.data_path = os.path.join(directory, self.DATA_FILENAME)
+        self.index_path = os.path.join(directory, self.INDEX_FILENAME)
+        self.lock = threading.Lock()
+        self.index = []
+        self.data_file = None
+        self.index_file = None
+        self.map = None
+        self.index_size = 0
+        # Lowest ID for the next frame, so IDs keep increasing after compact() empties the spool
+        self.min_next_id = 1
+        self.refresh()
+
+    @property
+    def next_id(self):
+        return max(self.index[-1]['id'] + 1, self.min_next_id) if self.index else self.min_next_id
+
+    def __len__(self):
+        return len(self.index)
+
+    def entries(self):
+        """Return the index entries in frame ID order"""
+        with self.lock:
+            return list(self.index)
+
+    def refresh(self):
+        """Pick up frames appended since the index was last read (by this or another process)"""
+        with self.lock:
+            if not os.path.exists(self.index_path):
+                return
+            with open(self.index_path, 'rb') as f:
+                f.seek(self.index_size)
+                data = f.read()
+            # A crash can leave a partial last entry
+            whole = len(data) - len(data) % INDEX_ENTRY.size
+            first_load = self.index_size == 0
+            for fields in INDEX_ENTRY.iter_unpack(data[:whole]):
+                self.index.append(self._entry(*fields))
+            self.index_size += whole
+            if first_load and self.index and not self._record_matches(self.index[-1]):
+                self._rebuild_index()
+
+    def _record_matches(self, entry):
+        """Return whether the data file holds entry's record where the index says"""
+        try:
+            with open(self.data_path, 'rb') as f:
+                f.seek(entry['offset'] - RECORD_HEADER.size)
+                header = f.read(RECORD_HEADER.size)
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+        except OSError:
+            return False
+        if len(header) < RECORD_HEADER.size or size < entry['offset'] + entry['length']:
+            return False
+        magic, frame_id, length = RECORD_HEADER.unpack(header)[:3]
+        return magic == RECORD_MAGIC and frame_id == entry['id'] and length == entry['length']
+
+    def _rebuild_index(self):
+        """Recreate the index from the record headers in the data file
+
+        Needed when a crash during compact() left the old index next to the new data.
+        """
+        index = []
+        with open(self.data_path, 'rb') as f:
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                magic, frame_id, length, timestamp, width, height, quality, image_format = RECORD_HEADER.unpack(header)
+                offset = f.tell()
+                if magic != RECORD_MAGIC or len(f.read(length)) < length:
+                    break
+                index.append((frame_id, offset, length, timestamp, width, height, quality, image_format))
+        with open(self.index_path, 'wb') as f:
+            for fields in index:
+                f.write(INDEX_ENTRY.pack(*fields))
+        self.index = [self._entry(*fields) for fields in index]
+        self.index_size = len(index) * INDEX_ENTRY.size
+
+    def disk_bytes(self):
+        """Return the size of the spool's files"""
+        with self.lock:
+            data_end = self.index[-1]['offset'] + self.index[-1]['length'] if self.index else 0
+            return data_end + self.index_size
+
+    def compact(self, keep):
+        """Rewrite the spool with only the entries in keep, which keep their IDs; returns the new entries
+
+        Frame offsets change, so entries and views read before compacting must not be used
+        afterwards. Not safe while another thread appends.
+        """
+        keep_ids = {entry['id'] for entry in keep}
+        with self.lock:
+            next_id = self.index[-1]['id'] + 1 if self.index else self.min_next_id
+            kept = [entry for entry in self.index if entry['id'] in keep_ids]
+            data_temp = self.data_path + '.tmp'
+            index_temp = self.index_path + '.tmp'
+            index = []
+            with open(self.data_path, 'rb') as source, open(data_temp, 'wb') as data_file, \
+                    open(index_temp, 'wb') as index_file:
+                for entry in kept:
+                    # Copy the record header along with the frame
+                    source.seek(entry['offset'] - RECORD_HEADER.size)
+                    record = source.read(RECORD_HEADER.size + entry['length'])
+                    offset = data_file.tell() + RECORD_HEADER.size
+                    data_file.write(record)
+                    fields = (entry['id'], offset) + RECORD_HEADER.unpack_from(record)[2:]
+                    index_file.write(INDEX_ENTRY.pack(*fields))
+                    index.append(self._entry(*fields))
+                data_file.flush()
+                os.fsync(data_file.fileno())
+                index_file.flush()
+                os.fsync(index_file.fileno())
+            for f in (self.data_file, self.index_file):
+                if f is not None:
+                    f.close()
+            self.data_file = self.index_file = None
+            self.map = None
+            # If a crash leaves the old index next to the new data, refresh() rebuilds the index
+            os.replace(data_temp, self.data_path)
+            os.replace(index_temp, self.index_path)
+            self.index = index
+            self.index_size = len(index) * INDEX_ENTRY.size
+            self.min_next_id = next_id
+            return list(index)
+
+    @staticmethod
+    def _entry(frame_id, offset, length, captured_at, width, height, quality, image_format):
+        return {
+            'id': frame_id,
+            'offset': offset,
+            'length': length,
+            'width': width,
+            'height': height,
+            'captured_at': datetime.fromtimestamp(captured_at).isoformat(timespec='milliseconds'),
+            'quality': quality.rstrip(b'\0').decode('ascii'),
+            'format': image_format.rstrip(b'\0').decode('ascii')
+        }
+
+    def append(self, data, width, height, captured_at, quality, image_format):
+        """Append one encoded frame and return its index entry
+
+        The frame is flushed before its index entry is written, so the index never points
+        past the end of the data.
+        """
+        payload = memoryview(data).cast('B')
+        with self.lock:
+            if self.data_file is None:
+                self.data_file = open(self.data_path, 'ab')
+                self.index_file = open(self.index_path, 'ab')
+                # Drop anything a crash left past the last indexed frame before appending to a reopened spool
+                data_end = self.index[-1]['offset'] + self.index[-1]['length'] if self.index else 0
+                if self.data_file.tell() > data_end:
+                    self.data_file.truncate(data_end)
+                    self.data_file.seek(0, os.SEEK_END)
+                if self.index_file.tell() > self.index_size:
+                    self.index_file.truncate(self.index_size)
+                    self.index_file.seek(0, os.SEEK_END)
+            frame_id = self.next_id
+            timestamp = captured_at.timestamp()
+            quality_bytes = quality.encode('ascii')
+            format_bytes = image_format.encode('ascii')
+
+            offset = self.data_file.tell() + RECORD_HEADER.size
+            self.data_file.write(RECORD_HEADER.pack(RECORD_MAGIC, frame_id, len(payload), timestamp,
+                                                    width, height, quality_bytes, format_bytes))
+            self.data_file.write(payload)
+            self.data_file.flush()
+
+            fields = (frame_id, offset, len(payload), timestamp, width, height, quality_bytes, format_bytes)
+            self.index_file.write(INDEX_ENTRY.pack(*fields))
+            self.index_file.flush()
+            self.index_size += INDEX_ENTRY.size
+
+            entry = self._entry(*fields)
+            self.index.append(entry)
+            return entry
+
+    def read(self, entry):
+        """Return a read-only memoryview of a frame's encoded bytes"""
+        end = entry['offset'] + entry['length']
+        with self.lock:
+            if self.map is None or len(self.map) < end:
+                # The spool has grown since it was mapped; views of the old map stay valid
+                with open(self.data_path, 'rb') as f:
+                    self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return memoryview(self.map)[entry['offset']:end]
+
+    def frame_name(self, entry):
+        """Return a name for a frame that is unique across spools, for caches keyed by name"""
+        return f"{self.data_path}#{entry['id']}"
+
+    def open_frame(self, entry):
+        """Return a file-like object over a frame, for libraries that want a stream"""
+        return FrameStream(self.read(entry), self.frame_name(entry))
+
+    def close(self):
+        with self.lock:
+            for f in (self.data_file, self.index_file):
+                if f is not None:
+                    f.close()
+            self.data_file = self.index_file = None
+            # The map closes once every view handed out by read() has been released
+            self.map = None
+
+class FrameStream(io.RawIOBase):
+    """Seekable read-only stream over a frame's bytes, without copying them
+
+    str() gives the frame's name, which FPDF uses as the image cache key for streams.
+    """
+
+    def __init__(self, view, frame_name):
+        super().__init__()
+        self.view = view
+        self.frame_name = frame_name
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = max(0, min(len(buffer), len(self.view) - self.pos))
+        buffer[:count] = self.view[self.pos:self.pos + count]
+        self.pos += count
+        return count
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += len(self.view)
+        self.pos = max(0, offset)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def __str__(self):
+        return self.frame_name
+
+def read_spooled_frame(data_path, offset, length):
+    """Read one frame's bytes straight from a spool file (for worker processes)"""
+    with open(data_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return mapped[offset:offset + length]
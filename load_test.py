@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from benchmark import summarize
+
+# Endpoints in the order they are reported
+ENDPOINTS = ['status', 'manual_screenshot', 'start_capture', 'stop_capture', 'events']
+
+class Recorder:
+    """Latencies and outcomes of every request, per endpoint, shared by the client threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {endpoint: [] for endpoint in ENDPOINTS}
+        # Transport failures and non-200 responses
+        self.errors = {endpoint: 0 for endpoint in ENDPOINTS}
+        # 200 responses with success false, e.g. a busy capture worker or the session limit
+        self.failures = {endpoint: 0 for endpoint in ENDPOINTS}
+        self.messages = {}
+
+    def record(self, endpoint, seconds, error=None, failure=None):
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            if error is not None:
+                self.errors[endpoint] += 1
+            elif failure is not None:
+                self.failures[endpoint] += 1
+            # Keep a count of each distinct problem for the report
+            problem = error or failure
+            if problem is not None:
+                key = f"{endpoint}: {problem}"
+                self.messages[key] = self.messages.get(key, 0) + 1
+
+def call(base_url, method, path, body=None, timeout=60):
+    """Make one request and return (status, JSON body or None); raises on transport errors"""
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(base_url + path, data=data, method=method,
+                                     headers={'Content-Type': 'application/json'} if data else {})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, json.loads(response.read() or b'null')
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+def timed_call(recorder, endpoint, base_url, method, path, body=None, timeout=60):
+    """Make a request, record its latency and outcome, and return its JSON body (None on error)"""
+    started = time.perf_counter()
+    try:
+        status, payload = call(base_url, method, path, body, timeout)
+    except Exception as e:
+        recorder.record(endpoint, time.perf_counter() - started, error=type(e).__name__)
+        return None
+    elapsed = time.perf_counter() - started
+    if status != 200:
+        recorder.record(endpoint, elapsed, error=f"HTTP {status}")
+        return None
+    if isinstance(payload, dict) and payload.get('success') is False:
+        recorder.record(endpoint, elapsed, failure=payload.get('message', 'success false'))
+    else:
+        recorder.record(endpoint, elapsed)
+    return payload
+
+def capture_settings(args, output, duration):
+    return {'backend': args.backend, 'quality': args.quality, 'rate': args.rate, 'duration': duration,
+            'output': output}
+
+def status_client(args, recorder, deadline):
+    while time.monotonic() < deadline:
+        timed_call(recorder, 'status', args.url, 'GET', '/status', timeout=args.timeout)
+
+def manual_client(args, recorder, deadline, session_id):
+    while time.monotonic() < deadline:
+        timed_call(recorder, 'manual_screenshot', args.url, 'POST', '/manual_screenshot',
+                   {'session_id': session_id, 'quality': args.quality}, timeout=args.timeout)
+
+def cycle_client(args, recorder, deadline, output, started_sessions, jobs):
+    # Start a capture, add a manual screenshot so stopping it builds a PDF, and stop it
+    while time.monotonic() < deadline:
+        started = timed_call(recorder, 'start_capture', args.url, 'POST', '/start_capture',
+                             capture_settings(args, output, 600), timeout=args.timeout)
+        if not started or not started.get('success'):
+            time.sleep(0.1)
+            continue
+        session_id = started['session_id']
+        started_sessions.append(session_id)
+        timed_call(recorder, 'manual_screenshot', args.url, 'POST', '/manual_screenshot',
+                   {'session_id': session_id, 'quality': args.quality}, timeout=args.timeout)
+        time.sleep(args.cycle_pause)
+        stopped = timed_call(recorder, 'stop_capture', args.url, 'POST', '/stop_capture',
+                             {'session_id': session_id, 'output': output}, timeout=args.timeout)
+        if stopped and stopped.get('job_id'):
+            jobs.append(stopped['job_id'])
+
+def events_client(args, recorder, deadline):
+    # Hold an event stream open like a popup does; the latency is the time to the first event
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(args.url + '/events', timeout=args.timeout) as response:
+                first = response.readline()
+                if not first.startswith(b'retry:'):
+                    recorder.record('events', time.perf_counter() - started)
+                    while time.monotonic() < deadline and response.readline():
+                        pass
+                    continue
+                # Turned away: reconnect after the delay the server asks for, as EventSource does
+                recorder.record('events', time.perf_counter() - started, failure='turned away')
+                time.sleep(min(int(first.split(b':')[1]) / 1000, max(0, deadline - time.monotonic())))
+        except Exception as e:
+            recorder.record('events', time.perf_counter() - started, error=type(e).__name__)
+            time.sleep(0.5)
+
+def wait_for_server(url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            call(url, 'GET', '/status', timeout=2)
+            return True
+        except Exception:
+            time.sleep(0.2)
+    return False
+
+def spawn_server(mode, port):
+    """Start server.py in a serving mode on port and return the process"""
+    env = dict(os.environ, SERVER_MODE=mode, PORT=str(port), SWEEP_ORPHANED_SESSIONS='0')
+    server_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+    return subprocess.Popen([sys.executable, server_path], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def wait_for_jobs(args, started_sessions, jobs, timeout=120):
+    """Wait until the capture sessions and PDF jobs started by the test have finished"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            running = [job_id for job_id in jobs
+                       if (call(args.url, 'GET', f'/pdf_job/{job_id}')[1] or {}).get('status') == 'running']
+            live = {session['session_id'] for session in call(args.url, 'GET', '/status')[1]['sessions']}
+        except Exception:
+            return
+        if not running and not live.intersection(started_sessions):
+            return
+        time.sleep(0.5)
+
+def print_report(results):
+    print(f"\n{results['mode'] or 'server'} at {results['url']}, {results['duration']:g} seconds, "
+          f"clients: {results['clients']}")
+    print(f"  {'endpoint':<18} {'requests':>8} {'req/s':>7} {'errors':>7} {'failed':>7} {'mean ms':>9} "
+          f"{'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for endpoint, stats in results['endpoints'].items():
+        print(f"  {endpoint:<18} {stats['count']:>8} {stats['requests_per_second']:>7.1f} "
+              f"{stats['error_rate'] * 100:>6.1f}% {stats['failure_rate'] * 100:>6.1f}% {stats['mean_ms']:>9.1f} "
+              f"{stats['p50_ms']:>9.1f} {stats['p90_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['max_ms']:>9.1f}")
+    if results['problems']:
+        print("  Problems:")
+        for message, count in sorted(results['problems'].items(), key=lambda item: -item[1]):
+            print(f"    {count:>6} x {message}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test a running server: /status, manual screenshots and '
+                                                 'start/stop cycles, with latency percentiles and error rates')
+    parser.add_argument('--url', type=str, default='http://localhost:5000',
+                        help='Server to test (default: http://localhost:5000)')
+    parser.add_argument('--spawn', type=str, default=None, choices=['development', 'production'],
+                        help='Start server.py in this serving mode on --port for the test, and stop it afterwards')
+    parser.add_argument('--port', type=int, default=5055,
+                        help='Port of a server started with --spawn (default: 5055)')
+    parser.add_argument('-d', '--duration', type=float, default=30,
+                        help='Seconds to generate load for (default: 30)')
+    parser.add_argument('--status-clients', type=int, default=8,
+                        help='Threads polling /status back to back (default: 8)')
+    parser.add_argument('--manual-clients', type=int, default=2,
+                        help='Threads taking manual screenshots into one running capture (default: 2)')
+    parser.add_argument('--cycle-clients', type=int, default=1,
+                        help='Threads starting a capture, taking a manual screenshot and stopping it (default: 1)')
+    parser.add_argument('--event-clients', type=int, default=2,
+                        help='Event streams held open, like open popups (default: 2)')
+    parser.add_argument('--cycle-pause', type=float, default=0.5,
+                        help='Seconds a cycle lets its capture run before stopping it (default: 0.5)')
+    parser.add_argument('--backend', type=str, default='synthetic',
+                        help='Capture backend of the test captures; synthetic needs no display (default: synthetic)')
+    parser.add_argument('-q', '--quality', type=str, default='480p',
+                        help='Quality of the test captures and manual screenshots (default: 480p)')
+    parser.add_argument('-r', '--rate', type=float, default=1,
+                        help='Screenshot interval of the test captures in seconds (default: 1)')
+    parser.add_argument('--timeout', type=float, default=60,
+                        help='Client timeout of each request in seconds (default: 60)')
+    parser.add_argument('-o', '--output', type=str, default=None,
+                        help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    server = None
+    if args.spawn:
+        args.url = f"http://127.0.0.1:{args.port}"
+        print(f"Starting server.py in {args.spawn} mode on port {args.port}...")
+        server = spawn_server(args.spawn, args.port)
+    args.url = args.url.rstrip('/')
+    if not wait_for_server(args.url, 30 if server else 5):
+        print(f"Error: No server answering at {args.url}")
+        if server is not None:
+            server.kill()
+        return 1
+
+    # Captures and PDFs of the test go to a scratch directory
+    output = tempfile.mkdtemp(prefix='snip_load_')
+    recorder = Recorder()
+    started_sessions = []
+    jobs = []
+    try:
+        # One long capture receives the manual screenshots of the manual clients
+        anchor = call(args.url, 'POST', '/start_capture', capture_settings(args, output, 3600))[1]
+        if not anchor or not anchor.get('success'):
+            print(f"Error: Cannot start a capture for the test: {anchor.get('message') if anchor else 'no response'}")
+            return 1
+        started_sessions.append(anchor['session_id'])
+        print(f"Generating load for {args.duration:g} seconds...")
+        deadline = time.monotonic() + args.duration
+        threads = [threading.Thread(target=status_client, args=(args, recorder, deadline))
+                   for _ in range(args.status_clients)]
+        threads += [threading.Thread(target=manual_client, args=(args, recorder, deadline, anchor['session_id']))
+                    for _ in range(args.manual_clients)]
+        threads += [threading.Thread(target=cycle_client, args=(args, recorder, deadline, output, started_sessions, jobs))
+                    for _ in range(args.cycle_clients)]
+        threads += [threading.Thread(target=events_client, args=(args, recorder, deadline))
+                    for _ in range(args.event_clients)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        stopped = call(args.url, 'POST', '/stop_capture', {'session_id': anchor['session_id'], 'output': output})[1]
+        if stopped and stopped.get('job_id'):
+            jobs.append(stopped['job_id'])
+        print("Waiting for the test captures and their PDFs to finish...")
+        wait_for_jobs(args, started_sessions, jobs)
+        serving_state = (call(args.url, 'GET', '/status')[1] or {}).get('serving')
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(output, ignore_errors=True)
+
+    results = {
+        'url': args.url,
+        'mode': args.spawn or (serving_state or {}).get('mode'),
+        'duration': round(elapsed, 1),
+        'clients': {'status': args.status_clients, 'manual': args.manual_clients, 'cycle': args.cycle_clients,
+                    'events': args.event_clients},
+        'serving': serving_state,
+        'endpoints': {},
+        'problems': recorder.messages
+    }
+    for endpoint in ENDPOINTS:
+        samples = recorder.latencies[endpoint]
+        if not samples:
+            continue
+        results['endpoints'][endpoint] = dict(summarize(samples),
+                                              requests_per_second=len(samples) / elapsed,
+                                              error_rate=recorder.errors[endpoint] / len(samples),
+                                              failure_rate=recorder.failures[endpoint] / len(samples))
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to: {args.output}")
+    # Transport errors fail the run; refusals (success false) are part of the server's normal behaviour
+    return 1 if any(recorder.errors.values()) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,77 +1,546 @@
 #!/usr/bin/env python3
 import argparse
 import os
+import threading
 import time
-import glob
 from datetime import datetime
 import utils
+import pdf_writer
+import capture_engine
+import pipeline
+import frame_spool
+import session_journal
+import metrics
+import budgets
+import video_export
+import ring_buffer
+import scheduler
+import ocr
+import search_index
+import startup
 
-def main():
+# Options that select a mode rather than describe a capture, left out of session journals
+MODE_OPTIONS = ['recover', 'resume', 'sweep', 'profile_startup', 'ring_buffer', 'search']
+
+def build_parser():
+    """Return the argument parser for a capture; the server builds its sessions with it too"""
     parser = argparse.ArgumentParser(description='Take periodic screenshots using OpenCV and save them to a PDF only')
     parser.add_argument('-q', '--quality', type=str, default='720p',
-                        help='Screenshot quality (480p, 720p, 1080p, 2k, 4k) (default: 720p)')
-    parser.add_argument('-r', '--rate', type=int, default=10, 
-                        help='Screenshot interval in seconds (default: 10)')
+                        help='Screenshot quality: 480p, 720p, 1080p, 2k, 4k, a custom WIDTHxHEIGHT, a percentage '
+                             'of the captured size such as 50%%, or native for no resize (default: 720p)')
+    parser.add_argument('--fit', type=str, default='letterbox',
+                        help='How frames fill a WIDTHxHEIGHT quality: letterbox (pad to exactly that size with black bars) '
+                             'or fit (scale to fit inside, no padding) (default: letterbox)')
+    parser.add_argument('--interpolation', type=str, default=None,
+                        help='Resize interpolation: nearest, linear, area, cubic or lanczos '
+                             '(default: area, or linear with --high-frequency)')
+    parser.add_argument('-r', '--rate', type=float, default=10, 
+                        help='Screenshot interval in seconds, fractions allowed (e.g. 0.2) (default: 10)')
+    parser.add_argument('--schedule', type=str, default='fixed',
+                        help='When to take screenshots: fixed (every --rate seconds) or adaptive (start at --rate, '
+                             'speed up while the screen changes a lot and back off while it is static) (default: fixed)')
+    parser.add_argument('--min-interval', type=float, default=None,
+                        help='Shortest interval of an adaptive schedule, in seconds (default: a quarter of --rate)')
+    parser.add_argument('--max-interval', type=float, default=None,
+                        help='Longest interval of an adaptive schedule, in seconds (default: four times --rate)')
+    parser.add_argument('--activity-threshold', type=float, default=scheduler.DEFAULT_ACTIVITY_THRESHOLD,
+                        help='Change between consecutive frames, as a percentage (0-100), that makes an adaptive '
+                             'schedule speed up; below a quarter of it, it backs off '
+                             f'(default: {scheduler.DEFAULT_ACTIVITY_THRESHOLD})')
+    parser.add_argument('--frame-budget', type=int, default=None,
+                        help='Most screenshots the session takes, whatever the schedule; unlike --max-frames it ends '
+                             'the session rather than applying --budget-policy, so the two only combine with the '
+                             'rollover or thin policy (default: no limit)')
+    parser.add_argument('--schedule-log', type=str, default=None, metavar='PATH',
+                        help='Append every adaptive schedule decision to PATH as a JSON line, for tuning')
     parser.add_argument('-d', '--duration', type=int, default=1800,
                         help='Total duration in seconds (default: 1800, i.e., 30 minutes)')
     parser.add_argument('-o', '--output', type=str, default='myPDFs',
                         help='Output directory for PDF file (default: myPDFs directory)')
     parser.add_argument('-n', '--name', type=str, default=None,
                         help='Custom name for the PDF file (default: screenshots_TIMESTAMP.pdf)')
-    args = parser.parse_args()
+    parser.add_argument('--export', type=str, default='pdf',
+                        help='Output format: pdf (one page per screenshot), mp4 or webm (a video with one frame per '
+                             'screenshot and their capture times in a .vtt file, encoded while capturing) (default: pdf)')
+    parser.add_argument('--video-fps', type=float, default=video_export.DEFAULT_VIDEO_FPS,
+                        help=f'Playback frames per second of mp4/webm exports (default: {video_export.DEFAULT_VIDEO_FPS})')
+    parser.add_argument('--dedup-threshold', type=float, default=None,
+                        help='Skip frames that differ from the last kept frame by less than this percentage '
+                             '(0-100, e.g. 1.0); disabled by default')
+    parser.add_argument('--backend', type=str, default='auto',
+                        help='Screen grabber backend (auto, mss, pyautogui, synthetic) (default: auto)')
+    parser.add_argument('--target', type=str, default='screen',
+                        help='What to capture: screen (all monitors), monitor:N, region:X,Y,WIDTH,HEIGHT '
+                             'or window:TITLE (default: screen)')
+    parser.add_argument('--format', type=str, default=None,
+                        help='Screenshot image format: png, jpeg, webp, or auto (PNG for UI/text, JPEG for busy content) '
+                             '(default: png, or jpeg with --high-frequency)')
+    parser.add_argument('--jpeg-quality', type=int, default=90,
+                        help='JPEG and WebP quality, 1-100 (default: 90)')
+    parser.add_argument('--png-compression', type=int, default=None,
+                        help='PNG compression level, 0 (fastest) to 9 (smallest) (default: OpenCV default)')
+    parser.add_argument('--high-frequency', action='store_true',
+                        help='Tune for sub-second rates: JPEG unless --format is given, more encode workers, '
+                             'drop frames rather than fall behind, and report achieved fps')
+    parser.add_argument('--workers', type=int, default=2,
+                        help='Number of threads encoding and writing screenshots (default: 2)')
+    parser.add_argument('--queue-size', type=int, default=4,
+                        help='Number of grabbed frames that may wait for encoding (default: 4)')
+    parser.add_argument('--drop-policy', type=str, default='block',
+                        help='When the encode queue is full: block (wait for a slot) or drop (skip the frame) (default: block)')
+    parser.add_argument('--max-frames', type=int, default=None,
+                        help='Most frames the capture may hold before its budget policy applies (default: no limit)')
+    parser.add_argument('--max-spool-mb', type=float, default=None,
+                        help='Most megabytes of spooled frames before the budget policy applies (default: no limit)')
+    parser.add_argument('--max-pdf-mb', type=float, default=None,
+                        help='Largest PDF, in megabytes, before the budget policy applies (default: no limit)')
+    parser.add_argument('--budget-policy', type=str, default='stop',
+                        help='What to do when a budget is reached: stop (end the capture), rollover (finish the PDF '
+                             'and continue in a new part) or thin (drop every other frame so far, keeping the newest, and '
+                             'rebuild the PDF from the rest; this repeats each time the budget fills again, e.g. every '
+                             '50 frames with --max-frames 100, and holds up new frames while it runs) (default: stop)')
+    parser.add_argument('--ocr', action='store_true',
+                        help='Recognize the text of each screenshot with Tesseract, offline and in the background, lay it '
+                             'invisibly over the PDF pages so they can be searched and copied from, and add it to the '
+                             'search index of the output directory')
+    parser.add_argument('--ocr-workers', type=int, default=ocr.DEFAULT_OCR_WORKERS,
+                        help=f'Number of threads running Tesseract (default: {ocr.DEFAULT_OCR_WORKERS})')
+    parser.add_argument('--ocr-language', type=str, default=ocr.DEFAULT_OCR_LANGUAGE,
+                        help=f'Tesseract language, or several joined with + (e.g. eng+deu) (default: {ocr.DEFAULT_OCR_LANGUAGE})')
+    parser.add_argument('--search', type=str, default=None, metavar='QUERY',
+                        help='Search the text of screenshots captured with --ocr into the output directory and exit')
+    parser.add_argument('--search-limit', type=int, default=search_index.DEFAULT_SEARCH_LIMIT,
+                        help=f'Most results --search lists (default: {search_index.DEFAULT_SEARCH_LIMIT})')
+    parser.add_argument('--recover', type=str, default=None, metavar='PART_FILE',
+                        help='Finish a .part PDF left behind by an interrupted session and exit')
+    parser.add_argument('--resume', type=str, default=None, metavar='SESSION',
+                        help='Continue an interrupted capture session (its ID or directory) with its original settings')
+    parser.add_argument('--sweep', action='store_true',
+                        help='Finish the PDFs of interrupted sessions, remove their temporary files and exit')
+    parser.add_argument('--ring-buffer', type=float, default=None, metavar='SECONDS',
+                        help='Keep the last SECONDS of frames in memory instead of capturing to a PDF; press Enter to '
+                             'save them to a new PDF, Ctrl+C to quit')
+    parser.add_argument('--ring-fps', type=float, default=ring_buffer.DEFAULT_RING_FPS,
+                        help=f'Frames per second recorded by --ring-buffer (default: {ring_buffer.DEFAULT_RING_FPS})')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='Report startup time and the import cost of each heavy dependency, then exit')
+    return parser
+
+def validate_args(args):
+    """Return an error message for invalid capture settings, or None"""
+    # Validate quality parameter and how frames are scaled to it
+    try:
+        capture_engine.parse_quality(args.quality)
+    except ValueError as e:
+        return str(e)
+    if args.fit not in capture_engine.FIT_MODES:
+        return f"Invalid fit mode. Must be one of: {', '.join(capture_engine.FIT_MODES)}"
+    if args.interpolation is not None and args.interpolation not in capture_engine.INTERPOLATIONS:
+        return f"Invalid interpolation. Must be one of: {', '.join(capture_engine.INTERPOLATIONS)}"
     
-    # Validate quality parameter
-    valid_qualities = ['480p', '720p', '1080p', '2k', '4k']
-    if args.quality not in valid_qualities:
-        print(f"Error: Invalid quality setting. Must be one of: {', '.join(valid_qualities)}")
-        return
+    # Validate capture backend
+    valid_backends = ['auto'] + list(capture_engine.GRABBER_BACKENDS)
+    if args.backend not in valid_backends:
+        return f"Invalid capture backend. Must be one of: {', '.join(valid_backends)}"
+    
+    # Validate capture target
+    try:
+        capture_engine.CaptureTarget.parse(args.target)
+    except ValueError as e:
+        return str(e)
+    
+    # Validate encoding settings
+    valid_formats = list(utils.IMAGE_FORMATS) + ['auto']
+    if args.format is not None and args.format not in valid_formats:
+        return f"Invalid image format. Must be one of: {', '.join(valid_formats)}"
+    if not 1 <= args.jpeg_quality <= 100:
+        return "JPEG quality must be between 1 and 100"
+    if args.png_compression is not None and not 0 <= args.png_compression <= 9:
+        return "PNG compression level must be between 0 and 9"
+    
+    # Validate rate and schedule
+    if args.rate <= 0:
+        return "Rate must be greater than 0"
+    if args.schedule not in scheduler.SCHEDULES:
+        return f"Invalid schedule. Must be one of: {', '.join(scheduler.SCHEDULES)}"
+    min_interval, max_interval = scheduler.adaptive_intervals(args)
+    if not 0 < min_interval <= max_interval:
+        return "Min and max intervals must be greater than 0, with the min no larger than the max"
+    if not 0 <= args.activity_threshold <= 100:
+        return "Activity threshold must be between 0 and 100"
+    if args.frame_budget is not None and args.frame_budget < 1:
+        return "Frame budget must be at least 1"
+    
+    # Validate pipeline settings
+    if args.workers < 1 or args.queue_size < 1:
+        return "Workers and queue size must be at least 1"
+    if args.drop_policy not in pipeline.DROP_POLICIES:
+        return f"Invalid drop policy. Must be one of: {', '.join(pipeline.DROP_POLICIES)}"
+    
+    # Validate dedup threshold
+    if args.dedup_threshold is not None and not 0 <= args.dedup_threshold <= 100:
+        return "Dedup threshold must be between 0 and 100"
+    
+    # Validate export format
+    if args.export not in video_export.EXPORT_FORMATS:
+        return f"Invalid export format. Must be one of: {', '.join(video_export.EXPORT_FORMATS)}"
+    if args.video_fps <= 0:
+        return "Video fps must be greater than 0"
+    
+    # Validate budgets
+    if args.max_frames is not None and args.max_frames < 1:
+        return "Max frames must be at least 1"
+    if any(limit is not None and limit <= 0 for limit in (args.max_spool_mb, args.max_pdf_mb)):
+        return "Max spool and PDF sizes must be greater than 0"
+    if args.budget_policy not in budgets.BUDGET_POLICIES:
+        return f"Invalid budget policy. Must be one of: {', '.join(budgets.BUDGET_POLICIES)}"
+    # Both would end the capture after a number of frames; with rollover or thin, --frame-budget
+    # caps the whole session and --max-frames each part
+    if args.frame_budget is not None and args.max_frames is not None and args.budget_policy == 'stop':
+        return "Use either --frame-budget or --max-frames with the stop budget policy, not both"
+    
+    # Validate OCR settings; Tesseract must be installed with the language's data
+    if args.ocr_workers < 1:
+        return "OCR workers must be at least 1"
+    if args.ocr:
+        return ocr.ocr_error(args.ocr_language)
+    return None
+
+def run_capture(args, manual_screenshots_dir=None, stop_event=None, on_start=None, journal=None, on_event=None,
+                budget=None, session_id=None):
+    """Capture screenshots into a PDF with validated settings from build_parser()
+
+    Runs until the duration is over, Ctrl+C is pressed or stop_event is set, then finishes
+    the PDF (including any screenshots in manual_screenshots_dir) and returns its path, or
+    None if no PDF was created. on_start, if given, is called with the FramePipeline once
+    capture begins, so callers can follow its counters. on_event, if given, is called as
+    on_event(event_type, **data) for frame_captured, frame_skipped, frame_dropped,
+    capture_error, budget_reached and schedule_changed events. Given the SessionJournal of
+    an interrupted session, its frames are kept and the rest of its schedule is captured.
+    
+    With --schedule adaptive, each interval is chosen by a scheduler.AdaptiveScheduler from
+    how much the last grabbed frame changed, until the duration is over. --frame-budget caps
+    the screenshots taken in either schedule.
+    
+    budget is the CaptureBudget to keep to (by default one built from args). Once it is
+    reached the capture stops, finishes its PDF and continues in a new part (rollover), or
+    drops every other frame captured so far, keeping the newest, and rebuilds the PDF (thin).
+    
+    With --ocr, each written frame is handed to an ocr.OCRPool, whose threads recognize its
+    text while the capture goes on. Finishing a PDF lays the text over its pages (text not
+    ready at a rollover only reaches the index), and once the capture is over every part is
+    added to the search index of the output directory, under session_id (by default the
+    ID of the capture's journal).
+    """
+    settings = {key: value for key, value in vars(args).items() if key not in MODE_OPTIONS}
+    # Work on a copy; high-frequency mode adjusts the pipeline settings
+    args = argparse.Namespace(**vars(args))
+    stop_event = stop_event or threading.Event()
+    emit = on_event or (lambda event_type, **data: None)
     
     # Create output folder if it doesn't exist
     if not os.path.exists(args.output):
         os.makedirs(args.output)
     
-    # Create a temporary directory for screenshots
-    temp_dir = utils.create_temp_directory()
-    print(f"Using temporary directory for screenshots: {temp_dir}")
+    # Create a temporary directory for screenshots, or carry on in the interrupted session's
+    if journal is None:
+        temp_dir = utils.create_temp_directory(prefix=session_journal.SESSION_DIR_PREFIX)
+        print(f"Using temporary directory for screenshots: {temp_dir}")
+    else:
+        temp_dir = journal.directory
+        print(f"Resuming session {journal.session_id} from: {temp_dir}")
     
-    # Check for manual screenshots directory from environment variable
-    manual_screenshots_dir = os.environ.get('MANUAL_SCREENSHOTS_DIR')
+    # Calculate number of screenshots to take (at most, for an adaptive schedule); a resumed
+    # session takes the ones it missed, within the part of the duration it has left
+    schedule = scheduler.AdaptiveScheduler.from_args(args)
+    num_screenshots = max(1, int(args.duration / (args.rate if schedule is None else schedule.min_interval)))
+    if args.frame_budget is not None:
+        num_screenshots = min(num_screenshots, args.frame_budget)
+    first_shot = journal.grabs if journal is not None else 0
+    elapsed_before = journal.elapsed if journal is not None else 0.0
     
-    # Calculate number of screenshots to take
-    num_screenshots = args.duration // args.rate
+    # High-frequency mode trades lossless intermediates for encode speed and never lets the timer stall
+    image_format = args.format or ('jpeg' if args.high_frequency else 'png')
+    encoding = utils.EncodingPolicy(image_format, jpeg_quality=args.jpeg_quality, png_compression=args.png_compression)
+    interpolation = args.interpolation or ('linear' if args.high_frequency else 'area')
+    if args.high_frequency:
+        args.workers = max(args.workers, min(4, os.cpu_count() or 1))
+        args.drop_policy = 'drop'
+    
+    # Per-stage timings and counters of this capture; they also add up in the process-wide registry
+    run_metrics = metrics.Metrics(parent=metrics.REGISTRY)
+    if budget is None:
+        budget = budgets.CaptureBudget.from_args(args)
+    if journal is not None:
+        budget.parts = list(journal.parts)
+    ocr_pool = None
+    if args.ocr:
+        # A resumed session may run where Tesseract isn't installed
+        error = ocr.ocr_error(args.ocr_language)
+        if error:
+            print(f"Warning: {error}; capturing without OCR")
+        else:
+            ocr_pool = ocr.OCRPool.from_args(args, metrics=run_metrics)
     
-    print(f"Starting screenshot capture with quality: {args.quality}")
-    print(f"Capture settings: {num_screenshots} screenshots at {args.rate} second intervals")
+    # Create the capture engine once so its frame buffers are reused for every shot
+    # Only the target area is grabbed, so per-frame cost follows its size rather than the whole desktop's
+    engine = capture_engine.CaptureEngine(backend=args.backend, target=capture_engine.CaptureTarget.parse(args.target),
+                                          fit=args.fit, interpolation=interpolation, metrics=run_metrics)
+    
+    print(f"Starting screenshot capture with quality: {args.quality} (backend: {engine.backend}, target: {engine.target})")
+    print(f"Scaling: {args.fit}, {interpolation} interpolation")
+    if schedule is None:
+        print(f"Capture settings: {num_screenshots} screenshots at {args.rate:g} second intervals ({1 / args.rate:.2f} fps)")
+    else:
+        print(f"Capture settings: adaptive intervals of {schedule.min_interval:g}-{schedule.max_interval:g} seconds, "
+              f"starting at {schedule.interval:g} (activity threshold: {schedule.activity_threshold:g}%), "
+              f"at most {num_screenshots} screenshots")
     print(f"Total duration: {args.duration} seconds ({args.duration/60:.1f} minutes)")
-    print(f"Output PDF will be saved to: {args.output}")
+    print(f"Output {'PDF' if args.export == 'pdf' else args.export + ' video'} will be saved to: {args.output}")
     if manual_screenshots_dir:
         print(f"Manual screenshots will be included from: {manual_screenshots_dir}")
+    if args.high_frequency:
+        print(f"High-frequency mode: {args.workers} encode workers, frames dropped if encoding falls behind")
+    print(f"Screenshot format: {encoding.describe()}")
+    if args.dedup_threshold is not None:
+        print(f"Near-duplicate frames will be skipped (threshold: {args.dedup_threshold}%)")
+    limits = [f"{budget.max_frames} frames" if budget.max_frames is not None else None,
+              f"{args.max_spool_mb:g} MB spooled" if budget.max_spool_bytes is not None else None,
+              f"{args.max_pdf_mb:g} MB of PDF" if budget.max_pdf_bytes is not None else None]
+    if any(limits):
+        print(f"Budget: {', '.join(limit for limit in limits if limit)}, then {budget.policy}")
+    if ocr_pool is not None:
+        print(f"OCR: {args.ocr_language} text recognized on {args.ocr_workers} background threads, "
+              f"indexed in {search_index.index_path(args.output)}")
     print("Press Ctrl+C to stop the capture early")
     
-    screenshot_files = []
+    # Create PDF filename; a resumed session keeps the one it reserved
+    if journal is not None:
+        pdf_path = journal.pdf_path
+    elif args.name:
+        pdf_filename = args.name if args.name.endswith('.pdf') else f"{args.name}.pdf"
+    else:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        pdf_filename = f"screenshots_{timestamp}.pdf"
+    if journal is None:
+        pdf_path = utils.unique_pdf_path(video_export.export_path(os.path.join(args.output, pdf_filename), args.export))
+    
+    def open_writer(path):
+        return video_export.open_writer(path, args.export, args.video_fps)
+    # Labels for messages and for the build metrics
+    output_label = 'PDF' if args.export == 'pdf' else 'Video'
+    builder = 'incremental' if args.export == 'pdf' else args.export
+    
+    # Pages are appended to the PDF (or frames encoded into the video) as each frame is
+    # captured, so finishing only writes the trailer
+    writer = open_writer(pdf_path)
+    print(f"Writing {'pages' if args.export == 'pdf' else 'frames'} to: {writer.part_path}")
+    
+    pdf_frames = []
+    # OCR key of each page in pdf_frames: (spool directory, frame id)
+    page_keys = []
+    # Text taken from the OCR pool by key, and the pages of each finished part: (path, [(page, captured_at, key)])
+    recognized = {}
+    text_parts = []
     capture_interrupted = False
+    deduplicator = utils.FrameDeduplicator(args.dedup_threshold) if args.dedup_threshold is not None else None
+    
+    # Frames go into one append-only spool whose index records each frame's size and capture
+    # time, so PDF pages are laid out without decoding and read back through a memory map
+    spool = frame_spool.FrameSpool(temp_dir)
+    
+    def add_to_pdf(frames, entry):
+        try:
+            started = time.perf_counter()
+            writer.add_spooled_page(frames, entry, caption=utils.screenshot_caption(None, entry))
+            run_metrics.observe('snip_stage_seconds', time.perf_counter() - started, stage='pdf_page')
+            run_metrics.inc('snip_pdf_pages_total', builder=builder)
+            pdf_frames.append(entry)
+            page_keys.append((frames.directory, entry['id']))
+        except Exception as e:
+            print(f"Error adding frame {entry['id']} to PDF: {str(e)}")
+            emit('capture_error', message=f"Error adding frame {entry['id']} to PDF: {str(e)}")
+            return False
+        return True
+    
+    def recognize_text(frames, entry, wait=False):
+        # A copy goes to the OCR threads; on the capture path a full backlog skips the frame rather than wait
+        if ocr_pool is not None:
+            ocr_pool.submit((frames.directory, entry['id']), bytes(frames.read(entry)), wait=wait)
+    
+    def apply_text(part_writer, wait=True):
+        # Lay the recognized text over the pages of the part being finished and return its pages
+        # for the index; at a rollover, text still being recognized only reaches the index
+        pages = []
+        for index, (key, entry) in enumerate(zip(page_keys, pdf_frames)):
+            if wait or ocr_pool.done(key):
+                recognized[key] = ocr_pool.result(key)
+                if recognized[key] and args.export == 'pdf':
+                    part_writer.set_page_text(index, recognized[key])
+            pages.append((index + 1, entry['captured_at'], key))
+        return pages
+    
+    def on_frame(entry):
+        if add_to_pdf(spool, entry):
+            recognize_text(spool, entry)
+            emit('frame_captured', frame_id=entry['id'], captured_at=entry['captured_at'],
+                 width=entry['width'], height=entry['height'], pages=len(pdf_frames))
+        enforce_budget()
+    
+    def enforce_budget():
+        # Runs on the pipeline's commit path after every frame, so no frame is appended meanwhile
+        budget.update(len(spool), spool.disk_bytes(), writer.size)
+        reason = budget.exceeded()
+        if reason is None:
+            return
+        if budget.policy == 'thin' and len(spool) > 1:
+            thin_frames(reason)
+        elif budget.policy == 'rollover' and writer.page_count:
+            roll_over(reason)
+        elif not stop_event.is_set():
+            # Frames already queued are still written
+            budget.stopped_reason = reason
+            print(f"\nBudget reached ({reason}), stopping the capture")
+            emit('budget_reached', policy='stop', reason=reason)
+            stop_event.set()
+    
+    def roll_over(reason):
+        # Finish this part and carry on in a new PDF, freeing the spooled frames already in it
+        nonlocal writer, pdf_path
+        part_pages = apply_text(writer, wait=False) if ocr_pool is not None else None
+        finished_path = writer.close()
+        if part_pages is not None:
+            text_parts.append((finished_path, part_pages))
+        run_metrics.inc('snip_pdf_bytes_total', os.path.getsize(finished_path), builder=builder)
+        budget.parts.append(finished_path)
+        root, ext = os.path.splitext(budget.parts[0])
+        pdf_path = utils.unique_pdf_path(f"{root}_part{len(budget.parts) + 1}{ext}")
+        writer = open_writer(pdf_path)
+        # The journal moves on before the spool is emptied, so a crash in between duplicates frames rather than losing them
+        journal.pdf_path = pdf_path
+        journal.parts = list(budget.parts)
+        journal.save()
+        spool.compact([])
+        pdf_frames.clear()
+        page_keys.clear()
+        budget.update(0, spool.disk_bytes(), writer.size)
+        print(f"\nBudget reached ({reason}), PDF part saved to {finished_path}; continuing in {pdf_path}")
+        emit('budget_reached', policy='rollover', reason=reason, pdf_path=finished_path, next_pdf_path=pdf_path)
+    
+    def thin_frames(reason):
+        # Keep every other frame of the current part, counting back from the newest so the
+        # final screen state survives, and rebuild its PDF from them
+        nonlocal writer
+        entries = spool.entries()
+        kept = spool.compact(entries[::-2][::-1])
+        writer.abort()
+        writer = open_writer(pdf_path)
+        pdf_frames.clear()
+        page_keys.clear()
+        # The kept frames were handed to the OCR pool already
+        for entry in kept:
+            add_to_pdf(spool, entry)
+        budget.thinned += len(entries) - len(kept)
+        budget.update(len(spool), spool.disk_bytes(), writer.size)
+        print(f"\nBudget reached ({reason}), dropped every other frame ({len(kept)} of {len(entries)} kept)")
+        emit('budget_reached', policy='thin', reason=reason, frames_kept=len(kept), frames_dropped=len(entries) - len(kept))
+    
+    def submit(shot):
+        # Report what became of the shot: None is a near-duplicate, False a dropped frame
+        result = frame_pipeline.submit()
+        if result is None:
+            emit('frame_skipped', shot=shot + 1, screenshots=num_screenshots)
+        elif result is False:
+            emit('frame_dropped', shot=shot + 1, screenshots=num_screenshots)
+        if frame_pipeline.last_decision is not None:
+            report_decision(shot, frame_pipeline.last_decision)
+    
+    def report_decision(shot, decision):
+        # Every decision goes into the metrics (and the schedule log); changes of interval are printed too
+        run_metrics.inc('snip_schedule_decisions_total', action=decision['action'])
+        run_metrics.observe('snip_schedule_interval_seconds', decision['interval'])
+        if decision['change'] is not None:
+            run_metrics.observe('snip_frame_change_percent', decision['change'])
+        if decision['interval'] != decision['previous_interval']:
+            print(f"Schedule: {decision['change']:.2f}% change, {decision['action'].replace('_', ' ')} "
+                  f"to {decision['interval']:g} second intervals")
+            emit('schedule_changed', shot=shot + 1, change=decision['change'], action=decision['action'],
+                 interval=decision['interval'])
+    
+    # The spool is the complete record of an interrupted session, so its pages are rebuilt
+    # from there rather than from whatever reached the old .part file
+    if journal is not None:
+        for entry in spool.entries():
+            if add_to_pdf(spool, entry):
+                recognize_text(spool, entry, wait=True)
+        # Every spooled frame took a shot, and the spool can be ahead of the last journal save
+        first_shot = max(first_shot, len(spool))
+        print(f"Kept {len(pdf_frames)} screenshots from before the interruption ({first_shot}/{num_screenshots} taken)")
+        budget.update(len(spool), spool.disk_bytes(), writer.size)
+        journal.claim()
+    else:
+        journal = session_journal.SessionJournal(temp_dir, settings, pdf_path, manual_screenshots_dir)
+        print(f"Session ID: {journal.session_id} (continue it with --resume if the capture is interrupted)")
+    journal.save()
+    
+    # Grab on this thread; encoding, spool writes and PDF pages happen on the pipeline's workers
+    frame_pipeline = pipeline.FramePipeline(engine, spool, quality=args.quality, workers=args.workers,
+                                            queue_size=args.queue_size, drop_policy=args.drop_policy,
+                                            deduplicator=deduplicator, on_frame=on_frame,
+                                            encoding=encoding, verbose=not args.high_frequency, metrics=run_metrics,
+                                            scheduler=schedule)
+    max_lateness = 0.0
+    grabs = 0
+    start_time = last_grab_time = last_progress_time = time.monotonic()
+    # An adaptive schedule stops taking screenshots once the rest of the duration is over
+    end_time = start_time + args.duration - elapsed_before
+    if on_start is not None:
+        on_start(frame_pipeline)
     
     try:
         # Take initial screenshot
-        filepath = utils.take_screenshot_opencv(temp_dir, quality=args.quality)
-        if filepath:
-            screenshot_files.append(filepath)
+        if first_shot < num_screenshots and end_time > start_time:
+            submit(first_shot)
+            grabs += 1
+            journal.checkpoint(first_shot + grabs, spool, elapsed=elapsed_before)
         
-        # Take remaining screenshots at the specified interval
-        for i in range(1, num_screenshots):
+        # Take remaining screenshots on fixed rate boundaries, measured from the start on a monotonic
+        # clock, or one adaptive interval after the last grab
+        for i in range(first_shot + 1, num_screenshots):
             try:
-                time.sleep(args.rate)
-                filepath = utils.take_screenshot_opencv(temp_dir, quality=args.quality)
-                if filepath:
-                    screenshot_files.append(filepath)
+                if schedule is None:
+                    due = start_time + (i - first_shot) * args.rate
+                else:
+                    due = last_grab_time + schedule.interval
+                    if due > end_time:
+                        break
+                delay = due - time.monotonic()
+                if delay <= 0:
+                    max_lateness = max(max_lateness, -delay)
+                # Wait on the stop event rather than sleeping, so a stop takes effect at once
+                if stop_event.wait(max(0, delay)):
+                    print("\nScreenshot capture stopped")
+                    break
+                last_grab_time = time.monotonic()
+                run_metrics.observe('snip_capture_drift_seconds', max(0.0, last_grab_time - due))
+                submit(i)
+                grabs += 1
+                # Persist progress (at most once a second) so an interrupted session can be resumed
+                journal.checkpoint(first_shot + grabs, spool, elapsed=elapsed_before + last_grab_time - start_time)
                 
-                # Display progress
-                print(f"Progress: {i+1}/{num_screenshots} screenshots captured")
+                # Display progress, at most once a second at high rates
+                if schedule is not None:
+                    if last_grab_time - last_progress_time >= 1:
+                        last_progress_time = last_grab_time
+                        print(f"Progress: {i+1} screenshots captured, next in {schedule.interval:g} seconds")
+                elif args.rate >= 1 or i % max(1, round(1 / args.rate)) == 0:
+                    print(f"Progress: {i+1}/{num_screenshots} screenshots captured")
             except KeyboardInterrupt:
                 capture_interrupted = True
                 break
             except Exception as e:
                 print(f"Error during capture: {str(e)}")
+                emit('capture_error', message=f"Error during capture: {str(e)}")
                 continue
     
     except KeyboardInterrupt:
@@ -79,41 +548,235 @@ def main():
         print("\nScreenshot capture interrupted by user")
     except Exception as e:
         print(f"\nError during capture: {str(e)}")
+        emit('capture_error', message=f"Error during capture: {str(e)}")
+    
+    # Let the workers finish encoding whatever is still queued
+    print("Waiting for queued screenshots to be written...")
+    frame_pipeline.close()
+    print(f"Frames written: {frame_pipeline.written}, dropped: {frame_pipeline.dropped}, failed: {frame_pipeline.failed}")
+    if schedule is not None:
+        print(schedule.summary())
+        schedule.close()
+    elif grabs > 1:
+        # The first grab is at t=0, so n grabs span n - 1 intervals
+        achieved_fps = (grabs - 1) / max(last_grab_time - start_time, 1e-9)
+        stored_fps = frame_pipeline.written / (last_grab_time - start_time + args.rate)
+        print(f"Capture timer achieved {achieved_fps:.2f} fps, {stored_fps:.2f} fps stored (target {1 / args.rate:.2f} fps)")
+        if achieved_fps < 0.9 / args.rate:
+            print("Warning: this machine could not keep up with the requested rate; try a lower quality or a longer rate")
+        elif frame_pipeline.dropped:
+            print("Warning: encoding could not keep up with the requested rate; try a lower quality or more --workers")
+    if max_lateness > 0:
+        print(f"Capture fell behind schedule by up to {max_lateness:.2f} seconds")
+    
+    if deduplicator is not None:
+        print(f"Frames kept: {deduplicator.kept}, skipped as near-duplicates: {deduplicator.skipped}")
     
-    # Collect manual screenshots if available
-    manual_files = []
+    # Collect manual screenshots from their spool if available; opened after capture so it
+    # includes every screenshot the server took meanwhile
+    manual_spool = None
     if manual_screenshots_dir and os.path.exists(manual_screenshots_dir):
-        manual_files = glob.glob(os.path.join(manual_screenshots_dir, "screenshot_*.png"))
-        if manual_files:
-            print(f"Found {len(manual_files)} manual screenshots to include in PDF")
-    
-    # Combine automatic and manual screenshots
-    all_screenshots = screenshot_files + manual_files
-    
-    # Create PDF from captured screenshots
-    if all_screenshots:
-        # Create PDF filename
-        if args.name:
-            pdf_filename = args.name if args.name.endswith('.pdf') else f"{args.name}.pdf"
-        else:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            pdf_filename = f"screenshots_{timestamp}.pdf"
-        
-        pdf_path = os.path.join(args.output, pdf_filename)
-        success = utils.create_pdf_with_fpdf(all_screenshots, pdf_path)
-        
-        if success:
-            print(f"PDF saved to: {os.path.abspath(pdf_path)}")
-            print(f"Total screenshots in PDF: {len(all_screenshots)} ({len(screenshot_files)} automatic, {len(manual_files)} manual)")
-        else:
-            print("Failed to create PDF")
+        manual_spool = frame_spool.FrameSpool(manual_screenshots_dir)
+        if len(manual_spool):
+            print(f"Found {len(manual_spool)} manual screenshots to include in PDF")
+    
+    automatic_count = len(pdf_frames)
+    if manual_spool is not None:
+        for entry in manual_spool.entries():
+            if add_to_pdf(manual_spool, entry):
+                recognize_text(manual_spool, entry, wait=True)
+    
+    # Finish the PDF from the pages already written
+    created_path = None
+    if writer.page_count:
+        try:
+            part_pages = None
+            if ocr_pool is not None:
+                print("Waiting for text recognition to finish...")
+                part_pages = apply_text(writer)
+            started = time.perf_counter()
+            writer.close()
+            if part_pages is not None:
+                text_parts.append((pdf_path, part_pages))
+            run_metrics.observe('snip_pdf_build_seconds', time.perf_counter() - started, builder=builder)
+            run_metrics.inc('snip_pdf_bytes_total', os.path.getsize(pdf_path), builder=builder)
+            created_path = pdf_path
+            print(f"{output_label} created: {pdf_path}")
+            print(f"{output_label} saved to: {os.path.abspath(pdf_path)}")
+            if args.export != 'pdf':
+                print(f"Capture times saved to: {os.path.abspath(writer.captions_path)}")
+            print(f"Total screenshots in {output_label}: {writer.page_count} ({automatic_count} automatic, {writer.page_count - automatic_count} manual)")
+        except Exception as e:
+            print(f"Failed to create PDF: {str(e)}")
+            emit('capture_error', message=f"Failed to create PDF: {str(e)}")
     else:
-        print("No screenshots were taken, no PDF created.")
+        writer.abort()
+        if budget.parts:
+            # The last rollover left nothing for a new part
+            created_path = budget.parts[-1]
+        else:
+            print(f"No screenshots were taken, no {output_label} created.")
+    if budget.parts:
+        print(f"PDF parts: {', '.join(budget.parts + ([pdf_path] if writer.page_count else []))}")
+    if budget.thinned:
+        print(f"Frames dropped to stay within budget: {budget.thinned}")
+    if ocr_pool is not None:
+        index_text(args.output, session_id or journal.session_id, text_parts, recognized, ocr_pool)
+    journal.checkpoint(first_shot + grabs, spool, interval=0, elapsed=elapsed_before + last_grab_time - start_time)
+    journal.finish()
+    
+    print("Capture metrics:")
+    metrics.print_capture_summary(run_metrics)
+    
+    engine.close()
+    spool.close()
+    if manual_spool is not None:
+        manual_spool.close()
     
     # Clean up - remove temporary directory and all screenshots
     print("Cleaning up temporary files...")
     utils.cleanup_temp_directory(temp_dir)
     print("Cleanup complete.")
+    return created_path
+
+def index_text(output, session_id, text_parts, recognized, ocr_pool):
+    """Add the pages of a capture's finished parts to the search index of its output directory"""
+    indexed = 0
+    try:
+        for path, pages in text_parts:
+            rows = []
+            for page, captured_at, key in pages:
+                lines = recognized[key] if key in recognized else ocr_pool.result(key)
+                rows.append((page, captured_at, ocr.page_text(lines)))
+            indexed += search_index.add_pages(output, path, session_id, rows)
+        print(f"{ocr_pool.summary()}; {indexed} pages with text indexed for --search")
+    except Exception as e:
+        print(f"Error indexing text: {str(e)}")
+    finally:
+        ocr_pool.close()
+
+def run_search(args):
+    """Print the pages whose text matches --search, best first"""
+    try:
+        matches, milliseconds = search_index.search(args.output, args.search, args.search_limit)
+    except Exception as e:
+        print(f"Error searching: {str(e)}")
+        return
+    for match in matches:
+        captured_at = f", {match['captured_at']}" if match['captured_at'] else ''
+        print(f"{match['pdf_path']} page {match['page']} (session {match['session_id']}{captured_at})")
+        print(f"    {' '.join(match['snippet'].split())}")
+    print(f"{len(matches)} matches in {search_index.index_path(args.output)} ({milliseconds:.1f} ms)")
+
+def run_ring_buffer(args):
+    """Record into a ring buffer and save the last --ring-buffer seconds to a new PDF on each Enter"""
+    ring = ring_buffer.FrameRing(seconds=args.ring_buffer, fps=args.ring_fps, quality=args.quality, backend=args.backend,
+                                 target=capture_engine.CaptureTarget.parse(args.target))
+    if not os.path.exists(args.output):
+        os.makedirs(args.output)
+    encoding = utils.EncodingPolicy(args.format or 'png', jpeg_quality=args.jpeg_quality, png_compression=args.png_compression)
+    print(f"Recording the last {args.ring_buffer:g} seconds at {args.ring_fps:g} fps ({args.quality}, "
+          f"{ring.capacity} frames, {ring.memory_mb:.0f} MB held in memory)")
+    print("Press Enter to save them to a PDF, Ctrl+C to quit")
+    ring.start()
+    try:
+        while True:
+            input()
+            frames = ring.recent()
+            if not frames:
+                print(f"Nothing recorded yet{': ' + ring.error if ring.error else ''}")
+                continue
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            name = (args.name[:-4] if args.name.endswith('.pdf') else args.name) if args.name else 'recent'
+            pdf_path = utils.unique_pdf_path(os.path.join(args.output, f"{name}_{timestamp}.pdf"))
+            try:
+                ring_buffer.save_frames_to_pdf(frames, pdf_path, args.quality, encoding)
+                print(f"Saved {len(frames)} screenshots ({(frames[-1][0] - frames[0][0]).total_seconds():.1f} seconds) "
+                      f"to: {os.path.abspath(pdf_path)}")
+            except Exception as e:
+                print(f"Error saving PDF: {str(e)}")
+    except (KeyboardInterrupt, EOFError):
+        print("\nRing buffer stopped")
+    finally:
+        ring.stop()
+
+def main():
+    ready_at = time.time()
+    args = build_parser().parse_args()
+    
+    # Report what startup costs instead of capturing
+    if args.profile_startup:
+        results = startup.profile_imports()
+        startup.print_startup_report(startup.seconds_since_process_start(ready_at), results)
+        return
+    
+    # Search the text of earlier captures instead of capturing
+    if args.search is not None:
+        if not args.search.strip() or args.search_limit < 1:
+            print("Error: The search needs a query and a limit of at least 1")
+            return
+        run_search(args)
+        return
+    
+    # Recover a partial PDF instead of capturing
+    if args.recover:
+        try:
+            pdf_path, pages = pdf_writer.recover_partial_pdf(args.recover)
+            print(f"Recovered {pages} pages into: {os.path.abspath(pdf_path)}")
+        except Exception as e:
+            print(f"Error recovering PDF: {str(e)}")
+        return
+    
+    # Finish and clean up sessions whose process died instead of capturing
+    if args.sweep:
+        results = session_journal.sweep_orphaned_sessions()
+        for session_id, pdf_path in results:
+            print(f"Session {session_id}: " + (f"saved to {os.path.abspath(pdf_path)}" if pdf_path else "nothing captured, removed"))
+        print(f"Swept {len(results)} interrupted sessions")
+        return
+    
+    # Continue an interrupted session with the settings it was started with
+    if args.resume:
+        try:
+            journal = session_journal.SessionJournal.load(session_journal.session_directory(args.resume))
+        except (OSError, ValueError) as e:
+            print(f"Error: Cannot resume session {args.resume}: {str(e)}")
+            return
+        if not journal.is_orphaned():
+            print(f"Error: Session {journal.session_id} is still running (process {journal.pid})")
+            return
+        if journal.status == 'finished':
+            print(f"Error: Session {journal.session_id} already finished; run --sweep to clean it up")
+            return
+        resumed_args = argparse.Namespace(**{**vars(build_parser().parse_args([])), **journal.settings})
+        run_capture(resumed_args, manual_screenshots_dir=journal.manual_screenshots_dir, journal=journal)
+        # Manual screenshots of a server session have no other owner once it is resumed here
+        utils.cleanup_temp_directory(journal.manual_screenshots_dir)
+        return
+    
+    error = validate_args(args)
+    if error:
+        print(f"Error: {error}")
+        return
+    
+    # Keep recent frames in memory instead of capturing to a PDF
+    if args.ring_buffer is not None:
+        if args.ring_buffer <= 0 or args.ring_fps <= 0:
+            print("Error: Ring buffer seconds and fps must be greater than 0")
+            return
+        if capture_engine.parse_quality(args.quality)[0] != 'box':
+            print("Error: The ring buffer needs a fixed quality: a preset or WIDTHxHEIGHT")
+            return
+        run_ring_buffer(args)
+        return
+    
+    orphans = session_journal.find_orphaned_sessions()
+    if orphans:
+        print(f"Found {len(orphans)} interrupted session(s): {', '.join(journal.session_id for journal in orphans)}")
+        print("Continue one with --resume SESSION, or finish them all with --sweep")
+    
+    # The server passes its manual screenshots directory in the environment when it runs main.py
+    run_capture(args, manual_screenshots_dir=os.environ.get('MANUAL_SCREENSHOTS_DIR'))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
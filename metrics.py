@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+import math
+import threading
+from collections import deque
+
+# Histogram bucket bounds in seconds
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Bounds for adaptive schedule intervals (seconds) and frame-to-frame change (percent)
+INTERVAL_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+CHANGE_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 25.0, 50.0, 100.0)
+BUILD_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# Every metric: (type, help text, histogram buckets)
+METRICS = {
+    'snip_stage_seconds': ('histogram', 'Time spent per frame in each capture stage (grab, resize, activity, encode, spool_write, pdf_page, and ocr off the capture path)', STAGE_BUCKETS),
+    'snip_capture_drift_seconds': ('histogram', 'How late each scheduled grab started after its rate boundary', STAGE_BUCKETS),
+    'snip_schedule_interval_seconds': ('histogram', 'Intervals chosen by the adaptive schedule', INTERVAL_BUCKETS),
+    'snip_frame_change_percent': ('histogram', 'Change between consecutive frames measured by the adaptive schedule', CHANGE_BUCKETS),
+    'snip_pdf_build_seconds': ('histogram', 'Time to build a PDF from spooled frames, by builder', BUILD_BUCKETS),
+    'snip_frames_total': ('counter', 'Frames by outcome (captured, skipped, dropped, written, failed, manual)', None),
+    'snip_schedule_decisions_total': ('counter', 'Adaptive schedule decisions by action (speed_up, back_off, hold)', None),
+    'snip_spool_bytes_total': ('counter', 'Encoded frame bytes appended to frame spools', None),
+    'snip_pdf_pages_total': ('counter', 'Pages added to PDFs, by builder', None),
+    'snip_pdf_bytes_total': ('counter', 'Bytes of finished PDFs, by builder', None),
+    'snip_capture_sessions': ('gauge', 'Capture sessions currently running', None),
+    'snip_pdf_jobs': ('gauge', 'Background PDF builds currently running', None)
+}
+
+# Recent observations kept per histogram for the end-of-run percentiles
+RECENT_SAMPLES = 4096
+
+class Histogram:
+    """Cumulative bucket counts plus a window of recent samples for percentiles"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        self.recent.append(value)
+
+    def percentile(self, pct):
+        """Nearest-rank percentile of the recent samples"""
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))]
+
+class Metrics:
+    """Named counters, gauges and histograms with labels, safe to update from any thread
+
+    Updates are passed on to parent too, so a capture keeps its own figures for its
+    end-of-run summary while the process-wide REGISTRY adds up every capture for /metrics.
+    """
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.lock = threading.Lock()
+        # (name, sorted label items) -> value or Histogram
+        self.values = {}
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        if self.parent is not None:
+            self.parent.inc(name, amount, **labels)
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.values[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.values.get(key)
+            if histogram is None:
+                histogram = self.values[key] = Histogram(METRICS[name][2])
+            histogram.observe(value)
+        if self.parent is not None:
+            self.parent.observe(name, value, **labels)
+
+    def get(self, name, **labels):
+        """Return a counter or gauge value (0 if never set), or a Histogram (None if never observed)"""
+        with self.lock:
+            default = None if METRICS[name][0] == 'histogram' else 0
+            return self.values.get((name, tuple(sorted(labels.items()))), default)
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        with self.lock:
+            items = sorted(self.values.items(), key=lambda item: item[0])
+            lines = []
+            for name, (kind, help_text, _) in METRICS.items():
+                series = [(labels, value) for (metric, labels), value in items if metric == name]
+                if not series:
+                    continue
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in series:
+                    if kind != 'histogram':
+                        lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(value.buckets, value.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{format_labels(labels + (('le', format_value(bound)),))} {cumulative}")
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {value.count}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {format_value(value.sum)}")
+                    lines.append(f"{name}_count{format_labels(labels)} {value.count}")
+        return '\n'.join(lines) + '\n'
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def print_capture_summary(metrics):
+    """Print per-stage latency, frame counters and schedule drift for one capture"""
+    stages = ['grab', 'resize', 'activity', 'encode', 'spool_write', 'pdf_page', 'ocr']
+    print(f"  {'stage':<12} {'count':>6} {'mean ms':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for stage in stages:
+        histogram = metrics.get('snip_stage_seconds', stage=stage)
+        if histogram is None:
+            continue
+        print(f"  {stage:<12} {histogram.count:>6} {histogram.sum / histogram.count * 1000:>9.2f} "
+              f"{histogram.percentile(50) * 1000:>9.2f} {histogram.percentile(90) * 1000:>9.2f} "
+              f"{histogram.percentile(99) * 1000:>9.2f} {histogram.max * 1000:>9.2f}")
+    counts = {result: metrics.get('snip_frames_total', result=result)
+              for result in ['captured', 'skipped', 'dropped', 'written', 'failed']}
+    print("  frames: " + ', '.join(f"{count} {result}" for result, count in counts.items()))
+    print(f"  spooled: {metrics.get('snip_spool_bytes_total') / (1024 * 1024):.1f} MB")
+    drift = metrics.get('snip_capture_drift_seconds')
+    if drift is not None:
+        print(f"  schedule drift: mean {drift.sum / drift.count * 1000:.1f} ms, "
+              f"p99 {drift.percentile(99) * 1000:.1f} ms, max {drift.max * 1000:.1f} ms")
+    change = metrics.get('snip_frame_change_percent')
+    if change is not None:
+        print(f"  frame change: p50 {change.percentile(50):.2f}%, p90 {change.percentile(90):.2f}%, "
+              f"max {change.max:.2f}%")
+
+# Process-wide totals, exported by the server's /metrics endpoint
+REGISTRY = Metrics()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from startup import lazy_import
+import pdf_writer
+
+cv2 = lazy_import('cv2')
+
+# Tesseract runs as a separate process per image, so a few threads keep several cores busy
+DEFAULT_OCR_WORKERS = 2
+DEFAULT_OCR_LANGUAGE = 'eng'
+# Frames that may wait for recognition during a capture; later ones get no text rather than
+# holding more encoded frames in memory
+DEFAULT_OCR_BACKLOG = 32
+# Words Tesseract is less sure of than this (0-100) are left out
+MIN_CONFIDENCE = 30
+
+def ocr_error(language=DEFAULT_OCR_LANGUAGE):
+    """Return why OCR can't run (pytesseract, the tesseract program or the language missing), or None"""
+    try:
+        import pytesseract
+    except ImportError:
+        return "OCR needs pytesseract (pip install pytesseract) and the tesseract program"
+    try:
+        languages = pytesseract.get_languages(config='')
+    except Exception:
+        return "OCR needs the tesseract program (e.g. apt install tesseract-ocr), which was not found"
+    missing = [lang for lang in language.split('+') if lang not in languages]
+    if missing:
+        return f"Tesseract has no data for language {', '.join(missing)} (installed: {', '.join(sorted(languages))})"
+    return None
+
+def recognize(data, language=DEFAULT_OCR_LANGUAGE):
+    """Recognize the text of encoded image bytes with Tesseract, offline
+
+    Returns the lines found, in reading order, as dicts with the text and its box in image
+    pixels (left, top, width, height).
+    """
+    import pytesseract
+    gray = cv2.cvtColor(pdf_writer.decode_image(data), cv2.COLOR_BGR2GRAY)
+    words = pytesseract.image_to_data(gray, lang=language, output_type=pytesseract.Output.DICT)
+
+    # Join the words of each line, in reading order, and take the box around them
+    lines = {}
+    for i, text in enumerate(words['text']):
+        text = text.strip()
+        if not text or float(words['conf'][i]) < MIN_CONFIDENCE:
+            continue
+        key = (words['block_num'][i], words['par_num'][i], words['line_num'][i])
+        left, top = words['left'][i], words['top'][i]
+        right, bottom = left + words['width'][i], top + words['height'][i]
+        line = lines.get(key)
+        if line is None:
+            lines[key] = {'text': text, 'left': left, 'top': top, 'right': right, 'bottom': bottom}
+        else:
+            line['text'] += ' ' + text
+            line['left'], line['top'] = min(line['left'], left), min(line['top'], top)
+            line['right'], line['bottom'] = max(line['right'], right), max(line['bottom'], bottom)
+    return [{'text': line['text'], 'left': line['left'], 'top': line['top'],
+             'width': line['right'] - line['left'], 'height': line['bottom'] - line['top']}
+            for line in lines.values()]
+
+def page_text(lines):
+    """Return the plain text of recognized lines, one per line, for the search index"""
+    return '\n'.join(line['text'] for line in lines or [])
+
+class OCRPool:
+    """Recognize frames on a pool of threads, away from the capture
+
+    A capture hands each frame over with submit() as it is written and collects the text
+    with result() when it finishes the PDF, by which time most of it is done. At most
+    max_pending frames wait at once; submit() turns the rest away (counted as skipped)
+    rather than let memory grow with a backlog, unless asked to wait for room.
+    """
+
+    def __init__(self, workers=DEFAULT_OCR_WORKERS, language=DEFAULT_OCR_LANGUAGE, max_pending=DEFAULT_OCR_BACKLOG,
+                 metrics=None):
+        self.workers = workers
+        self.language = language
+        self.metrics = metrics
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ocr')
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        # key -> Future of the recognized lines
+        self.futures = {}
+        self.recognized = 0
+        self.skipped = 0
+        self.failed = 0
+
+    @classmethod
+    def from_args(cls, args, metrics=None):
+        """Build the OCR pool of a capture from build_parser() settings; None without --ocr"""
+        if not args.ocr:
+            return None
+        return cls(workers=args.ocr_workers, language=args.ocr_language, metrics=metrics)
+
+    def submit(self, key, data, wait=False):
+        """Queue encoded image bytes for recognition under key; returns False if the backlog is full
+
+        data must stay valid until it is recognized, so pass a copy rather than a view of a spool.
+        """
+        if not self.slots.acquire(blocking=wait):
+            self.skipped += 1
+            return False
+        future = self.executor.submit(self._recognize, data)
+        with self.lock:
+            self.futures[key] = future
+        return True
+
+    def _recognize(self, data):
+        started = time.perf_counter()
+        try:
+            lines = recognize(data, self.language)
+            self.recognized += 1
+            if self.metrics is not None:
+                self.metrics.observe('snip_stage_seconds', time.perf_counter() - started, stage='ocr')
+            return lines
+        except Exception as e:
+            self.failed += 1
+            print(f"Error recognizing text: {str(e)}")
+            return None
+        finally:
+            self.slots.release()
+
+    def done(self, key):
+        """Whether recognition under key has finished, or was never queued"""
+        with self.lock:
+            future = self.futures.get(key)
+        return future is None or future.done()
+
+    def result(self, key, timeout=None):
+        """Wait for the lines recognized under key and forget them; None if it was skipped or failed"""
+        with self.lock:
+            future = self.futures.pop(key, None)
+        if future is None:
+            return None
+        return future.result(timeout=timeout)
+
+    def recognize_ahead(self, items, read):
+        """Yield (item, lines) in order, keeping up to two images per worker in recognition
+
+        read(item) returns the encoded image bytes of an item, or None to leave it without
+        text. Used to add text to a PDF built in one pass, where no page may go without it.
+        """
+        # Keys of this pass, which can't clash with those of frames submitted meanwhile
+        batch = object()
+        pending = deque()
+        for index, item in enumerate(items):
+            data = read(item)
+            if data is not None:
+                self.submit((batch, index), data, wait=True)
+            pending.append((index, item))
+            if len(pending) > self.workers * 2:
+                done_index, done_item = pending.popleft()
+                yield done_item, self.result((batch, done_index))
+        while pending:
+            done_index, done_item = pending.popleft()
+            yield done_item, self.result((batch, done_index))
+
+    def summary(self):
+        return f"OCR: {self.recognized} frames recognized, {self.skipped} skipped (backlog full), {self.failed} failed"
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        with self.lock:
+            self.futures.clear()
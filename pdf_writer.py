@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+import os
+import re
+import struct
+
+# Page geometry, in millimetres, matching the FPDF defaults used by utils.create_pdf_with_fpdf
+PAGE_SIZES_MM = {
+    'L': (297.0, 210.0),  # A4 landscape
+    'P': (210.0, 297.0)   # A4 portrait
+}
+PAGE_MARGIN_MM = 10
+CAPTION_FONT_SIZE = 10
+MM_TO_PT = 72 / 25.4
+
+# Object numbers reserved for the page tree and catalog, which are only written when the document is finished
+PAGES_OBJ = 1
+CATALOG_OBJ = 2
+FONT_OBJ = 3
+
+# Helvetica glyph widths (1/1000 em) for printable ASCII, used to centre captions
+HELVETICA_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584
+]
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_COLOR_SPACES = {0: ('/DeviceGray', 1), 2: ('/DeviceRGB', 3)}
+JPEG_COLOR_SPACES = {1: '/DeviceGray', 3: '/DeviceRGB', 4: '/DeviceCMYK'}
+
+def text_width_mm(text, font_size=CAPTION_FONT_SIZE):
+    """Return the width of a Helvetica string in millimetres"""
+    units = sum(HELVETICA_WIDTHS[ord(c) - 32] if 32 <= ord(c) <= 126 else 556 for c in text)
+    return units * font_size / 1000 / MM_TO_PT
+
+def escape_pdf_string(text):
+    """Escape a string for use inside a PDF literal string"""
+    text = text.encode('latin-1', 'replace').decode('latin-1')
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def decode_image(data):
+    """Decode encoded image bytes to a BGR array with OpenCV"""
+    import cv2
+    import numpy as np
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image")
+    return img
+
+def load_png(data):
+    """Parse PNG bytes and return (width, height, image dictionary entries, compressed data) without decoding pixels"""
+    if bytes(data[:8]) != PNG_SIGNATURE:
+        raise ValueError("Not a PNG file")
+
+    pos = len(PNG_SIGNATURE)
+    idat = []
+    width = height = bit_depth = color_type = interlace = None
+    while pos < len(data):
+        length, chunk_type = struct.unpack('>I4s', data[pos:pos + 8])
+        chunk = data[pos + 8:pos + 8 + length]
+        if chunk_type == b'IHDR':
+            width, height, bit_depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', chunk[:13])
+        elif chunk_type == b'IDAT':
+            idat.append(chunk)
+        elif chunk_type == b'IEND':
+            break
+        pos += 12 + length
+
+    if color_type not in PNG_COLOR_SPACES or bit_depth != 8 or interlace != 0:
+        return None
+    color_space, colors = PNG_COLOR_SPACES[color_type]
+
+    # The zlib stream inside IDAT is valid FlateDecode data once the PNG predictor is declared
+    entries = (f"/ColorSpace {color_space} /BitsPerComponent 8 /Filter /FlateDecode "
+               f"/DecodeParms << /Predictor 15 /Colors {colors} /BitsPerComponent 8 /Columns {width} >>")
+    return width, height, entries, b''.join(idat)
+
+def load_png_decoded(data):
+    """Decode a PNG variant that cannot be passed through (alpha, 16-bit, interlaced) and re-compress it"""
+    import zlib
+    import cv2
+    img = decode_image(data)
+    height, width = img.shape[:2]
+    rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    entries = "/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /FlateDecode"
+    return width, height, entries, zlib.compress(rgb.tobytes())
+
+def load_jpeg(data):
+    """Parse JPEG bytes and return (width, height, image dictionary entries, compressed data) without decoding pixels"""
+    if bytes(data[:2]) != b'\xff\xd8':
+        raise ValueError("Not a JPEG file")
+
+    pos = 2
+    while pos < len(data):
+        while data[pos] == 0xFF and data[pos + 1] == 0xFF:
+            pos += 1
+        marker = data[pos + 1]
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        # SOF0-SOF15 hold the frame size (excluding DHT, JPG and DAC markers)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width, components = struct.unpack('>HHB', data[pos + 5:pos + 10])
+            color_space = JPEG_COLOR_SPACES.get(components, '/DeviceRGB')
+            entries = f"/ColorSpace {color_space} /BitsPerComponent 8 /Filter /DCTDecode"
+            return width, height, entries, data
+        pos += 2 + length
+    raise ValueError("No frame header found in JPEG")
+
+def load_webp(data, jpeg_quality=90):
+    """PDF has no WebP filter, so decode a WebP and embed it as a JPEG stream"""
+    import cv2
+    img = decode_image(data)
+    height, width = img.shape[:2]
+    ok, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+    if not ok:
+        raise ValueError("Could not re-encode WebP image")
+    entries = "/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /DCTDecode"
+    return width, height, entries, encoded.tobytes()
+
+def load_image_data(data, name='image'):
+    """Return (width, height, image dictionary entries, compressed data) for PNG, JPEG or WebP bytes
+
+    PNG and JPEG data is embedded as-is; only WebP and unusual PNG variants are decoded.
+    data may be a memoryview (e.g. of a frame spool), which is not copied for JPEG.
+    """
+    header = bytes(data[:12])
+    if header.startswith(PNG_SIGNATURE):
+        return load_png(data) or load_png_decoded(data)
+    if header.startswith(b'\xff\xd8'):
+        return load_jpeg(data)
+    if header.startswith(b'RIFF') and header[8:12] == b'WEBP':
+        return load_webp(data)
+    raise ValueError(f"Unsupported image format: {name}")
+
+def load_image(img_path):
+    """Return (width, height, image dictionary entries, compressed data) for a PNG, JPEG or WebP file"""
+    with open(img_path, 'rb') as f:
+        return load_image_data(f.read(), img_path)
+
+def probe_image_size(img_path):
+    """Return (width, height) of a PNG, JPEG or WebP file by reading only its header"""
+    with open(img_path, 'rb') as f:
+        header = f.read(64)
+        if header.startswith(PNG_SIGNATURE) and header[12:16] == b'IHDR':
+            return struct.unpack('>II', header[16:24])
+        if header.startswith(b'RIFF') and header[8:12] == b'WEBP':
+            chunk = header[12:16]
+            if chunk == b'VP8 ':
+                width, height = struct.unpack('<HH', header[26:30])
+                return width & 0x3FFF, height & 0x3FFF
+            if chunk == b'VP8L':
+                bits = struct.unpack('<I', header[21:25])[0]
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b'VP8X':
+                return (int.from_bytes(header[24:27], 'little') + 1, int.from_bytes(header[27:30], 'little') + 1)
+        if header.startswith(b'\xff\xd8'):
+            # Walk the JPEG markers up to the frame header, seeking past each segment
+            f.seek(2)
+            while True:
+                marker = f.read(2)
+                if len(marker) < 2 or marker[0] != 0xFF:
+                    break
+                if marker[1] == 0xFF:
+                    f.seek(-1, 1)
+                    continue
+                length = struct.unpack('>H', f.read(2))[0]
+                if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+                    height, width = struct.unpack('>xHH', f.read(5))
+                    return width, height
+                f.seek(length - 2, 1)
+    raise ValueError(f"Could not read image size from header: {img_path}")
+
+def layout_page(width, height):
+    """Return (orientation, x, y, w, h) in millimetres for an image placed like create_pdf_with_fpdf does"""
+    orientation = 'L' if width > height else 'P'
+    page_width, page_height = PAGE_SIZES_MM[orientation]
+
+    max_width = page_width - 2 * PAGE_MARGIN_MM
+    max_height = page_height - 2 * PAGE_MARGIN_MM - 10  # Extra 10 for timestamp text
+    scale = min(max_width / width, max_height / height)
+
+    new_width = width * scale
+    new_height = height * scale
+    x = PAGE_MARGIN_MM + (max_width - new_width) / 2
+    y = PAGE_MARGIN_MM
+    return orientation, x, y, new_width, new_height
+
+def place_text_lines(lines, image_width, x, y, w):
+    """Lay recognized lines of text over an image placed at x, y with width w (millimetres from the top-left)
+
+    Returns (text, left, baseline, font size in points, horizontal scaling in percent) per
+    line, sized and stretched so the Helvetica text covers the box it was recognized in;
+    drawn invisibly, it makes the page searchable and lets its text be selected and copied.
+    """
+    scale = w / image_width
+    placed = []
+    for line in lines:
+        # The standard fonts only cover Latin-1
+        text = line['text'].encode('latin-1', 'replace').decode('latin-1')
+        height = line['height'] * scale
+        font_size = height * MM_TO_PT
+        natural_width = text_width_mm(text, font_size)
+        if not text or natural_width <= 0:
+            continue
+        # The box reaches from the tallest ascender to the lowest descender
+        baseline = y + (line['top'] + line['height']) * scale - 0.2 * height
+        placed.append((text, x + line['left'] * scale, baseline, font_size, 100 * line['width'] * scale / natural_width))
+    return placed
+
+class IncrementalPDFWriter:
+    """Write a PDF one page at a time, flushing each page to disk as it is added
+
+    Pages go to '<pdf_path>.part' while the session runs; close() writes the page tree,
+    cross-reference table and trailer, then renames the file into place. If the process
+    dies first, recover_partial_pdf() turns the .part file into a readable document.
+    """
+
+    def __init__(self, pdf_path):
+        self.pdf_path = pdf_path
+        self.part_path = pdf_path + '.part'
+        self.offsets = {}
+        self.page_objs = []
+        # (image object, content object, image width, image height) of each page, for set_page_text()
+        self.page_layouts = []
+        self.next_obj = FONT_OBJ + 1
+        self.file = open(self.part_path, 'wb')
+        self.file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self._write_obj(FONT_OBJ, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+        self.file.flush()
+
+    @property
+    def page_count(self):
+        return len(self.page_objs)
+
+    @property
+    def size(self):
+        """Bytes written to the partial document so far"""
+        return self.file.tell()
+
+    def _write_obj(self, num, body, stream=None):
+        self.offsets[num] = self.file.tell()
+        self.file.write(f"{num} 0 obj\n".encode('ascii'))
+        self.file.write(body)
+        if stream is not None:
+            self.file.write(b'\nstream\n')
+            self.file.write(stream)
+            self.file.write(b'\nendstream')
+        self.file.write(b'\nendobj\n')
+
+    def _alloc_obj(self):
+        num = self.next_obj
+        self.next_obj += 1
+        return num
+
+    def add_page(self, img_path, caption=None):
+        """Append a page holding the image at img_path, with an optional caption below it"""
+        self.add_page_data(load_image(img_path), caption)
+
+    def add_spooled_page(self, spool, entry, caption=None):
+        """Append a page holding a frame from a FrameSpool, read through its memory map"""
+        self.add_page_data(load_image_data(spool.read(entry), spool.frame_name(entry)), caption)
+
+    def add_page_data(self, image, caption=None):
+        """Append a page for an image loaded by load_image or load_image_data"""
+        width, height, entries, data = image
+        orientation, x, y, w, h = layout_page(width, height)
+        page_height = PAGE_SIZES_MM[orientation][1]
+
+        # Build the page content in PDF points, with the origin at the bottom-left corner
+        k = MM_TO_PT
+        content = (f"q {w * k:.2f} 0 0 {h * k:.2f} {x * k:.2f} {(page_height - y - h) * k:.2f} cm /Im0 Do Q\n")
+        if caption:
+            text_x = x + (w - text_width_mm(caption)) / 2
+            # Vertically centre the text in a 10mm cell placed 5mm below the image, as FPDF's cell() does
+            baseline = y + h + 5 + 5 + 0.3 * CAPTION_FONT_SIZE / k
+            content += (f"BT /F1 {CAPTION_FONT_SIZE} Tf {text_x * k:.2f} {(page_height - baseline) * k:.2f} Td "
+                        f"({escape_pdf_string(caption)}) Tj ET\n")
+        content = content.encode('latin-1')
+
+        image_obj = self._alloc_obj()
+        content_obj = self._alloc_obj()
+        page_obj = self._alloc_obj()
+
+        self._write_obj(image_obj, f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                                   f"{entries} /Length {len(data)} >>".encode('ascii'), data)
+        self._write_obj(content_obj, f"<< /Length {len(content)} >>".encode('ascii'), content)
+        # The page object goes last so a truncated file never references a missing image or content stream
+        self._write_page(page_obj, orientation, image_obj, f"{content_obj} 0 R")
+        self.page_objs.append(page_obj)
+        self.page_layouts.append((image_obj, content_obj, width, height))
+        self.file.flush()
+
+    def _write_page(self, page_obj, orientation, image_obj, contents):
+        page_width, page_height = PAGE_SIZES_MM[orientation]
+        k = MM_TO_PT
+        self._write_obj(page_obj, (f"<< /Type /Page /Parent {PAGES_OBJ} 0 R "
+                                   f"/MediaBox [0 0 {page_width * k:.2f} {page_height * k:.2f}] "
+                                   f"/Resources << /Font << /F1 {FONT_OBJ} 0 R >> /XObject << /Im0 {image_obj} 0 R >> >> "
+                                   f"/Contents {contents} >>").encode('ascii'))
+
+    def set_page_text(self, index, lines):
+        """Lay lines recognized by ocr.recognize over page index as invisible, searchable text
+
+        The page was flushed long ago, so its text goes into a second content stream and a
+        new version of the page object, with the same number, refers to both; the
+        cross-reference table written by close() points at the newest version.
+        """
+        image_obj, content_obj, width, height = self.page_layouts[index]
+        orientation, x, y, w, h = layout_page(width, height)
+        page_height = PAGE_SIZES_MM[orientation][1]
+        placed = place_text_lines(lines, width, x, y, w)
+        if not placed:
+            return
+
+        # Text rendering mode 3 draws nothing; Tz stretches each line across its box
+        k = MM_TO_PT
+        content = "BT 3 Tr\n" + ''.join(
+            f"/F1 {font_size:.2f} Tf {stretch:.1f} Tz 1 0 0 1 {left * k:.2f} {(page_height - baseline) * k:.2f} Tm "
+            f"({escape_pdf_string(text)}) Tj\n" for text, left, baseline, font_size, stretch in placed) + "ET\n"
+        content = content.encode('latin-1')
+        text_obj = self._alloc_obj()
+        self._write_obj(text_obj, f"<< /Length {len(content)} >>".encode('ascii'), content)
+        self._write_page(self.page_objs[index], orientation, image_obj, f"[{content_obj} 0 R {text_obj} 0 R]")
+        self.file.flush()
+
+    def close(self):
+        """Write the page tree and trailer, then move the finished PDF into place"""
+        write_trailer(self.file, self.offsets, self.page_objs)
+        self.file.close()
+        os.replace(self.part_path, self.pdf_path)
+        return self.pdf_path
+
+    def abort(self):
+        """Discard the partial document"""
+        self.file.close()
+        if os.path.exists(self.part_path):
+            os.remove(self.part_path)
+
+def write_trailer(f, offsets, page_objs):
+    """Write the page tree, catalog, cross-reference table and trailer at the current file position"""
+    kids = ' '.join(f"{num} 0 R" for num in page_objs)
+    offsets[PAGES_OBJ] = f.tell()
+    f.write(f"{PAGES_OBJ} 0 obj\n<< /Type /Pages /Kids [{kids}] /Count {len(page_objs)} >>\nendobj\n".encode('ascii'))
+    offsets[CATALOG_OBJ] = f.tell()
+    f.write(f"{CATALOG_OBJ} 0 obj\n<< /Type /Catalog /Pages {PAGES_OBJ} 0 R >>\nendobj\n".encode('ascii'))
+
+    size = max(offsets) + 1
+    xref_offset = f.tell()
+    lines = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+    for num in range(1, size):
+        if num in offsets:
+            lines.append(f"{offsets[num]:010d} 00000 n \n")
+        else:
+            lines.append("0000000000 65535 f \n")
+    lines.append(f"trailer\n<< /Size {size} /Root {CATALOG_OBJ} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n")
+    f.write(''.join(lines).encode('ascii'))
+    f.flush()
+
+OBJ_PATTERN = re.compile(rb'(\d+) 0 obj\n')
+LENGTH_PATTERN = re.compile(rb'/Length (\d+)')
+
+def recover_partial_pdf(part_path, pdf_path=None):
+    """Finish a .part file left behind by a crashed session, keeping every complete page
+
+    Returns the path of the recovered PDF and the number of pages it holds.
+    """
+    if pdf_path is None:
+        pdf_path = part_path[:-len('.part')] if part_path.endswith('.part') else part_path + '.recovered.pdf'
+
+    with open(part_path, 'rb') as f:
+        data = f.read()
+
+    # Walk the objects in order, skipping over stream data by its declared length;
+    # each page object is written after its image and content stream, and again after
+    # its text layer, the later version replacing the earlier
+    offsets = {}
+    page_objs = []
+    seen_pages = set()
+    end = 0
+    pos = data.find(b'\n', data.find(b'\n') + 1) + 1
+    while True:
+        match = OBJ_PATTERN.match(data, pos)
+        if not match:
+            break
+        num = int(match.group(1))
+        if num in (PAGES_OBJ, CATALOG_OBJ):
+            # The trailer was already written, so the file is complete
+            break
+        body_end = match.end()
+        is_page = data.startswith(b'<< /Type /Page ', body_end)
+        if num != FONT_OBJ and not is_page:
+            # Image and content stream objects
+            length = LENGTH_PATTERN.search(data, body_end)
+            if not length:
+                break
+            stream_start = data.find(b'\nstream\n', body_end) + len(b'\nstream\n')
+            body_end = stream_start + int(length.group(1)) + len(b'\nendstream')
+        else:
+            body_end = data.find(b'\nendobj\n', body_end)
+        if not data.startswith(b'\nendobj\n', body_end):
+            break
+        offsets[num] = match.start()
+        pos = body_end + len(b'\nendobj\n')
+        if is_page:
+            if num not in seen_pages:
+                seen_pages.add(num)
+                page_objs.append(num)
+            end = pos
+        elif num == FONT_OBJ:
+            end = pos
+
+    if FONT_OBJ not in offsets:
+        raise ValueError(f"No recoverable content in {part_path}")
+
+    # Drop any objects belonging to a page that was only partly written
+    offsets = {num: offset for num, offset in offsets.items() if offset < end}
+    with open(pdf_path, 'wb') as f:
+        f.write(data[:end])
+        write_trailer(f, offsets, page_objs)
+    if os.path.abspath(pdf_path) != os.path.abspath(part_path):
+        os.remove(part_path)
+    return pdf_path, len(page_objs)
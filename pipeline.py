@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+import queue
+import threading
+import time
+from datetime import datetime
+import utils
+from metrics import Metrics
+
+DROP_POLICIES = ['block', 'drop']
+
+class FramePipeline:
+    """Grab frames on the caller's thread and encode/write them on a pool of worker threads
+
+    Frames are captured into a fixed pool of canvases. When every canvas is still waiting
+    to be encoded, the 'block' policy makes submit() wait for one (backpressure) while the
+    'drop' policy skips the frame. Encoded frames are appended to the FrameSpool in capture
+    order, so frame IDs follow capture order, and each spool entry is handed to on_frame.
+    Frame outcomes, encode and spool write times and spooled bytes go into metrics. A
+    scheduler (scheduler.AdaptiveScheduler), if given, sees every grabbed frame, duplicates
+    included, to pick the interval before the next grab.
+    """
+
+    def __init__(self, engine, spool, quality='720p', workers=2, queue_size=4,
+                 drop_policy='block', deduplicator=None, on_frame=None, encoding=None, verbose=True,
+                 metrics=None, scheduler=None):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Invalid drop policy: {drop_policy}")
+
+        self.engine = engine
+        self.spool = spool
+        self.quality = quality
+        self.drop_policy = drop_policy
+        self.deduplicator = deduplicator
+        self.scheduler = scheduler
+        # The last decision of the scheduler, for the capture loop to report
+        self.last_decision = None
+        self.on_frame = on_frame
+        self.encoding = encoding or utils.EncodingPolicy()
+        # Per-frame messages are noise at sub-second rates
+        self.verbose = verbose
+        self.metrics = metrics if metrics is not None else Metrics()
+
+        # One canvas per queue slot plus one per worker, allocated once up front (or on first
+        # use when the output size follows the captured area)
+        self.free_buffers = queue.Queue()
+        for _ in range(queue_size + workers):
+            self.free_buffers.put(engine.new_canvas(quality))
+        self.jobs = queue.Queue()
+
+        # Workers finish out of order, so completed frames wait here until their turn
+        self.commit_lock = threading.Lock()
+        self.pending = {}
+        self.next_seq = 0
+        self.next_commit = 0
+
+        self.captured = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+
+        self.workers = []
+        for i in range(workers):
+            worker = threading.Thread(target=self._worker, name=f"frame-writer-{i}")
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self):
+        """Grab one frame and queue it for encoding
+
+        Returns True if the frame was queued, False if it was dropped and None if it was a near-duplicate.
+        """
+        self.last_decision = None
+        try:
+            buffer = self.free_buffers.get(block=self.drop_policy == 'block')
+        except queue.Empty:
+            self.dropped += 1
+            self.metrics.inc('snip_frames_total', result='dropped')
+            if self.verbose:
+                print(f"Screenshot dropped at {datetime.now().strftime('%H:%M:%S')} (encoder queue full)")
+            return False
+
+        try:
+            # The engine hands back a new buffer if the output size changed; it replaces the old one in the pool
+            buffer = self.engine.capture(self.quality, out=buffer)
+        except Exception:
+            self.free_buffers.put(buffer)
+            raise
+
+        if self.scheduler is not None:
+            started = time.perf_counter()
+            self.last_decision = self.scheduler.observe(buffer)
+            self.metrics.observe('snip_stage_seconds', time.perf_counter() - started, stage='activity')
+
+        # Skip frames that are nearly identical to the last kept one
+        if self.deduplicator is not None and self.deduplicator.is_duplicate(buffer):
+            self.free_buffers.put(buffer)
+            self.metrics.inc('snip_frames_total', result='skipped')
+            if self.verbose:
+                print(f"Screenshot skipped at {datetime.now().strftime('%H:%M:%S')} (no significant change)")
+            return None
+
+        captured_at = datetime.now()
+        self.captured += 1
+        self.metrics.inc('snip_frames_total', result='captured')
+        self.jobs.put((self.next_seq, captured_at, buffer))
+        self.next_seq += 1
+        return True
+
+    def _worker(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            seq, captured_at, buffer = job
+            try:
+                # cv2.imencode releases the GIL, so several workers encode in parallel
+                started = time.perf_counter()
+                image_format, encoded = self.encoding.encode(buffer)
+                self.metrics.observe('snip_stage_seconds', time.perf_counter() - started, stage='encode')
+                height, width = buffer.shape[:2]
+                frame = (encoded, width, height, captured_at, image_format)
+            except Exception as e:
+                print(f"Error encoding screenshot captured at {captured_at.strftime('%H:%M:%S')}: {str(e)}")
+                frame = None
+            finally:
+                self.free_buffers.put(buffer)
+            self._commit(seq, frame)
+
+    def _commit(self, seq, frame):
+        with self.commit_lock:
+            self.pending[seq] = frame
+            while self.next_commit in self.pending:
+                frame = self.pending.pop(self.next_commit)
+                self.next_commit += 1
+                if frame is None:
+                    self.failed += 1
+                    self.metrics.inc('snip_frames_total', result='failed')
+                    continue
+                # Appending in sequence order keeps frame IDs in capture order
+                encoded, width, height, captured_at, image_format = frame
+                try:
+                    started = time.perf_counter()
+                    entry = self.spool.append(encoded, width, height, captured_at, self.quality, image_format)
+                    self.metrics.observe('snip_stage_seconds', time.perf_counter() - started, stage='spool_write')
+                except Exception as e:
+                    print(f"Error writing screenshot to the spool: {str(e)}")
+                    self.failed += 1
+                    self.metrics.inc('snip_frames_total', result='failed')
+                    continue
+                self.written += 1
+                self.metrics.inc('snip_frames_total', result='written')
+                self.metrics.inc('snip_spool_bytes_total', entry['length'])
+                if self.verbose:
+                    print(f"Screenshot captured at {captured_at.strftime('%H:%M:%S')} ({self.quality}, frame {entry['id']})")
+                if self.on_frame is not None:
+                    try:
+                        self.on_frame(entry)
+                    except Exception as e:
+                        print(f"Error handling frame {entry['id']}: {str(e)}")
+
+    def close(self):
+        """Wait for queued frames to be written, then stop the workers"""
+        for _ in self.workers:
+            self.jobs.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
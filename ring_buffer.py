@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+import math
+import threading
+import time
+from datetime import datetime
+from startup import lazy_import
+import utils
+import pdf_writer
+import capture_engine
+
+np = lazy_import('numpy')
+
+DEFAULT_RING_SECONDS = 30
+DEFAULT_RING_FPS = 2
+DEFAULT_RING_QUALITY = '480p'
+
+class FrameRing:
+    """The most recent frames of a continuous background capture, in one preallocated block
+
+    Frames are grabbed and scaled straight into slots of a (capacity, height, width, 3)
+    array, so recording allocates nothing per frame and the memory is fixed (and touched)
+    up front. quality must be a fixed size (a preset or WIDTHxHEIGHT); frames are
+    letterboxed into it. recent() copies frames out under the lock, so a save never sees
+    a slot being overwritten.
+    """
+
+    def __init__(self, seconds=DEFAULT_RING_SECONDS, fps=DEFAULT_RING_FPS, quality=DEFAULT_RING_QUALITY,
+                 backend='auto', target=None):
+        kind, size = capture_engine.parse_quality(quality)
+        if kind != 'box':
+            raise ValueError("The ring buffer needs a fixed quality: a preset or WIDTHxHEIGHT")
+        if seconds <= 0 or fps <= 0:
+            raise ValueError("Ring buffer seconds and fps must be greater than 0")
+        self.seconds = seconds
+        self.fps = fps
+        self.quality = quality
+        self.backend = backend
+        self.target = target
+        self.capacity = math.ceil(seconds * fps)
+        width, height = size
+        self.frames = np.empty((self.capacity, height, width, 3), dtype=np.uint8)
+        # Commit the pages now rather than on first write
+        self.frames.fill(0)
+        # Capture time (epoch seconds) of each slot; NaN while empty or being written
+        self.times = np.full(self.capacity, np.nan)
+        self.next_slot = 0
+        self.recorded = 0
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.error = None
+
+    @property
+    def memory_mb(self):
+        return self.frames.nbytes / (1024 * 1024)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._record, name='frame-ring')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _record(self):
+        # The engine is created on this thread, since some grabbers are bound to the thread that made them
+        try:
+            engine = capture_engine.CaptureEngine(backend=self.backend, target=self.target)
+        except Exception as e:
+            self.error = str(e)
+            print(f"Error starting the ring buffer: {str(e)}")
+            return
+        interval = 1 / self.fps
+        start_time = time.monotonic()
+        shot = 0
+        try:
+            while not self.stop_event.is_set():
+                slot = self.next_slot
+                with self.lock:
+                    self.times[slot] = np.nan
+                captured_at = time.time()
+                try:
+                    # A letterboxed fixed quality always fits the slot, so the engine writes straight into it
+                    engine.capture(self.quality, out=self.frames[slot], fit='letterbox')
+                    with self.lock:
+                        self.times[slot] = captured_at
+                        self.next_slot = (slot + 1) % self.capacity
+                        self.recorded += 1
+                except Exception as e:
+                    self.error = str(e)
+                # Keep to the rate boundaries; a slow grab skips ahead rather than bunching up
+                shot = max(shot + 1, math.floor((time.monotonic() - start_time) / interval))
+                self.stop_event.wait(max(0, start_time + shot * interval - time.monotonic()))
+        finally:
+            engine.close()
+
+    def recent(self, seconds=None):
+        """Return [(capture datetime, BGR frame copy)] from the last seconds (default: all), oldest first"""
+        cutoff = time.time() - seconds if seconds is not None else -math.inf
+        with self.lock:
+            # Slots from oldest to newest
+            order = [(self.next_slot + i) % self.capacity for i in range(self.capacity)]
+            slots = [slot for slot in order if not math.isnan(self.times[slot]) and self.times[slot] >= cutoff]
+            return [(datetime.fromtimestamp(self.times[slot]), self.frames[slot].copy()) for slot in slots]
+
+    def to_dict(self):
+        with self.lock:
+            filled = int(np.count_nonzero(~np.isnan(self.times)))
+            oldest = np.nanmin(self.times) if filled else None
+        return {
+            'seconds': self.seconds,
+            'fps': self.fps,
+            'quality': self.quality,
+            'capacity': self.capacity,
+            'frames': filled,
+            'recorded': self.recorded,
+            'covers_seconds': round(float(time.time() - oldest), 1) if oldest is not None else 0,
+            'memory_mb': round(self.memory_mb, 1),
+            'error': self.error
+        }
+
+def save_frames_to_spool(frames, spool, quality, encoding=None):
+    """Encode ring frames into a FrameSpool (a session's manual screenshots); returns their entries"""
+    encoding = encoding or utils.EncodingPolicy()
+    entries = []
+    for captured_at, frame in frames:
+        image_format, encoded = encoding.encode(frame)
+        height, width = frame.shape[:2]
+        entries.append(spool.append(encoded, width, height, captured_at, quality, image_format))
+    return entries
+
+def save_frames_to_pdf(frames, pdf_path, quality, encoding=None):
+    """Write ring frames to a new PDF, one captioned page each; returns its path"""
+    encoding = encoding or utils.EncodingPolicy()
+    writer = pdf_writer.IncrementalPDFWriter(pdf_path)
+    try:
+        for i, (captured_at, frame) in enumerate(frames):
+            image_format, encoded = encoding.encode(frame)
+            entry = {'captured_at': captured_at.isoformat(timespec='milliseconds'), 'quality': quality}
+            image = pdf_writer.load_image_data(encoded, f"{pdf_path}#{i}")
+            writer.add_page_data(image, caption=utils.screenshot_caption(None, entry))
+    except Exception:
+        writer.abort()
+        raise
+    return writer.close()
@@ -4,5 +4,5 @@ echo.
 echo This window will remain open while the server is running.
 echo To stop the server, press Ctrl+C or close this window.
 echo.
-python server.py
+python server.py --production
 pause
\ No newline at end of file
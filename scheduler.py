@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+import json
+import time
+import utils
+from startup import lazy_import
+
+cv2 = lazy_import('cv2')
+
+# How screenshots are timed: on fixed --rate boundaries, or sooner or later depending on screen activity
+SCHEDULES = ['fixed', 'adaptive']
+# Mean change between consecutive frames, in percent of full scale, that counts as activity;
+# below a quarter of it the screen counts as static
+DEFAULT_ACTIVITY_THRESHOLD = 2.0
+# Interval multipliers applied on activity and on a static screen: quick to follow a burst of
+# activity, slow to give up on it when the screen pauses
+SPEED_UP = 0.25
+BACK_OFF = 1.5
+
+class AdaptiveScheduler:
+    """Choose the interval before the next grab from how much the screen changed since the last one
+
+    Each grabbed frame is compared with the previous one on a small grayscale thumbnail of
+    a sparse sample of its pixels (activity_signature), a fraction of a millisecond even
+    at 4K. A change of at least activity_threshold percent shortens the interval
+    (speed_up), a change below a quarter of it lengthens it (back_off), and anything
+    between holds it, always within min_interval..max_interval. Every decision is kept in the counters and, given log_path,
+    appended to that file as a JSON line, so thresholds can be tuned from real sessions.
+    """
+
+    def __init__(self, interval, min_interval, max_interval, activity_threshold=DEFAULT_ACTIVITY_THRESHOLD,
+                 speed_up=SPEED_UP, back_off=BACK_OFF, log_path=None, signature_size=(32, 18)):
+        if not 0 < min_interval <= max_interval:
+            raise ValueError("Intervals must be greater than 0, with the minimum no larger than the maximum")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min(max(interval, min_interval), max_interval)
+        self.activity_threshold = activity_threshold
+        self.idle_threshold = activity_threshold / 4
+        self.speed_up = speed_up
+        self.back_off = back_off
+        self.signature_size = signature_size
+        self.last_signature = None
+        self.last_change = None
+        self.decisions = {'speed_up': 0, 'back_off': 0, 'hold': 0}
+        self.shortest = self.longest = self.interval
+        self.interval_total = 0.0
+        self.log = open(log_path, 'a', encoding='utf-8') if log_path else None
+
+    @classmethod
+    def from_args(cls, args):
+        """Build the scheduler of a capture from build_parser() settings; None for a fixed schedule"""
+        if args.schedule != 'adaptive':
+            return None
+        min_interval, max_interval = adaptive_intervals(args)
+        return cls(args.rate, min_interval, max_interval, activity_threshold=args.activity_threshold,
+                   log_path=args.schedule_log)
+
+    def observe(self, frame):
+        """Measure how much frame changed since the last grabbed one and pick the next interval
+
+        Returns the decision: a dict with the change (None for the first frame), the action
+        (speed_up, back_off or hold), the previous and the new interval.
+        """
+        signature = activity_signature(frame, self.signature_size)
+        change = utils.frame_difference(signature, self.last_signature) if self.last_signature is not None else None
+        self.last_signature = signature
+        self.last_change = change
+
+        previous = self.interval
+        if change is None or self.idle_threshold <= change < self.activity_threshold:
+            action = 'hold'
+        elif change >= self.activity_threshold:
+            action = 'speed_up'
+            self.interval = max(self.min_interval, self.interval * self.speed_up)
+        else:
+            action = 'back_off'
+            self.interval = min(self.max_interval, self.interval * self.back_off)
+        self.decisions[action] += 1
+        self.shortest = min(self.shortest, self.interval)
+        self.longest = max(self.longest, self.interval)
+        self.interval_total += self.interval
+
+        decision = {
+            'time': round(time.time(), 3),
+            'change': round(change, 3) if change is not None else None,
+            'action': action,
+            'previous_interval': round(previous, 3),
+            'interval': round(self.interval, 3)
+        }
+        if self.log is not None:
+            self.log.write(json.dumps(decision) + '\n')
+            self.log.flush()
+        return decision
+
+    @property
+    def observed(self):
+        return sum(self.decisions.values())
+
+    def to_dict(self):
+        return {
+            'interval': round(self.interval, 3),
+            'min_interval': self.min_interval,
+            'max_interval': self.max_interval,
+            'activity_threshold': self.activity_threshold,
+            'last_change': round(self.last_change, 3) if self.last_change is not None else None,
+            'decisions': dict(self.decisions)
+        }
+
+    def summary(self):
+        """One line describing the schedule so far, for the end-of-capture report"""
+        mean = self.interval_total / self.observed if self.observed else self.interval
+        return (f"Adaptive schedule: intervals {self.shortest:.2f}-{self.longest:.2f} seconds (mean {mean:.2f}), "
+                f"{self.decisions['speed_up']} speed-ups, {self.decisions['back_off']} back-offs, "
+                f"{self.decisions['hold']} holds")
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+def adaptive_intervals(args):
+    """Return (min_interval, max_interval) of an adaptive schedule, defaulting to a quarter and four times --rate"""
+    min_interval = args.min_interval if args.min_interval is not None else args.rate / 4
+    max_interval = args.max_interval if args.max_interval is not None else args.rate * 4
+    return min_interval, max_interval
+
+def activity_signature(frame, size=(32, 18)):
+    """Downsample a frame to a small grayscale thumbnail from every few pixels of it
+
+    Coarser than utils.compute_frame_signature, which reads every pixel: about four samples
+    per thumbnail pixel along each side are plenty to tell a busy screen from a static one.
+    """
+    height, width = frame.shape[:2]
+    step = max(1, min(width // size[0], height // size[1]) // 4)
+    thumbnail = cv2.resize(frame[::step, ::step], size, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
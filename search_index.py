@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+import os
+import sqlite3
+import time
+
+# The index lives next to the PDFs it covers, in their output directory
+INDEX_FILENAME = 'search_index.sqlite'
+DEFAULT_SEARCH_LIMIT = 20
+# Words of context around each match in search results
+SNIPPET_WORDS = 12
+
+def index_path(directory):
+    return os.path.join(directory, INDEX_FILENAME)
+
+def connect(directory):
+    """Open (creating if needed) the full-text index of an output directory
+
+    One FTS5 table holds the recognized text of every page, with the session, PDF, page
+    number and capture time stored alongside but not indexed. WAL mode lets searches run
+    while a capture adds pages. Raises RuntimeError if SQLite was built without FTS5.
+    """
+    os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(index_path(directory), timeout=10)
+    connection.execute('PRAGMA journal_mode=WAL')
+    try:
+        connection.execute('CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5('
+                           'text, session_id UNINDEXED, pdf_path UNINDEXED, page UNINDEXED, captured_at UNINDEXED, '
+                           "tokenize='unicode61 remove_diacritics 2')")
+    except sqlite3.OperationalError as e:
+        connection.close()
+        raise RuntimeError(f"The search index needs SQLite with FTS5: {str(e)}")
+    return connection
+
+def add_pages(directory, pdf_path, session_id, pages):
+    """Index the text of a finished PDF or video, replacing anything indexed for it before
+
+    pages is a list of (page number from 1, capture time as an ISO string or None, text);
+    pages without text are left out. Returns the number of pages indexed.
+    """
+    rows = [(text, session_id, os.path.abspath(pdf_path), page, captured_at)
+            for page, captured_at, text in pages if text and text.strip()]
+    connection = connect(directory)
+    try:
+        with connection:
+            connection.execute('DELETE FROM pages WHERE pdf_path = ?', (os.path.abspath(pdf_path),))
+            connection.executemany('INSERT INTO pages (text, session_id, pdf_path, page, captured_at) '
+                                   'VALUES (?, ?, ?, ?, ?)', rows)
+    finally:
+        connection.close()
+    return len(rows)
+
+def quote_terms(query):
+    """Turn free text into an FTS5 query matching every word, whatever punctuation it holds"""
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+def search(directory, query, limit=DEFAULT_SEARCH_LIMIT):
+    """Return (matches, milliseconds taken) for a query over the index of an output directory
+
+    The query uses FTS5 syntax (words, "phrases", prefix*, AND/OR/NOT); anything that
+    doesn't parse as such is searched for word by word. Matches are dicts with the session,
+    PDF, page, capture time and a snippet with the matched words in [brackets], best first.
+    """
+    started = time.perf_counter()
+    if not os.path.exists(index_path(directory)):
+        return [], 0.0
+    connection = connect(directory)
+    try:
+        sql = ('SELECT session_id, pdf_path, page, captured_at, '
+               f"snippet(pages, 0, '[', ']', '...', {SNIPPET_WORDS}), bm25(pages) "
+               'FROM pages WHERE pages MATCH ? ORDER BY bm25(pages) LIMIT ?')
+        try:
+            rows = connection.execute(sql, (query, limit)).fetchall()
+        except sqlite3.OperationalError:
+            rows = connection.execute(sql, (quote_terms(query), limit)).fetchall()
+    finally:
+        connection.close()
+    matches = [{
+        'session_id': session_id,
+        'pdf_path': pdf_path,
+        'page': page,
+        'captured_at': captured_at,
+        'snippet': snippet,
+        'score': round(-score, 3)
+    } for session_id, pdf_path, page, captured_at, snippet, score in rows]
+    return matches, (time.perf_counter() - started) * 1000
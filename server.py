@@ -1,106 +1,283 @@
 #!/usr/bin/env python3
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
+import concurrent.futures
 import threading
-import subprocess
 import os
 import sys
-import signal
 import psutil
+import tempfile
 import time
+import uuid
 import utils
+import sessions
+import session_journal
+import capture_engine
+import metrics
+import events
+import budgets
+import video_export
+import ring_buffer
+import scheduler
+import serving
+import ocr
+import search_index
+import main as capture_main
+import startup
 from datetime import datetime
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-# Get the directory where this script is located
-script_dir = os.path.dirname(os.path.abspath(__file__))
+# How requests are served: SERVER_MODE (development, or production on waitress, also chosen
+# with --production), SERVER_THREADS request threads in production mode, REQUEST_TIMEOUT
+# seconds a request waits for work handed to the capture worker, and MAX_EVENT_STREAMS open
+# /events streams, each of which holds a request thread for as long as it is open
+SERVER_MODE = 'production' if '--production' in sys.argv else os.environ.get('SERVER_MODE', 'development')
+SERVER_THREADS = int(os.environ.get('SERVER_THREADS', serving.DEFAULT_THREADS))
+REQUEST_TIMEOUT = float(os.environ.get('REQUEST_TIMEOUT', serving.DEFAULT_REQUEST_TIMEOUT))
+MAX_EVENT_STREAMS = int(os.environ.get('MAX_EVENT_STREAMS', max(1, SERVER_THREADS // 2)))
+# How long a client turned away from /events waits before reconnecting
+EVENT_RETRY_MILLISECONDS = 5000
 
-# Active capture process
-active_process = None
-process_pid = None
-capture_thread = None
+# Session and PDF job events, streamed to the popup by /events
+event_bus = events.EventBus()
+# Seconds between comments on an idle event stream, so dropped clients are noticed
+EVENT_KEEPALIVE_SECONDS = 15
+# Least time between two PDF progress events of a job
+PDF_PROGRESS_INTERVAL = 0.25
 
-# Store manual screenshots for inclusion in the final PDF
-manual_screenshots = []
-temp_dir_for_manual = None
+# Concurrent capture sessions, each running main.run_capture on its own thread with its own
+# screenshots directory.
+# Limits come from the environment: MAX_CAPTURE_SESSIONS, CAPTURE_CPU_BUDGET (percent of one
+# core, summed over sessions), CAPTURE_MEMORY_BUDGET_MB and CAPTURE_DISK_BUDGET_MB (spooled
+# frames and partial PDFs, summed over sessions)
+session_manager = sessions.SessionManager(
+    max_sessions=int(os.environ.get('MAX_CAPTURE_SESSIONS', 4)),
+    cpu_budget=float(os.environ.get('CAPTURE_CPU_BUDGET', 100 * (os.cpu_count() or 1))),
+    memory_budget_mb=float(os.environ.get('CAPTURE_MEMORY_BUDGET_MB', psutil.virtual_memory().total / (1024 * 1024) / 2)),
+    disk_budget_mb=float(os.environ.get('CAPTURE_DISK_BUDGET_MB', psutil.disk_usage(tempfile.gettempdir()).free / (1024 * 1024) / 2)),
+    events=event_bus
+)
 
-def ensure_temp_dir_exists():
-    """Ensure temporary directory exists for manual screenshots"""
-    global temp_dir_for_manual
-    if not temp_dir_for_manual:
-        temp_dir_for_manual = utils.create_temp_directory()
-    return temp_dir_for_manual
+# Manual screenshots and saves from the ring buffer run on one capture thread rather than the
+# request threads, taking turns; at most CAPTURE_QUEUE_SIZE requests wait for it. The thread
+# owns the engines of manual screenshots (one per backend, reusing its frame buffers), since
+# some grabbers only work on the thread that created them
+capture_worker = serving.BackgroundWorker('manual-capture', queue_size=int(os.environ.get('CAPTURE_QUEUE_SIZE', serving.DEFAULT_WORK_QUEUE_SIZE)))
+manual_engines = {}
 
-# A global flag for stopping the capture process
-should_stop_capture = False
+def manual_engine(backend):
+    """Return the capture engine for manual screenshots with a backend; only used on the capture worker"""
+    if backend == 'auto':
+        return utils.get_default_engine()
+    if backend not in manual_engines:
+        manual_engines[backend] = capture_engine.CaptureEngine(backend=backend)
+    return manual_engines[backend]
 
-def run_capture_process(cmd, env):
-    """Run the capture process in a way that can be safely terminated"""
-    global active_process, process_pid, should_stop_capture
+def take_manual_screenshot(session, quality, policy, target, fit, interpolation):
+    """Take a manual screenshot into a session's spool on the capture worker; None if the session is stopping"""
+    # Holding the session lock keeps a concurrent stop from handing the spool to a PDF job mid-write
+    with session.lock:
+        if session.status != 'running':
+            return None
+        entry = utils.spool_screenshot(session.spool, quality=quality, engine=manual_engine(session.args.backend),
+                                       encoding=policy, target=target, fit=fit, interpolation=interpolation)
+        session.manual_screenshots.append(entry['id'])
+    return entry
+
+def save_recent_to_session(session, frames, quality, policy):
+    """Add ring buffer frames to a session's spool on the capture worker; None if the session is stopping"""
+    with session.lock:
+        if session.status != 'running':
+            return None
+        entries = ring_buffer.save_frames_to_spool(frames, session.spool, quality, policy)
+        session.manual_screenshots.extend(entry['id'] for entry in entries)
+    return entries
+
+def worker_error(e, action):
+    """Return the error message for a call to the capture worker that did not complete"""
+    if isinstance(e, serving.WorkerBusy):
+        return f'The capture worker is busy ({capture_worker.jobs.maxsize} requests waiting); try again shortly'
+    if isinstance(e, concurrent.futures.TimeoutError):
+        return f'Timed out after {REQUEST_TIMEOUT:g} seconds {action}; it may still complete'
+    return f'Error {action}: {str(e)}'
+
+# Optional background recording of the last few seconds, saved retroactively by /save_recent.
+# Started at launch when RING_BUFFER_SECONDS is set (with RING_BUFFER_FPS, RING_BUFFER_QUALITY
+# and RING_BUFFER_BACKEND), or by POST /ring_buffer
+frame_ring = None
+frame_ring_lock = threading.Lock()
+
+def start_frame_ring(seconds, fps=ring_buffer.DEFAULT_RING_FPS, quality=ring_buffer.DEFAULT_RING_QUALITY,
+                     backend='auto', target=None):
+    """Start a ring buffer, replacing the running one; raises ValueError for invalid settings"""
+    global frame_ring
+    ring = ring_buffer.FrameRing(seconds=seconds, fps=fps, quality=quality, backend=backend, target=target)
+    with frame_ring_lock:
+        old_ring, frame_ring = frame_ring, ring
+    if old_ring is not None:
+        old_ring.stop()
+    ring.start()
+    return ring
+
+def stop_frame_ring():
+    global frame_ring
+    with frame_ring_lock:
+        old_ring, frame_ring = frame_ring, None
+    if old_ring is not None:
+        old_ring.stop()
+
+def parse_encoding(options):
+    """Validate the 'encoding' object of a request and return (settings dict, error message)"""
+    if not isinstance(options, dict):
+        return None, 'Invalid encoding settings. Must be an object'
+    settings = {
+        'format': options.get('format'),
+        'jpeg_quality': options.get('jpeg_quality', 90),
+        'png_compression': options.get('png_compression')
+    }
     
+    valid_formats = list(utils.IMAGE_FORMATS) + ['auto']
+    if settings['format'] is not None and settings['format'] not in valid_formats:
+        return None, f'Invalid image format. Must be one of: {", ".join(valid_formats)}'
+    if not isinstance(settings['jpeg_quality'], int) or not 1 <= settings['jpeg_quality'] <= 100:
+        return None, 'Invalid JPEG quality. Must be an integer between 1 and 100'
+    if settings['png_compression'] is not None and (not isinstance(settings['png_compression'], int)
+                                                    or not 0 <= settings['png_compression'] <= 9):
+        return None, 'Invalid PNG compression level. Must be an integer between 0 and 9'
+    return settings, None
+
+def encoding_policy(encoding, options, args=None):
+    """Return the EncodingPolicy for settings from parse_encoding(options)
+
+    Options the request left out follow the capture settings args of the session the
+    screenshots go into, as main.run_capture chose them, or the defaults without a session.
+    """
+    if args is None:
+        return utils.EncodingPolicy(encoding['format'] or 'png', jpeg_quality=encoding['jpeg_quality'],
+                                    png_compression=encoding['png_compression'])
+    image_format = encoding['format'] or args.format or ('jpeg' if args.high_frequency else 'png')
+    jpeg_quality = encoding['jpeg_quality'] if 'jpeg_quality' in options else args.jpeg_quality
+    png_compression = encoding['png_compression'] if 'png_compression' in options else args.png_compression
+    return utils.EncodingPolicy(image_format, jpeg_quality=jpeg_quality, png_compression=png_compression)
+
+# Background PDF builds started by /stop_capture, keyed by job ID
+pdf_jobs = {}
+pdf_jobs_lock = threading.Lock()
+# Finished jobs kept around for polling
+MAX_FINISHED_PDF_JOBS = 20
+
+class PDFJob:
+    """State of one background PDF build, published as pdf_progress and pdf_finished events"""
+
+    def __init__(self, pdf_path, pages_total, session_id=None):
+        self.job_id = uuid.uuid4().hex
+        # The capture session the PDF belongs to
+        self.session_id = session_id
+        self.pdf_path = pdf_path
+        self.status = 'running'
+        self.message = 'Building PDF'
+        self.pages_done = 0
+        self.pages_total = pages_total
+        self.image_bytes_done = 0
+        self.bytes_written = 0
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.published_at = None
+
+    def update(self, pages_done, pages_total, image_bytes_done):
+        self.pages_done = pages_done
+        self.pages_total = pages_total
+        self.image_bytes_done = image_bytes_done
+        # Throttled so a build of many small pages doesn't flood the event streams
+        now = time.monotonic()
+        if pages_done >= pages_total or self.published_at is None or now - self.published_at >= PDF_PROGRESS_INTERVAL:
+            self.published_at = now
+            event_bus.publish('pdf_progress', session_id=self.session_id, **self.to_dict())
+
+    def to_dict(self):
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        eta = None
+        if self.status == 'running' and self.pages_done:
+            eta = elapsed / self.pages_done * (self.pages_total - self.pages_done)
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'message': self.message,
+            'pages_done': self.pages_done,
+            'pages_total': self.pages_total,
+            'image_bytes_done': self.image_bytes_done,
+            'bytes_written': self.bytes_written,
+            'elapsed_seconds': round(elapsed, 2),
+            'eta_seconds': round(eta, 2) if eta is not None else None,
+            'pdf_path': self.pdf_path if self.status == 'done' else None
+        }
+
+def run_pdf_job(job, frames, spool, workers, wait_for=None, export='pdf', video_fps=video_export.DEFAULT_VIDEO_FPS,
+                ocr_pool=None):
+    """Build a PDF (or with an mp4/webm export, a video) from spooled frames on a background
+    thread, recording progress on the job, then close the spool and remove its directory
+
+    wait_for is a thread that must finish before the directory is removed (the capture
+    also reads the manual screenshots when it stops). With an ocr.OCRPool, the text of each
+    page is laid over it and added to the search index of the PDF's directory.
+    """
     try:
-        # Reset the stop flag
-        should_stop_capture = False
-        
-        # Start the process
-        proc = subprocess.Popen(cmd, env=env)
-        process_pid = proc.pid
-        
-        # Check for the stop flag at regular intervals
-        while proc.poll() is None:  # While process is still running
-            if should_stop_capture:
-                # Try to send a gentle termination signal
+        if export == 'pdf':
+            pages = []
+            def on_page_text(page, entry, lines):
+                pages.append((page, entry['captured_at'], ocr.page_text(lines)))
+            success = utils.create_pdf_with_fpdf(frames, job.pdf_path, workers=workers, progress=job.update, spool=spool,
+                                                 ocr=ocr_pool, on_page_text=on_page_text if ocr_pool is not None else None)
+            if success and ocr_pool is not None:
                 try:
-                    if os.name == 'nt':  # Windows
-                        os.kill(process_pid, signal.CTRL_C_EVENT)
-                    else:  # macOS, Linux
-                        os.kill(process_pid, signal.SIGINT)
+                    search_index.add_pages(os.path.dirname(job.pdf_path) or '.', job.pdf_path, job.session_id, pages)
                 except Exception as e:
-                    print(f"Error sending signal to process: {e}")
-                
-                # Give it some time to terminate gracefully
-                time.sleep(2)
-                
-                # If still running, terminate forcefully
-                if proc.poll() is None:
-                    proc.terminate()
-                    proc.wait(timeout=3)
-                
-                break
-            
-            # Sleep to avoid CPU hogging
-            time.sleep(0.5)
-        
-        # Process completed naturally or was terminated
-        print(f"Capture process ended with return code: {proc.returncode}")
+                    print(f"Error indexing text of {job.pdf_path}: {str(e)}")
+        else:
+            success = video_export.write_video(frames, job.pdf_path, spool, fps=video_fps, progress=job.update)
+        if success:
+            job.bytes_written = os.path.getsize(job.pdf_path)
+            job.message = f"{'PDF' if export == 'pdf' else 'Video'} saved to {job.pdf_path}"
+            job.status = 'done'
+        else:
+            job.message = 'Failed to create PDF'
+            job.status = 'failed'
     except Exception as e:
-        print(f"Error in capture process: {str(e)}")
+        job.message = f'Error creating PDF: {str(e)}'
+        job.status = 'failed'
     finally:
-        # Clean up global variables
-        active_process = None
-        process_pid = None
+        job.finished_at = time.monotonic()
+        event_bus.publish('pdf_finished', session_id=job.session_id, **job.to_dict())
+        if ocr_pool is not None:
+            ocr_pool.close()
+        if wait_for is not None:
+            wait_for.join()
+        spool.close()
+        utils.cleanup_temp_directory(spool.directory)
+
+def start_pdf_job(frames, pdf_path, spool, workers, wait_for=None, session_id=None, export='pdf',
+                  video_fps=video_export.DEFAULT_VIDEO_FPS, ocr_pool=None):
+    """Register a PDF job and start building it on a daemon thread
+
+    The job's pdf_path gets a numbered suffix if the file exists or another running job is writing it.
+    """
+    with pdf_jobs_lock:
+        taken = {j.pdf_path for j in pdf_jobs.values() if j.status == 'running'}
+        job = PDFJob(utils.unique_pdf_path(pdf_path, taken), len(frames), session_id)
+        # Forget the oldest finished jobs so the table doesn't grow forever
+        finished = [j for j in pdf_jobs.values() if j.status != 'running']
+        for old_job in sorted(finished, key=lambda j: j.started_at)[:max(0, len(finished) - MAX_FINISHED_PDF_JOBS + 1)]:
+            del pdf_jobs[old_job.job_id]
+        pdf_jobs[job.job_id] = job
+    thread = threading.Thread(target=run_pdf_job, args=(job, frames, spool, workers, wait_for, export, video_fps, ocr_pool))
+    thread.daemon = True
+    thread.start()
+    return job
 
 @app.route('/start_capture', methods=['POST'])
 def start_capture():
-    global active_process, process_pid, manual_screenshots, temp_dir_for_manual, capture_thread, should_stop_capture
-    
-    # If a capture is already running, don't start another
-    if active_process and active_process.is_alive():
-        return jsonify({
-            'success': False,
-            'message': 'A screenshot capture is already in progress'
-        })
-    
-    # Clear any previous manual screenshots when starting a new capture
-    manual_screenshots = []
-    
-    # Create a new temp directory for manual screenshots if needed
-    if temp_dir_for_manual:
-        utils.cleanup_temp_directory(temp_dir_for_manual)
-    temp_dir_for_manual = ensure_temp_dir_exists()
-    
     # Get parameters from request
     data = request.json
     quality = data.get('quality', '720p')
@@ -108,81 +285,333 @@ def start_capture():
     duration = data.get('duration', 1800)
     output = data.get('output', 'myPDFs')
     name = data.get('name')
+    dedup_threshold = data.get('dedup_threshold')
+    backend = data.get('backend', 'auto')
+    target = data.get('target') or 'screen'
+    fit = data.get('fit', 'letterbox')
+    interpolation = data.get('interpolation')
+    workers = data.get('workers', 2)
+    queue_size = data.get('queue_size', 4)
+    drop_policy = data.get('drop_policy', 'block')
+    high_frequency = bool(data.get('high_frequency', False))
+    encoding = data.get('encoding') or {}
+    max_frames = data.get('max_frames')
+    max_spool_mb = data.get('max_spool_mb')
+    max_pdf_mb = data.get('max_pdf_mb')
+    budget_policy = data.get('budget_policy', 'stop')
+    export = data.get('export', 'pdf')
+    video_fps = data.get('video_fps', video_export.DEFAULT_VIDEO_FPS)
+    schedule = data.get('schedule', 'fixed')
+    min_interval = data.get('min_interval')
+    max_interval = data.get('max_interval')
+    activity_threshold = data.get('activity_threshold', scheduler.DEFAULT_ACTIVITY_THRESHOLD)
+    frame_budget = data.get('frame_budget')
+    ocr_enabled = bool(data.get('ocr', False))
+    ocr_language = data.get('ocr_language', ocr.DEFAULT_OCR_LANGUAGE)
+    
+    # Validate quality parameter (a preset, WIDTHxHEIGHT, a percentage or native)
+    try:
+        capture_engine.parse_quality(quality)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        })
+    
+    # Validate scaling options
+    if fit not in capture_engine.FIT_MODES:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid fit mode. Must be one of: {", ".join(capture_engine.FIT_MODES)}'
+        })
+    if interpolation is not None and interpolation not in capture_engine.INTERPOLATIONS:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid interpolation. Must be one of: {", ".join(capture_engine.INTERPOLATIONS)}'
+        })
+    
+    # Validate capture backend
+    valid_backends = ['auto'] + list(capture_engine.GRABBER_BACKENDS)
+    if backend not in valid_backends:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid capture backend. Must be one of: {", ".join(valid_backends)}'
+        })
+    
+    # Validate capture target (screen, monitor:N, region:X,Y,W,H or window:TITLE)
+    try:
+        target = str(capture_engine.CaptureTarget.parse(target))
+    except (ValueError, AttributeError):
+        return jsonify({
+            'success': False,
+            'message': 'Invalid capture target. Must be one of: screen, monitor:N, region:X,Y,W,H, window:TITLE'
+        })
+    
+    # Validate encoding settings
+    encoding, error = parse_encoding(encoding)
+    if error:
+        return jsonify({
+            'success': False,
+            'message': error
+        })
+    
+    # Validate rate (fractions of a second are allowed)
+    try:
+        rate = float(rate)
+    except (TypeError, ValueError):
+        rate = 0
+    if rate <= 0:
+        return jsonify({
+            'success': False,
+            'message': 'Invalid rate. Must be a number of seconds greater than 0'
+        })
+    
+    # Validate schedule; adaptive intervals default to a quarter and four times the rate
+    if schedule not in scheduler.SCHEDULES:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid schedule. Must be one of: {", ".join(scheduler.SCHEDULES)}'
+        })
+    for interval in (min_interval, max_interval):
+        if interval is not None and (not isinstance(interval, (int, float)) or interval <= 0):
+            return jsonify({
+                'success': False,
+                'message': 'Invalid min_interval or max_interval. Must be a number of seconds greater than 0'
+            })
+    if (min_interval if min_interval is not None else rate / 4) > (max_interval if max_interval is not None else rate * 4):
+        return jsonify({
+            'success': False,
+            'message': 'Invalid intervals. min_interval must be no larger than max_interval'
+        })
+    if not isinstance(activity_threshold, (int, float)) or not 0 <= activity_threshold <= 100:
+        return jsonify({
+            'success': False,
+            'message': 'Invalid activity_threshold. Must be a number between 0 and 100'
+        })
+    if frame_budget is not None and (not isinstance(frame_budget, int) or frame_budget < 1):
+        return jsonify({
+            'success': False,
+            'message': 'Invalid frame_budget. Must be an integer of at least 1'
+        })
+    
+    # Validate duration (main.py takes whole seconds)
+    try:
+        duration = int(duration)
+    except (TypeError, ValueError):
+        duration = 0
+    if duration <= 0:
+        return jsonify({
+            'success': False,
+            'message': 'Invalid duration. Must be a number of seconds greater than 0'
+        })
+    
+    # Validate encode pipeline settings
+    if not isinstance(workers, int) or not isinstance(queue_size, int) or workers < 1 or queue_size < 1:
+        return jsonify({
+            'success': False,
+            'message': 'Invalid pipeline settings. Workers and queue size must be integers of at least 1'
+        })
+    if drop_policy not in ['block', 'drop']:
+        return jsonify({
+            'success': False,
+            'message': 'Invalid drop policy. Must be one of: block, drop'
+        })
+    
+    # Validate dedup threshold (None disables deduplication)
+    if dedup_threshold is not None:
+        try:
+            dedup_threshold = float(dedup_threshold)
+        except (TypeError, ValueError):
+            dedup_threshold = -1
+        if not 0 <= dedup_threshold <= 100:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid dedup threshold. Must be a number between 0 and 100'
+            })
+    
+    # Validate export format; the capture encodes its PDF or video while it runs
+    if export not in video_export.EXPORT_FORMATS:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid export format. Must be one of: {", ".join(video_export.EXPORT_FORMATS)}'
+        })
+    if not isinstance(video_fps, (int, float)) or video_fps <= 0:
+        return jsonify({
+            'success': False,
+            'message': 'Invalid video_fps. Must be a number greater than 0'
+        })
     
-    # Validate quality parameter
-    valid_qualities = ['480p', '720p', '1080p', '2k', '4k']
-    if quality not in valid_qualities:
+    # Validate budgets (None means no limit)
+    if max_frames is not None and (not isinstance(max_frames, int) or max_frames < 1):
         return jsonify({
             'success': False,
-            'message': f'Invalid quality setting. Must be one of: {", ".join(valid_qualities)}'
+            'message': 'Invalid max_frames. Must be an integer of at least 1'
         })
+    for limit in (max_spool_mb, max_pdf_mb):
+        if limit is not None and (not isinstance(limit, (int, float)) or limit <= 0):
+            return jsonify({
+                'success': False,
+                'message': 'Invalid max_spool_mb or max_pdf_mb. Must be a number of megabytes greater than 0'
+            })
+    if budget_policy not in budgets.BUDGET_POLICIES:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid budget policy. Must be one of: {", ".join(budgets.BUDGET_POLICIES)}'
+        })
+    if frame_budget is not None and max_frames is not None and budget_policy == 'stop':
+        return jsonify({
+            'success': False,
+            'message': 'Use either frame_budget or max_frames with the stop budget policy, not both'
+        })
+    
+    # Validate OCR; Tesseract must be installed with the language's data
+    if ocr_enabled:
+        if not isinstance(ocr_language, str) or not ocr_language:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid ocr_language. Must be a Tesseract language such as eng, or several joined with +'
+            })
+        error = ocr.ocr_error(ocr_language)
+        if error:
+            return jsonify({
+                'success': False,
+                'message': error
+            })
     
-    # Build command for running main.py
-    cmd = [sys.executable, os.path.join(script_dir, 'main.py')]
-    cmd.extend(['-q', quality])
-    cmd.extend(['-r', str(rate)])
-    cmd.extend(['-d', str(duration)])
-    cmd.extend(['-o', output])
-    if name:
-        cmd.extend(['-n', name])
+    # Build the settings main.run_capture expects, starting from the command-line defaults
+    args = capture_main.build_parser().parse_args([])
+    args.quality = quality
+    args.rate = rate
+    args.duration = duration
+    args.output = output
+    args.name = name or None
+    args.backend = backend
+    args.target = target
+    args.fit = fit
+    args.interpolation = interpolation
+    args.workers = workers
+    args.queue_size = queue_size
+    args.drop_policy = drop_policy
+    args.high_frequency = high_frequency
+    args.format = encoding['format']
+    args.jpeg_quality = encoding['jpeg_quality']
+    args.png_compression = encoding['png_compression']
+    args.dedup_threshold = dedup_threshold
+    args.max_frames = max_frames
+    args.max_spool_mb = max_spool_mb
+    args.max_pdf_mb = max_pdf_mb
+    args.budget_policy = budget_policy
+    args.export = export
+    args.video_fps = video_fps
+    args.schedule = schedule
+    args.min_interval = min_interval
+    args.max_interval = max_interval
+    args.activity_threshold = activity_threshold
+    args.frame_budget = frame_budget
+    args.ocr = ocr_enabled
+    args.ocr_language = ocr_language
     
-    # Add environment variable to pass manual screenshots temp directory
-    env = os.environ.copy()
-    env['MANUAL_SCREENSHOTS_DIR'] = temp_dir_for_manual
+    params = {
+        'quality': quality,
+        'rate': rate,
+        'duration': duration,
+        'output': output,
+        'name': name,
+        'dedup_threshold': dedup_threshold,
+        'backend': backend,
+        'target': target,
+        'fit': fit,
+        'interpolation': interpolation,
+        'workers': workers,
+        'queue_size': queue_size,
+        'drop_policy': drop_policy,
+        'high_frequency': high_frequency,
+        'encoding': encoding,
+        'max_frames': max_frames,
+        'max_spool_mb': max_spool_mb,
+        'max_pdf_mb': max_pdf_mb,
+        'budget_policy': budget_policy,
+        'export': export,
+        'video_fps': video_fps,
+        'schedule': schedule,
+        'min_interval': min_interval,
+        'max_interval': max_interval,
+        'activity_threshold': activity_threshold,
+        'frame_budget': frame_budget,
+        'ocr': ocr_enabled,
+        'ocr_language': ocr_language
+    }
     
-    # Start screenshot process in a separate thread
-    capture_thread = threading.Thread(target=run_capture_process, args=(cmd, env))
-    capture_thread.daemon = True  # Make thread a daemon so it exits when main thread exits
-    capture_thread.start()
-    active_process = capture_thread
+    # Start the capture on a thread of this process if the session cap and resource budget allow it
+    estimated_memory_mb = sessions.estimate_session_memory_mb(quality, workers, queue_size)
+    session, error = session_manager.start(args, params, estimated_memory_mb)
+    if error:
+        return jsonify({
+            'success': False,
+            'message': error
+        })
     
     return jsonify({
         'success': True,
         'message': 'Screenshot capture started',
-        'params': {
-            'quality': quality,
-            'rate': rate,
-            'duration': duration,
-            'output': output,
-            'name': name
-        }
+        'session_id': session.session_id,
+        'params': params
     })
 
 @app.route('/stop_capture', methods=['POST'])
 def stop_capture():
-    global active_process, process_pid, temp_dir_for_manual, should_stop_capture
-    
     # Get parameters from request for PDF generation
     data = request.json
+    session_id = data.get('session_id')
     output = data.get('output', 'myPDFs')
     name = data.get('name')
+    # None uses one worker process per CPU; 1 builds the PDF serially
+    pdf_workers = data.get('pdf_workers', 1)
+    # pdf, mp4 or webm; by default the format the session was started with
+    export = data.get('export')
+    
+    if pdf_workers is not None and (not isinstance(pdf_workers, int) or pdf_workers < 1):
+        return jsonify({
+            'success': False,
+            'message': 'Invalid pdf_workers. Must be an integer of at least 1, or null for one per CPU'
+        })
+    if export is not None and export not in video_export.EXPORT_FORMATS:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid export format. Must be one of: {", ".join(video_export.EXPORT_FORMATS)}'
+        })
+    
+    # Without a session_id the only running capture is stopped
+    session, error = session_manager.get(session_id)
+    if error:
+        return jsonify({
+            'success': False,
+            'message': error
+        })
+    export = export or session.args.export
     
-    if not active_process or not active_process.is_alive():
+    if not session.request_stop():
         return jsonify({
             'success': False,
-            'message': 'No screenshot capture is currently running'
+            'message': 'This screenshot capture is already stopping'
         })
     
     try:
-        # Set the flag to stop the process
-        should_stop_capture = True
-        
-        # Wait a bit for the process to be signaled to stop
-        time.sleep(1)
+        # No manual screenshots can be added once the session is stopping
+        spool = session.spool
         
         # Generate PDF from collected screenshots
-        if temp_dir_for_manual and os.path.exists(temp_dir_for_manual):
-            # Create output directory if it doesn't exist
-            if not os.path.exists(output):
-                os.makedirs(output)
-            
-            # Collect all screenshots from the temp directory
-            screenshot_files = []
-            for file in os.listdir(temp_dir_for_manual):
-                if file.startswith("screenshot_") and file.endswith(".png"):
-                    screenshot_files.append(os.path.join(temp_dir_for_manual, file))
+        if spool is not None:
+            # The spool index lists every manual screenshot in the order it was taken
+            frames = spool.entries()
             
-            if screenshot_files:
+            # The PDF job owns the spool and its directory from here on; without screenshots
+            # the session keeps them and removes them when the capture ends
+            if frames and session.hand_over_spool():
+                # Create output directory if it doesn't exist
+                if not os.path.exists(output):
+                    os.makedirs(output)
+                
                 # Create PDF filename
                 if name:
                     pdf_filename = name if name.endswith('.pdf') else f"{name}.pdf"
@@ -190,20 +619,23 @@ def stop_capture():
                     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                     pdf_filename = f"screenshots_{timestamp}.pdf"
                 
-                pdf_path = os.path.join(output, pdf_filename)
-                success = utils.create_pdf_with_fpdf(screenshot_files, pdf_path)
+                pdf_path = video_export.export_path(os.path.join(output, pdf_filename), export)
                 
-                if success:
-                    return jsonify({
-                        'success': True,
-                        'message': f'Screenshot capture stopped and PDF saved to {pdf_path}',
-                        'pdf_path': pdf_path
-                    })
-                else:
-                    return jsonify({
-                        'success': False,
-                        'message': 'Failed to create PDF'
-                    })
+                # Build the PDF in the background; progress goes out on /events (and /pdf_job/<job_id>).
+                # The directory is removed once the capture, which also reads it, has finished
+                # Manual screenshots of a session with OCR get a text layer and are indexed too
+                ocr_pool = ocr.OCRPool.from_args(session.args) if export == 'pdf' else None
+                job = start_pdf_job(frames, pdf_path, spool, pdf_workers, wait_for=session.thread,
+                                    session_id=session.session_id, export=export, video_fps=session.args.video_fps,
+                                    ocr_pool=ocr_pool)
+                session.pdf_job_id = job.job_id
+                return jsonify({
+                    'success': True,
+                    'message': f"Screenshot capture stopped, saving {'PDF' if export == 'pdf' else 'video'} to {job.pdf_path}",
+                    'session_id': session.session_id,
+                    'pdf_path': job.pdf_path,
+                    'job_id': job.job_id
+                })
             else:
                 return jsonify({
                     'success': False,
@@ -220,54 +652,380 @@ def stop_capture():
             'message': f'Error stopping capture: {str(e)}'
         })
 
-@app.route('/manual_screenshot', methods=['POST'])
-def manual_screenshot():
-    global manual_screenshots, temp_dir_for_manual
+@app.route('/pdf_job/<job_id>', methods=['GET'])
+def pdf_job_status(job_id):
+    """Report the progress of a background PDF build started by /stop_capture"""
+    with pdf_jobs_lock:
+        job = pdf_jobs.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'message': 'Unknown PDF job'
+        })
+    return jsonify(dict(job.to_dict(), success=True))
+
+@app.route('/search', methods=['GET'])
+def search():
+    """Search the text of screenshots captured with OCR into an output directory"""
+    query = request.args.get('q', '')
+    output = request.args.get('output', 'myPDFs')
+    limit = request.args.get('limit', search_index.DEFAULT_SEARCH_LIMIT)
     
-    # Ensure we have a temp directory
-    temp_dir = ensure_temp_dir_exists()
+    if not query.strip():
+        return jsonify({
+            'success': False,
+            'message': 'A search query (q) is required'
+        })
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        limit = 0
+    if limit < 1:
+        return jsonify({
+            'success': False,
+            'message': 'Invalid limit. Must be an integer of at least 1'
+        })
     
+    try:
+        matches, milliseconds = search_index.search(output, query, limit)
+        return jsonify({
+            'success': True,
+            'query': query,
+            'matches': matches,
+            'milliseconds': round(milliseconds, 2)
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error searching: {str(e)}'
+        })
+
+@app.route('/manual_screenshot', methods=['POST'])
+def manual_screenshot():
     # Get quality parameter
     data = request.json
+    session_id = data.get('session_id')
     quality = data.get('quality', '720p')
+    target = data.get('target')
+    fit = data.get('fit')
+    interpolation = data.get('interpolation')
+    
+    # Validate quality parameter (a preset, WIDTHxHEIGHT, a percentage or native)
+    try:
+        capture_engine.parse_quality(quality)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        })
     
-    # Validate quality parameter
-    valid_qualities = ['480p', '720p', '1080p', '2k', '4k']
-    if quality not in valid_qualities:
+    # Validate scaling options (by default the session's own are used)
+    if fit is not None and fit not in capture_engine.FIT_MODES:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid fit mode. Must be one of: {", ".join(capture_engine.FIT_MODES)}'
+        })
+    if interpolation is not None and interpolation not in capture_engine.INTERPOLATIONS:
+        return jsonify({
+            'success': False,
+            'message': f'Invalid interpolation. Must be one of: {", ".join(capture_engine.INTERPOLATIONS)}'
+        })
+    
+    # Validate encoding settings; by default the session's own are used
+    encoding_options = data.get('encoding') or {}
+    encoding, error = parse_encoding(encoding_options)
+    if error:
+        return jsonify({
+            'success': False,
+            'message': error
+        })
+    
+    # Manual screenshots go into a running session (the only one if no session_id is given)
+    session, error = session_manager.get(session_id)
+    if error:
+        return jsonify({
+            'success': False,
+            'message': error
+        })
+    
+    # Validate capture target; by default the session's own target is captured
+    try:
+        target = capture_engine.CaptureTarget.parse(target or session.args.target)
+    except (ValueError, AttributeError):
         return jsonify({
             'success': False,
-            'message': f'Invalid quality setting. Must be one of: {", ".join(valid_qualities)}'
+            'message': 'Invalid capture target. Must be one of: screen, monitor:N, region:X,Y,W,H, window:TITLE'
         })
     
     try:
-        # Take a manual screenshot and add it to our list
-        filepath = utils.take_screenshot_opencv(temp_dir, quality=quality)
-        manual_screenshots.append(filepath)
+        # Grabbed and encoded on the capture worker; this thread only waits for it
+        policy = encoding_policy(encoding, encoding_options, session.args)
+        entry = capture_worker.run(take_manual_screenshot, session, quality, policy, target,
+                                   fit or session.args.fit, interpolation or session.args.interpolation,
+                                   timeout=REQUEST_TIMEOUT)
+        if entry is None:
+            return jsonify({
+                'success': False,
+                'message': 'This screenshot capture is stopping'
+            })
+        metrics.REGISTRY.inc('snip_frames_total', result='manual')
+        metrics.REGISTRY.inc('snip_spool_bytes_total', entry['length'])
+        session.publish('frame_captured', frame_id=entry['id'], captured_at=entry['captured_at'],
+                        width=entry['width'], height=entry['height'], manual=True)
         
         return jsonify({
             'success': True,
             'message': 'Manual screenshot captured',
-            'filepath': filepath,
-            'quality': quality
+            'session_id': session.session_id,
+            'frame_id': entry['id'],
+            'quality': quality,
+            'target': str(target)
         })
     except Exception as e:
         return jsonify({
             'success': False,
-            'message': f'Error capturing manual screenshot: {str(e)}'
+            'message': worker_error(e, 'capturing manual screenshot')
         })
 
-@app.route('/status', methods=['GET'])
-def status():
-    if active_process and active_process.is_alive():
+@app.route('/ring_buffer', methods=['POST'])
+def configure_ring_buffer():
+    """Start (or restart with new settings) or stop the background ring buffer of recent frames"""
+    data = request.json
+    enabled = data.get('enabled', True)
+    seconds = data.get('seconds', ring_buffer.DEFAULT_RING_SECONDS)
+    fps = data.get('fps', ring_buffer.DEFAULT_RING_FPS)
+    quality = data.get('quality', ring_buffer.DEFAULT_RING_QUALITY)
+    backend = data.get('backend', 'auto')
+    target = data.get('target') or 'screen'
+    
+    if not enabled:
+        stop_frame_ring()
         return jsonify({
-            'status': 'active',
-            'message': 'Screenshot capture is in progress'
+            'success': True,
+            'message': 'Ring buffer stopped'
         })
-    else:
+    
+    # Validate settings; the memory is allocated up front, so they decide what it costs
+    if not isinstance(seconds, (int, float)) or not isinstance(fps, (int, float)):
         return jsonify({
-            'status': 'inactive',
-            'message': 'No screenshot capture in progress'
+            'success': False,
+            'message': 'Invalid ring buffer settings. Seconds and fps must be numbers'
+        })
+    if backend not in ['auto'] + list(capture_engine.GRABBER_BACKENDS):
+        return jsonify({
+            'success': False,
+            'message': f'Invalid capture backend. Must be one of: auto, {", ".join(capture_engine.GRABBER_BACKENDS)}'
         })
+    try:
+        target = capture_engine.CaptureTarget.parse(target)
+        ring = start_frame_ring(seconds, fps, quality, backend, target)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        })
+    except MemoryError:
+        return jsonify({
+            'success': False,
+            'message': 'Not enough memory for a ring buffer this size'
+        })
+    
+    return jsonify({
+        'success': True,
+        'message': f'Ring buffer recording the last {seconds:g} seconds ({ring.memory_mb:.0f} MB)',
+        'ring_buffer': ring.to_dict()
+    })
+
+@app.route('/save_recent', methods=['POST'])
+def save_recent():
+    """Save the frames of the last few seconds from the ring buffer
+
+    They become manual screenshots of the running session (or the one given by session_id),
+    or with standalone, or when no capture is running, a PDF of their own.
+    """
+    data = request.json
+    seconds = data.get('seconds')
+    session_id = data.get('session_id')
+    standalone = bool(data.get('standalone', False))
+    output = data.get('output', 'myPDFs')
+    name = data.get('name')
+    encoding_options = data.get('encoding') or {}
+    
+    ring = frame_ring
+    if ring is None:
+        return jsonify({
+            'success': False,
+            'message': 'The ring buffer is not running. Start it with POST /ring_buffer or RING_BUFFER_SECONDS'
+        })
+    
+    # Validate seconds (None saves everything the buffer holds)
+    if seconds is not None and (not isinstance(seconds, (int, float)) or seconds <= 0):
+        return jsonify({
+            'success': False,
+            'message': 'Invalid seconds. Must be a number greater than 0'
+        })
+    
+    # Validate encoding settings; frames saved into a session default to its own
+    encoding, error = parse_encoding(encoding_options)
+    if error:
+        return jsonify({
+            'success': False,
+            'message': error
+        })
+    
+    # Into a session unless asked for a PDF of their own or there is no capture to add them to
+    session = None
+    if not standalone and (session_id is not None or session_manager.live_sessions()):
+        session, error = session_manager.get(session_id)
+        if error:
+            return jsonify({
+                'success': False,
+                'message': error
+            })
+    
+    policy = encoding_policy(encoding, encoding_options, session.args if session is not None else None)
+    
+    # Copied out of the buffer at once, so the moment is kept even if saving takes a while
+    frames = ring.recent(seconds)
+    if not frames:
+        return jsonify({
+            'success': False,
+            'message': f'The ring buffer holds no frames yet{": " + ring.error if ring.error else ""}'
+        })
+    covered = (frames[-1][0] - frames[0][0]).total_seconds()
+    
+    try:
+        if session is not None:
+            entries = capture_worker.run(save_recent_to_session, session, frames, ring.quality, policy,
+                                         timeout=REQUEST_TIMEOUT)
+            if entries is None:
+                return jsonify({
+                    'success': False,
+                    'message': 'This screenshot capture is stopping'
+                })
+            metrics.REGISTRY.inc('snip_frames_total', len(entries), result='manual')
+            metrics.REGISTRY.inc('snip_spool_bytes_total', sum(entry['length'] for entry in entries))
+            session.publish('recent_saved', frames=len(entries), seconds=round(covered, 1),
+                            frame_ids=[entry['id'] for entry in entries])
+            return jsonify({
+                'success': True,
+                'message': f'Saved {len(entries)} screenshots from the last {covered:.1f} seconds to the capture',
+                'session_id': session.session_id,
+                'frame_ids': [entry['id'] for entry in entries]
+            })
+        
+        if not os.path.exists(output):
+            os.makedirs(output)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        if name:
+            pdf_filename = name if name.endswith('.pdf') else f"{name}.pdf"
+        else:
+            pdf_filename = f"recent_{timestamp}.pdf"
+        pdf_path = capture_worker.run(ring_buffer.save_frames_to_pdf, frames,
+                                      utils.unique_pdf_path(os.path.join(output, pdf_filename)), ring.quality, policy,
+                                      timeout=REQUEST_TIMEOUT)
+        return jsonify({
+            'success': True,
+            'message': f'Saved {len(frames)} screenshots from the last {covered:.1f} seconds to {pdf_path}',
+            'pdf_path': pdf_path
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': worker_error(e, 'saving recent screenshots')
+        })
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Per-stage latency histograms and counters of every capture since the server started, for Prometheus"""
+    with pdf_jobs_lock:
+        running_jobs = sum(1 for job in pdf_jobs.values() if job.status == 'running')
+    metrics.REGISTRY.set('snip_capture_sessions', len(session_manager.live_sessions()))
+    metrics.REGISTRY.set('snip_pdf_jobs', running_jobs)
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+def status_payload():
+    """Every live session with its counters, plus the totals checked against the budget"""
+    live = [session.to_dict() for session in session_manager.live_sessions()]
+    cpu_used, memory_used = session_manager.usage()
+    limits = {
+        'max_sessions': session_manager.max_sessions,
+        'cpu_budget': session_manager.cpu_budget,
+        'cpu_used': round(cpu_used, 1),
+        'memory_budget_mb': session_manager.memory_budget_mb,
+        'memory_used_mb': round(memory_used, 1),
+        'disk_budget_mb': round(session_manager.pool.max_disk_bytes / budgets.MB, 1) if session_manager.pool.max_disk_bytes is not None else None,
+        'disk_used_mb': round(session_manager.pool.disk_bytes() / budgets.MB, 1)
+    }
+    ring = frame_ring
+    serving_state = {
+        'mode': SERVER_MODE,
+        'threads': SERVER_THREADS if SERVER_MODE == 'production' else None,
+        'request_timeout': REQUEST_TIMEOUT,
+        'event_streams': len(event_bus.subscriptions),
+        'max_event_streams': MAX_EVENT_STREAMS,
+        'capture_worker': capture_worker.to_dict()
+    }
+    if live:
+        return {
+            'status': 'active',
+            'message': f'{len(live)} screenshot capture(s) in progress',
+            'sessions': live,
+            'limits': limits,
+            'ring_buffer': ring.to_dict() if ring is not None else None,
+            'serving': serving_state
+        }
+    else:
+        return {
+            'status': 'inactive',
+            'message': 'No screenshot capture in progress',
+            'sessions': [],
+            'limits': limits,
+            'ring_buffer': ring.to_dict() if ring is not None else None,
+            'serving': serving_state
+        }
+
+@app.route('/status', methods=['GET'])
+def status():
+    return jsonify(status_payload())
+
+@app.route('/events', methods=['GET'])
+def events_stream():
+    """Stream session and PDF job events as server-sent events
+
+    The stream opens with a 'snapshot' event holding the /status payload and the PDF jobs,
+    then pushes session_started, frame_captured, frame_skipped, frame_dropped, capture_error,
+    budget_reached, recent_saved, session_finished, pdf_progress and pdf_finished events as
+    they happen. With a session_id only that session's events are sent. Past
+    MAX_EVENT_STREAMS open streams, a new one is ended at once with a retry delay, so the
+    client reconnects later rather than taking the last request threads.
+    """
+    session_id = request.args.get('session_id')
+    if len(event_bus.subscriptions) >= MAX_EVENT_STREAMS:
+        return Response(f"retry: {EVENT_RETRY_MILLISECONDS}\n: too many event streams are open\n\n",
+                        mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+    # Subscribe before taking the snapshot so no event falls between the two
+    subscription = event_bus.subscribe()
+    with pdf_jobs_lock:
+        jobs = [dict(job.to_dict(), session_id=job.session_id) for job in pdf_jobs.values()
+                if session_id is None or job.session_id == session_id]
+    snapshot = dict(status_payload(), pdf_jobs=jobs, id=0, type='snapshot', session_id=session_id)
+    
+    def stream():
+        try:
+            yield events.format_sse(snapshot)
+            # A subscription that fell behind is closed; the client reconnects and gets a new snapshot
+            while not subscription.closed:
+                event = subscription.get(timeout=EVENT_KEEPALIVE_SECONDS)
+                if event is None:
+                    yield ': keepalive\n\n'
+                elif session_id is None or event['session_id'] == session_id:
+                    yield events.format_sse(event)
+        finally:
+            event_bus.unsubscribe(subscription)
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/recent_directories', methods=['GET'])
 def get_recent_directories():
@@ -362,5 +1120,30 @@ def create_directory():
         })
 
 if __name__ == '__main__':
+    # Heavy dependencies load on first capture, so the server answers /status right after launch
+    if '--profile-startup' in sys.argv:
+        ready_at = time.time()
+        startup.print_startup_report(startup.seconds_since_process_start(ready_at), startup.profile_imports())
+        sys.exit(0)
+    # Finish the PDFs of sessions a previous run left behind, without delaying startup
+    if os.environ.get('SWEEP_ORPHANED_SESSIONS', '1') != '0':
+        sweeper = threading.Thread(target=session_journal.sweep_orphaned_sessions, name='session-sweeper')
+        sweeper.daemon = True
+        sweeper.start()
+    # Record the last few seconds in the background for /save_recent
+    if float(os.environ.get('RING_BUFFER_SECONDS', 0)) > 0:
+        try:
+            ring = start_frame_ring(float(os.environ['RING_BUFFER_SECONDS']),
+                                    fps=float(os.environ.get('RING_BUFFER_FPS', ring_buffer.DEFAULT_RING_FPS)),
+                                    quality=os.environ.get('RING_BUFFER_QUALITY', ring_buffer.DEFAULT_RING_QUALITY),
+                                    backend=os.environ.get('RING_BUFFER_BACKEND', 'auto'))
+            print(f"Ring buffer recording the last {ring.seconds:g} seconds ({ring.memory_mb:.0f} MB)")
+        except (ValueError, MemoryError) as e:
+            print(f"Error starting the ring buffer: {str(e)}")
     port = int(os.environ.get("PORT", 5000))
-    app.run(host='0.0.0.0', port=port)
\ No newline at end of file
+    if SERVER_MODE not in serving.SERVING_MODES:
+        print(f"Error: Invalid SERVER_MODE. Must be one of: {', '.join(serving.SERVING_MODES)}")
+        sys.exit(1)
+    serving.serve(app, host='0.0.0.0', port=port, mode=SERVER_MODE, threads=SERVER_THREADS,
+                  channel_timeout=int(os.environ.get('CHANNEL_TIMEOUT', serving.DEFAULT_CHANNEL_TIMEOUT)),
+                  connection_limit=int(os.environ.get('CONNECTION_LIMIT', serving.DEFAULT_CONNECTION_LIMIT)))
\ No newline at end of file
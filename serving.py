@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+import concurrent.futures
+import queue
+import threading
+
+# How server.py serves requests: Flask's development server, or waitress with a fixed pool of
+# request threads. Captures are threads of the server process sharing its state, so it is
+# always one process
+SERVING_MODES = ['development', 'production']
+DEFAULT_THREADS = 16
+# Seconds a request waits for work handed to a background worker before giving up
+DEFAULT_REQUEST_TIMEOUT = 30
+# Seconds an idle connection stays open (production mode); longer than the event stream keepalive
+DEFAULT_CHANNEL_TIMEOUT = 120
+DEFAULT_CONNECTION_LIMIT = 100
+# Calls that may wait for a background worker before new ones are turned away
+DEFAULT_WORK_QUEUE_SIZE = 8
+
+class WorkerBusy(Exception):
+    """Raised when a BackgroundWorker already has a full backlog"""
+
+class BackgroundWorker:
+    """One thread running submitted calls in order, with a bounded backlog
+
+    Request threads hand slow work (grabbing and encoding screenshots) to a worker and wait
+    for it with a timeout, so a slow call can't hold a request thread for longer than that
+    and the other requests keep being answered. A full backlog turns new calls away at once
+    instead of letting them pile up. A call still waiting when its request gives up is
+    cancelled rather than run. The thread starts with the first call.
+    """
+
+    def __init__(self, name, queue_size=DEFAULT_WORK_QUEUE_SIZE):
+        self.name = name
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) and return a concurrent.futures.Future of its result"""
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name=self.name)
+                self.thread.daemon = True
+                self.thread.start()
+        future = concurrent.futures.Future()
+        try:
+            self.jobs.put_nowait((future, fn, args, kwargs))
+        except queue.Full:
+            self.rejected += 1
+            raise WorkerBusy(f"{self.jobs.maxsize} calls are already waiting for the {self.name} worker")
+        return future
+
+    def run(self, fn, *args, timeout=None, **kwargs):
+        """Run fn on the worker and return its result
+
+        Raises WorkerBusy if the backlog is full and concurrent.futures.TimeoutError if the
+        call did not finish within timeout seconds; exceptions of fn are raised as they are.
+        """
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            self.timed_out += 1
+            future.cancel()
+            raise
+
+    def _run(self):
+        while True:
+            future, fn, args, kwargs = self.jobs.get()
+            # Skipped if its request already gave up
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            self.completed += 1
+
+    def to_dict(self):
+        return {
+            'backlog': self.jobs.qsize(),
+            'queue_size': self.jobs.maxsize,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out
+        }
+
+def serve(app, host, port, mode='development', threads=DEFAULT_THREADS, channel_timeout=DEFAULT_CHANNEL_TIMEOUT,
+          connection_limit=DEFAULT_CONNECTION_LIMIT):
+    """Serve app until interrupted; production mode runs waitress, or falls back if it isn't installed
+
+    The development server starts a thread per request with no limit. waitress answers
+    requests on a pool of threads, queueing the rest, and closes connections idle for
+    channel_timeout seconds.
+    """
+    if mode == 'production':
+        try:
+            import waitress
+        except ImportError:
+            print("Error: Production mode needs waitress (pip install waitress); using the development server instead")
+        else:
+            print(f"Serving on http://{host}:{port} with waitress ({threads} request threads, "
+                  f"{connection_limit} connections at most)")
+            waitress.serve(app, host=host, port=port, threads=threads, channel_timeout=channel_timeout,
+                           connection_limit=connection_limit, ident='snip')
+            return
+    app.run(host=host, port=port, threaded=True)
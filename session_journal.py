@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+import psutil
+import utils
+import video_export
+import frame_spool
+
+# Capture sessions keep their frames in temporary directories with this prefix, so the
+# sweeper can find the ones left behind when a process dies
+SESSION_DIR_PREFIX = 'snip_session_'
+JOURNAL_FILENAME = 'session.json'
+# A session directory without a journal this old was abandoned before capture began
+STALE_DIRECTORY_SECONDS = 60
+
+class SessionJournal:
+    """Small JSON checkpoint kept next to a session's frame spool
+
+    Records the capture settings, the PDF being written (and the parts finished before it
+    when the capture rolls over), how many shots of the schedule were taken, how many seconds
+    of its duration have passed and the last frame ID, plus the owning process so live sessions can be told from orphaned ones.
+    Every save atomically replaces the file.
+    """
+    FIELDS = ['settings', 'pdf_path', 'parts', 'manual_screenshots_dir', 'status', 'started_at', 'updated_at',
+              'grabs', 'elapsed', 'frames', 'last_frame_id', 'pid', 'process_started']
+
+    def __init__(self, directory, settings, pdf_path, manual_screenshots_dir=None):
+        self.directory = directory
+        self.path = os.path.join(directory, JOURNAL_FILENAME)
+        # Capture arguments as given, before run_capture adjusts them
+        self.settings = settings
+        self.pdf_path = pdf_path
+        self.parts = []
+        self.manual_screenshots_dir = manual_screenshots_dir
+        self.status = 'running'
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.updated_at = self.started_at
+        # Shots of the schedule taken so far, across resumes
+        self.grabs = 0
+        # Seconds of the capture duration covered so far, across resumes
+        self.elapsed = 0.0
+        self.frames = 0
+        self.last_frame_id = None
+        self.pid = None
+        self.process_started = None
+        self.saved_at = None
+        # The capture thread and the frame writers (on rollover) both save
+        self.lock = threading.Lock()
+        self.claim()
+
+    @property
+    def session_id(self):
+        return os.path.basename(self.directory)[len(SESSION_DIR_PREFIX):]
+
+    @classmethod
+    def load(cls, directory):
+        """Read the journal of a session directory; raises OSError or ValueError if it is unreadable"""
+        with open(os.path.join(directory, JOURNAL_FILENAME)) as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or 'settings' not in data or 'pdf_path' not in data:
+            raise ValueError(f"Incomplete session journal in {directory}")
+        journal = cls(directory, data['settings'], data['pdf_path'], data.get('manual_screenshots_dir'))
+        for field in cls.FIELDS:
+            if field in data:
+                setattr(journal, field, data[field])
+        return journal
+
+    def claim(self):
+        """Make this process the owner of the session"""
+        process = psutil.Process()
+        self.pid = process.pid
+        self.process_started = process.create_time()
+        self.status = 'running'
+
+    def owner_alive(self):
+        """Return whether the process that owns the session is still running"""
+        try:
+            # Compare start times so a recycled PID doesn't count as the owner
+            return abs(psutil.Process(self.pid).create_time() - self.process_started) < 1
+        except (psutil.Error, TypeError):
+            return False
+
+    def is_orphaned(self):
+        return self.status != 'running' or not self.owner_alive()
+
+    def save(self):
+        with self.lock:
+            self.updated_at = datetime.now().isoformat(timespec='seconds')
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump({field: getattr(self, field) for field in self.FIELDS}, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+            self.saved_at = time.monotonic()
+
+    def checkpoint(self, grabs, spool, interval=1.0, elapsed=None):
+        """Record progress, writing the journal at most once every interval seconds"""
+        self.grabs = grabs
+        if elapsed is not None:
+            self.elapsed = round(elapsed, 3)
+        self.frames = len(spool)
+        self.last_frame_id = spool.next_id - 1 if self.frames else None
+        if self.saved_at is None or time.monotonic() - self.saved_at >= interval:
+            self.save()
+
+    def finish(self):
+        """Mark the session finished once its PDF is written, just before its directory is removed"""
+        self.status = 'finished'
+        self.save()
+
+def session_directory(session):
+    """Return the directory of a session given its ID or its directory path"""
+    if os.path.isdir(session):
+        return session
+    return os.path.join(tempfile.gettempdir(), SESSION_DIR_PREFIX + session)
+
+def session_directories():
+    return sorted(glob.glob(os.path.join(tempfile.gettempdir(), SESSION_DIR_PREFIX + '*')))
+
+def find_orphaned_sessions():
+    """Return the journals of sessions whose process died before finishing them"""
+    orphans = []
+    for directory in session_directories():
+        try:
+            journal = SessionJournal.load(directory)
+        except (OSError, ValueError):
+            continue
+        if journal.is_orphaned():
+            orphans.append(journal)
+    return orphans
+
+def finalize_session(journal):
+    """Write the PDF (or video) of an interrupted session from its spooled frames; returns its path, or None without frames"""
+    if journal.status == 'finished' and os.path.exists(journal.pdf_path):
+        # Only the cleanup was missed
+        return journal.pdf_path
+    spools = [frame_spool.FrameSpool(journal.directory)]
+    if journal.manual_screenshots_dir and os.path.isdir(journal.manual_screenshots_dir):
+        spools.append(frame_spool.FrameSpool(journal.manual_screenshots_dir))
+    try:
+        captured = any(len(spool) for spool in spools)
+        if not captured and not os.path.isdir(os.path.dirname(os.path.abspath(journal.pdf_path))):
+            # Nothing was captured and the output folder is gone, so no partial files are left either
+            return None
+        # The spool is the complete record, so the PDF is rebuilt from it rather than from the .part file.
+        # Opening the writer also replaces the partial files it left, whatever the export names them
+        writer = video_export.open_writer(journal.pdf_path, journal.settings.get('export', 'pdf'),
+                                          journal.settings.get('video_fps', video_export.DEFAULT_VIDEO_FPS))
+        if not captured:
+            # Nothing was captured; drop the empty partial document (or video and captions) too
+            writer.abort()
+            return None
+        try:
+            for spool in spools:
+                for entry in spool.entries():
+                    writer.add_spooled_page(spool, entry, caption=utils.screenshot_caption(None, entry))
+        except Exception:
+            writer.abort()
+            raise
+        return writer.close()
+    finally:
+        for spool in spools:
+            spool.close()
+
+def purge_session(journal):
+    """Remove a session directory and the manual screenshots directory it used"""
+    utils.cleanup_temp_directory(journal.manual_screenshots_dir)
+    utils.cleanup_temp_directory(journal.directory)
+
+def sweep_orphaned_sessions(finalize=True):
+    """Finalize or purge the session directories of captures whose process died
+
+    With finalize, sessions with frames are turned into their PDF before their directory
+    is removed; otherwise they are purged. Returns a list of (session ID, PDF path or None).
+    """
+    results = []
+    for journal in find_orphaned_sessions():
+        pdf_path = None
+        if finalize:
+            try:
+                pdf_path = finalize_session(journal)
+            except Exception as e:
+                # Keep the frames so the session can still be resumed or finalized later
+                print(f"Error finalizing session {journal.session_id}: {str(e)}")
+                continue
+        purge_session(journal)
+        results.append((journal.session_id, pdf_path))
+
+    # Directories that never got a journal hold no usable session
+    for directory in session_directories():
+        if os.path.exists(os.path.join(directory, JOURNAL_FILENAME)):
+            continue
+        try:
+            stale = time.time() - os.path.getmtime(directory) > STALE_DIRECTORY_SECONDS
+        except OSError:
+            continue
+        if stale:
+            utils.cleanup_temp_directory(directory)
+            results.append((os.path.basename(directory)[len(SESSION_DIR_PREFIX):], None))
+    return results
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+import threading
+import time
+import uuid
+from datetime import datetime
+import psutil
+import utils
+import frame_spool
+import budgets
+import main as capture_main
+from capture_engine import estimated_frame_size
+
+def estimate_session_memory_mb(quality, workers, queue_size):
+    """Estimate the frame buffer memory a capture session will use, for admission against the memory budget"""
+    width, height = estimated_frame_size(quality)
+    # One BGR canvas per queue slot and per worker, plus the resize buffer and a grabbed screen
+    frame_mb = width * height * 3 / (1024 * 1024)
+    return (queue_size + workers + 2) * frame_mb
+
+class CaptureSession:
+    """One capture: the thread running main.run_capture, its manual screenshots directory and its counters
+
+    Manual screenshots go into a FrameSpool in the session's temporary directory. The session
+    owns the spool until /stop_capture hands it to a PDF job; if the capture ends on its own
+    the spool's directory is removed when the capture finishes. Progress is published on
+    events (an events.EventBus), if given, tagged with the session ID. The capture keeps to
+    a CaptureBudget built from its settings, which also counts against pool.
+    """
+
+    def __init__(self, args, params, estimated_memory_mb=0, events=None, pool=None):
+        self.session_id = uuid.uuid4().hex
+        # Capture settings as parsed by main.build_parser()
+        self.args = args
+        self.params = params
+        self.estimated_memory_mb = estimated_memory_mb
+        self.events = events
+        self.budget = budgets.CaptureBudget.from_args(args, pool=pool)
+        # Guards status, spool and manual_screenshots against overlapping requests
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.status = 'running'
+        self.spool = frame_spool.FrameSpool(utils.create_temp_directory(prefix='snip_manual_'))
+        # Frame IDs of the manual screenshots
+        self.manual_screenshots = []
+        # The running FramePipeline, for its counters and worker threads
+        self.pipeline = None
+        self.cpu_time = 0.0
+        self.cpu_percent = 0.0
+        self.usage_sampled_at = None
+        self.pdf_path = None
+        self.pdf_job_id = None
+        self.started_at = datetime.now()
+        self.started_monotonic = time.monotonic()
+        self.thread = None
+
+    def publish(self, event_type, **data):
+        """Publish an event about this session"""
+        if self.events is not None:
+            self.events.publish(event_type, session_id=self.session_id, **data)
+
+    def run(self, on_exit=None):
+        """Run the capture loop on this thread until it finishes or a stop is requested"""
+        try:
+            self.pdf_path = capture_main.run_capture(self.args, manual_screenshots_dir=self.spool.directory,
+                                                     stop_event=self.stop_event, on_start=self._attach,
+                                                     on_event=self.publish, budget=self.budget,
+                                                     session_id=self.session_id)
+            print(f"Capture session {self.session_id} ended")
+        except Exception as e:
+            print(f"Error in capture session {self.session_id}: {str(e)}")
+            self.publish('capture_error', message=f"Error in capture session: {str(e)}")
+        finally:
+            with self.lock:
+                self.status = 'finished'
+                leftover_spool = self.spool
+                self.spool = None
+            if self.budget.pool is not None:
+                self.budget.pool.remove(self.budget)
+            if on_exit is not None:
+                on_exit(self)
+            self.publish('session_finished', pdf_path=self.pdf_path, pdf_job_id=self.pdf_job_id,
+                         frames_written=self.pipeline.written if self.pipeline else 0,
+                         manual_screenshots=len(self.manual_screenshots))
+            # Still ours only if no PDF job took the spool over
+            if leftover_spool is not None:
+                leftover_spool.close()
+                utils.cleanup_temp_directory(leftover_spool.directory)
+
+    def _attach(self, frame_pipeline):
+        self.pipeline = frame_pipeline
+
+    def request_stop(self):
+        """Ask the capture loop to stop; returns False if it is already stopping or finished"""
+        with self.lock:
+            if self.status != 'running':
+                return False
+            self.status = 'stopping'
+        self.stop_event.set()
+        return True
+
+    def hand_over_spool(self):
+        """Give up ownership of the manual screenshots spool (to a PDF job) and return it"""
+        with self.lock:
+            spool = self.spool
+            self.spool = None
+            return spool
+
+    def thread_ids(self):
+        """Return the native IDs of the capture thread and its encode workers"""
+        ids = {self.thread.native_id} if self.thread is not None else set()
+        if self.pipeline is not None:
+            ids.update(worker.native_id for worker in self.pipeline.workers)
+        return ids
+
+    def resource_usage(self):
+        """Return (cpu_percent, memory_mb) of this session, zeros once it has finished
+
+        CPU is measured over the session's own threads; memory is the estimate for its
+        frame buffers, since the threads share the server's address space.
+        """
+        if self.status == 'finished':
+            return 0.0, 0.0
+        # CPU use is measured between readings, so back-to-back readings reuse the last
+        # value rather than a window too short to mean anything (the first reading is 0)
+        now = time.monotonic()
+        if self.usage_sampled_at is None or now - self.usage_sampled_at >= 0.5:
+            ids = self.thread_ids()
+            try:
+                cpu_time = sum(t.user_time + t.system_time for t in psutil.Process().threads() if t.id in ids)
+            except psutil.Error:
+                cpu_time = self.cpu_time
+            if self.usage_sampled_at is not None:
+                self.cpu_percent = max(0.0, cpu_time - self.cpu_time) / (now - self.usage_sampled_at) * 100
+            self.cpu_time = cpu_time
+            self.usage_sampled_at = now
+        return self.cpu_percent, self.estimated_memory_mb
+
+    def to_dict(self):
+        elapsed = time.monotonic() - self.started_monotonic
+        rate = self.params['rate']
+        expected = max(1, int(self.params['duration'] / rate))
+        if self.params.get('frame_budget') is not None:
+            expected = min(expected, self.params['frame_budget'])
+        cpu_percent, memory_mb = self.resource_usage()
+        frame_pipeline = self.pipeline
+        schedule = frame_pipeline.scheduler if frame_pipeline else None
+        return {
+            'session_id': self.session_id,
+            'status': self.status,
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'elapsed_seconds': round(elapsed, 1),
+            'params': self.params,
+            'screenshots_expected': expected,
+            'frames_captured': frame_pipeline.captured if frame_pipeline else 0,
+            'frames_written': frame_pipeline.written if frame_pipeline else 0,
+            'frames_dropped': frame_pipeline.dropped if frame_pipeline else 0,
+            'manual_screenshots': len(self.manual_screenshots),
+            'cpu_percent': round(cpu_percent, 1),
+            'memory_mb': round(memory_mb, 1),
+            'budget': self.budget.to_dict(),
+            'schedule': schedule.to_dict() if schedule is not None else None,
+            'pdf_path': self.pdf_path,
+            'pdf_job_id': self.pdf_job_id
+        }
+
+class SessionManager:
+    """Track concurrent capture sessions and admit new ones within a session cap and resource budget
+
+    Sessions run as threads of this process. cpu_budget is in percent of one core summed over
+    the sessions' threads (e.g. 400 for four cores); memory_budget_mb bounds the combined frame
+    buffer estimate of the running sessions and the new one. disk_budget_mb bounds the spooled
+    frames and partial PDFs of the running sessions together. None disables a budget.
+    """
+
+    def __init__(self, max_sessions=4, cpu_budget=None, memory_budget_mb=None, disk_budget_mb=None, events=None):
+        self.max_sessions = max_sessions
+        self.cpu_budget = cpu_budget
+        self.memory_budget_mb = memory_budget_mb
+        self.pool = budgets.BudgetPool(int(disk_budget_mb * budgets.MB) if disk_budget_mb is not None else None)
+        # events.EventBus the sessions publish their progress on
+        self.events = events
+        self.lock = threading.Lock()
+        self.sessions = {}
+
+    def live_sessions(self):
+        with self.lock:
+            return list(self.sessions.values())
+
+    def get(self, session_id=None):
+        """Return (session, error message); without an ID the only live session is used"""
+        with self.lock:
+            if session_id is not None:
+                session = self.sessions.get(session_id)
+                if session is None:
+                    return None, 'Unknown capture session'
+                return session, None
+            if not self.sessions:
+                return None, 'No screenshot capture is currently running'
+            if len(self.sessions) > 1:
+                return None, 'Several captures are running; pass the session_id of one of them'
+            return next(iter(self.sessions.values())), None
+
+    def usage(self):
+        """Return the combined (cpu_percent, memory_mb) of the live capture sessions"""
+        cpu_total = memory_total = 0.0
+        for session in self.live_sessions():
+            cpu_percent, memory_mb = session.resource_usage()
+            cpu_total += cpu_percent
+            memory_total += memory_mb
+        return cpu_total, memory_total
+
+    def start(self, args, params, estimated_memory_mb=0):
+        """Start a capture session if the cap and budgets allow it; returns (session, error message)"""
+        # Measured outside the lock; psutil calls can take a moment
+        cpu_used, memory_used = self.usage()
+        with self.lock:
+            if len(self.sessions) >= self.max_sessions:
+                return None, f'Too many captures running (limit {self.max_sessions})'
+            if self.cpu_budget is not None and cpu_used >= self.cpu_budget:
+                return None, f'CPU budget exhausted ({cpu_used:.0f}% of {self.cpu_budget:.0f}% in use)'
+            if self.memory_budget_mb is not None and memory_used + estimated_memory_mb > self.memory_budget_mb:
+                return None, (f'Memory budget exhausted ({memory_used:.0f} MB in use, about '
+                              f'{estimated_memory_mb:.0f} MB needed, limit {self.memory_budget_mb:.0f} MB)')
+            if self.pool.exhausted():
+                return None, (f'Disk budget exhausted ({self.pool.disk_bytes() / budgets.MB:.0f} MB in use, '
+                              f'limit {self.pool.max_disk_bytes / budgets.MB:.0f} MB)')
+            session = CaptureSession(args, params, estimated_memory_mb, events=self.events, pool=self.pool)
+            self.pool.add(session.budget)
+            # Announced before the thread starts so it precedes the session's frame events
+            session.publish('session_started', params=params)
+            # Started before it is visible, so a stop request can always join the thread
+            session.thread = threading.Thread(target=session.run, args=(self._remove,),
+                                              name=f"capture-{session.session_id[:8]}")
+            session.thread.daemon = True  # Make thread a daemon so it exits when main thread exits
+            session.thread.start()
+            self.sessions[session.session_id] = session
+        return session, None
+
+    def _remove(self, session):
+        with self.lock:
+            self.sessions.pop(session.session_id, None)
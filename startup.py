@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+import importlib
+import sys
+import time
+
+# Heavy third-party modules, in the order they are measured; later ones are timed without
+# the cost of dependencies already loaded (cv2 without numpy, and so on)
+HEAVY_MODULES = ['numpy', 'cv2', 'fpdf', 'PIL', 'mss', 'pyautogui', 'psutil', 'flask', 'flask_cors']
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access"""
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module '{self._name}' ({state})>"
+
+def lazy_import(name):
+    """Return a module that is only imported when first used, or the module itself if already imported"""
+    return sys.modules.get(name) or LazyModule(name)
+
+def profile_imports(modules=HEAVY_MODULES):
+    """Import each module in turn and return a list of (module, seconds, error message)
+
+    Modules that were already imported cost nothing here; run this before anything else
+    imports them to see their full cost.
+    """
+    results = []
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+            error = None
+        except Exception as e:
+            error = f"{type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}"
+        results.append((name, time.perf_counter() - start, error))
+    return results
+
+def seconds_since_process_start(at):
+    """Return how long after this process was created the wall-clock time 'at' was"""
+    import psutil
+    return at - psutil.Process().create_time()
+
+def print_startup_report(ready_seconds, results):
+    """Print how long startup took and what each heavy dependency costs to import"""
+    print(f"Ready after {ready_seconds * 1000:.0f} ms (interpreter and this program's own modules)")
+    print("Cost of heavy dependencies, loaded on first use:")
+    for name, seconds, error in results:
+        status = f" failed ({error})" if error else ""
+        print(f"  {name:<12} {seconds * 1000:>8.1f} ms{status}")
+    print(f"  {'total':<12} {sum(seconds for _, seconds, _ in results) * 1000:>8.1f} ms")
@@ -1,106 +1,330 @@
 #!/usr/bin/env python3
-import cv2
-import numpy as np
 import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import tempfile
 import shutil
-import pyautogui
+import time
 from datetime import datetime
-from fpdf import FPDF
-
-# Quality presets (width, height)
-QUALITY_PRESETS = {
-    '480p': (854, 480),
-    '720p': (1280, 720),
-    '1080p': (1920, 1080),
-    '2k': (2560, 1440),
-    '4k': (3840, 2160)
-}
+from startup import lazy_import
+from capture_engine import CaptureEngine, parse_quality
+from pdf_writer import probe_image_size, place_text_lines
+from frame_spool import read_spooled_frame
+from metrics import REGISTRY
+
+# OpenCV, NumPy and FPDF take most of the startup time, so they load on first use
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+fpdf = lazy_import('fpdf')
 
-def create_temp_directory():
+# Capture engine shared by calls that don't pass their own
+_default_engine = None
+
+def create_temp_directory(prefix=None):
     """Create a temporary directory for screenshots"""
-    return tempfile.mkdtemp()
+    return tempfile.mkdtemp(prefix=prefix)
 
 def cleanup_temp_directory(temp_dir):
     """Remove temporary directory and all screenshots"""
     if temp_dir and os.path.exists(temp_dir):
         shutil.rmtree(temp_dir)
 
-def take_screenshot_opencv(temp_folder, quality='720p'):
-    """Take a screenshot using pyautogui and process with OpenCV, saving to a temporary folder"""
+def unique_pdf_path(pdf_path, taken=()):
+    """Return pdf_path, or a numbered variant if it (or its partial file) exists or is in taken
+
+    Concurrent captures writing to the same folder in the same second would otherwise
+    pick the same default name. Works for video exports too, whose partial file is NAME.part.EXT.
+    """
+    base, ext = os.path.splitext(pdf_path)
+    candidate = pdf_path
+    counter = 2
+    while (os.path.exists(candidate) or os.path.exists(candidate + '.part') or candidate in taken
+           or os.path.exists(os.path.splitext(candidate)[0] + '.part' + ext)):
+        candidate = f"{base}_{counter}{ext}"
+        counter += 1
+    return candidate
+
+class FrameDeduplicator:
+    """Skip frames that are nearly identical to the last kept frame"""
+
+    def __init__(self, threshold, signature_size=(64, 36)):
+        # threshold is the mean absolute difference, as a percentage of full scale,
+        # below which a frame counts as a duplicate of the last kept one
+        self.threshold = threshold
+        self.signature_size = signature_size
+        self.last_signature = None
+        self.kept = 0
+        self.skipped = 0
+
+    def is_duplicate(self, frame):
+        """Return True if the frame should be skipped, otherwise remember it as the last kept frame"""
+        signature = compute_frame_signature(frame, self.signature_size)
+        if self.last_signature is not None and frame_difference(signature, self.last_signature) < self.threshold:
+            self.skipped += 1
+            return True
+        self.last_signature = signature
+        self.kept += 1
+        return False
+
+def compute_frame_signature(frame, size=(64, 36)):
+    """Downsample a frame to a small grayscale thumbnail for cheap comparisons"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+def frame_difference(signature_a, signature_b):
+    """Return the mean absolute difference between two signatures as a percentage (0-100)"""
+    return float(cv2.absdiff(signature_a, signature_b).mean()) * 100.0 / 255.0
+
+# Image formats a screenshot may be stored in, with their file extensions
+IMAGE_FORMATS = {
+    'png': '.png',
+    'jpeg': '.jpg',
+    'webp': '.webp'
+}
+
+class EncodingPolicy:
+    """Choose the file format and encoder settings for each screenshot
+
+    'auto' keeps frames with few distinct colours (UI, text, slides) as lossless PNG,
+    where PNG is both small and exact, and stores busier content (photos, video) as JPEG.
+    """
+
+    def __init__(self, image_format='png', jpeg_quality=90, png_compression=None, auto_color_threshold=1024):
+        if image_format not in IMAGE_FORMATS and image_format != 'auto':
+            raise ValueError(f"Invalid image format: {image_format}")
+        self.image_format = image_format
+        # Used for both JPEG and WebP
+        self.jpeg_quality = jpeg_quality
+        # None keeps OpenCV's default level
+        self.png_compression = png_compression
+        self.auto_color_threshold = auto_color_threshold
+
+    def choose_format(self, frame):
+        """Return the concrete format to use for a frame"""
+        if self.image_format != 'auto':
+            return self.image_format
+        return 'png' if count_colors(frame) <= self.auto_color_threshold else 'jpeg'
+
+    def params(self, image_format):
+        """Return the cv2.imwrite parameters for a concrete format"""
+        if image_format == 'jpeg':
+            return [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality]
+        if image_format == 'webp':
+            return [cv2.IMWRITE_WEBP_QUALITY, self.jpeg_quality]
+        if self.png_compression is not None:
+            return [cv2.IMWRITE_PNG_COMPRESSION, self.png_compression]
+        return []
+
+    def encode(self, frame):
+        """Encode a frame in memory and return (format, encoded bytes as a NumPy array)"""
+        image_format = self.choose_format(frame)
+        ok, encoded = cv2.imencode(IMAGE_FORMATS[image_format], frame, self.params(image_format))
+        if not ok:
+            raise IOError(f"cv2.imencode failed for {image_format}")
+        return image_format, encoded
+
+    def describe(self):
+        if self.image_format in ('jpeg', 'webp'):
+            return f"{self.image_format} (quality {self.jpeg_quality})"
+        if self.image_format == 'png' and self.png_compression is not None:
+            return f"png (compression {self.png_compression})"
+        return self.image_format
+
+def count_colors(frame, sample_size=(160, 90)):
+    """Count distinct colours on a nearest-neighbour thumbnail, a cheap proxy for how 'photographic' a frame is"""
+    small = cv2.resize(frame, sample_size, interpolation=cv2.INTER_NEAREST)
+    packed = (small[:, :, 0].astype(np.uint32) << 16) | (small[:, :, 1].astype(np.uint32) << 8) | small[:, :, 2]
+    return len(np.unique(packed))
+
+def get_default_engine():
+    """Return the shared capture engine, creating it on first use"""
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = CaptureEngine()
+    return _default_engine
+
+def spool_screenshot(spool, quality='720p', deduplicator=None, engine=None, encoding=None, target=None,
+                     fit=None, interpolation=None):
+    """Take a screenshot with the capture engine and append it to a FrameSpool
+
+    Returns the frame's spool entry, or None if the deduplicator judged the frame a near-duplicate.
+    target (a CaptureTarget), fit and interpolation default to the engine's own.
+    """
     try:
-        # Get quality dimensions
-        if quality not in QUALITY_PRESETS:
-            raise ValueError(f"Invalid quality setting: {quality}")
-        
-        target_width, target_height = QUALITY_PRESETS[quality]
-        
-        # Create timestamp for unique filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"screenshot_{timestamp}_{quality}.png"
-        filepath = os.path.join(temp_folder, filename)
-        
-        # Take screenshot using pyautogui
-        screenshot = pyautogui.screenshot()
-        
-        # Convert PIL image to OpenCV format (numpy array)
-        screenshot_cv = np.array(screenshot)
-        screenshot_cv = cv2.cvtColor(screenshot_cv, cv2.COLOR_RGB2BGR)
-        
-        # Resize to target quality while maintaining aspect ratio
-        original_height, original_width = screenshot_cv.shape[:2]
-        aspect_ratio = original_width / original_height
-        
-        # Calculate new dimensions while maintaining aspect ratio
-        if aspect_ratio > (target_width / target_height):
-            # Width is the limiting factor
-            new_width = target_width
-            new_height = int(target_width / aspect_ratio)
-        else:
-            # Height is the limiting factor
-            new_height = target_height
-            new_width = int(target_height * aspect_ratio)
-        
-        # Resize the image
-        resized = cv2.resize(screenshot_cv, (new_width, new_height), interpolation=cv2.INTER_AREA)
+        parse_quality(quality)
         
-        # Create a black canvas of the target size
-        canvas = np.zeros((target_height, target_width, 3), dtype=np.uint8)
+        captured_at = datetime.now()
+        if engine is None:
+            engine = get_default_engine()
+        canvas = engine.capture(quality, target=target, fit=fit, interpolation=interpolation)
         
-        # Calculate position to center the image
-        x_offset = (target_width - new_width) // 2
-        y_offset = (target_height - new_height) // 2
+        # Skip frames that are nearly identical to the last kept one
+        if deduplicator is not None and deduplicator.is_duplicate(canvas):
+            print(f"Screenshot skipped at {datetime.now().strftime('%H:%M:%S')} (no significant change)")
+            return None
         
-        # Place the resized image on the canvas
-        canvas[y_offset:y_offset+new_height, x_offset:x_offset+new_width] = resized
+        image_format, encoded = (encoding or EncodingPolicy()).encode(canvas)
+        height, width = canvas.shape[:2]
+        entry = spool.append(encoded, width, height, captured_at, quality, image_format)
         
-        # Save screenshot using OpenCV
-        cv2.imwrite(filepath, canvas)
-        
-        print(f"Screenshot captured at {datetime.now().strftime('%H:%M:%S')} ({quality})")
-        return filepath
+        print(f"Screenshot captured at {datetime.now().strftime('%H:%M:%S')} ({quality}, frame {entry['id']})")
+        return entry
     except Exception as e:
         print(f"Error capturing screenshot: {str(e)}")
         raise
 
-def create_pdf_with_fpdf(screenshot_files, pdf_path):
-    """Create a PDF from a list of screenshot files using FPDF"""
+def parse_screenshot_filename(img_path):
+    """Return (readable timestamp, quality) parsed from a screenshot_<timestamp>_<quality> filename"""
+    filename = os.path.basename(img_path)
+    parts = os.path.splitext(filename.replace("screenshot_", ""))[0].split("_")
+    
+    # Handle both formats: timestamp_quality and timestamp
+    if len(parts) >= 2:
+        timestamp_part = "_".join(parts[:-1])
+        quality = parts[-1]
+    else:
+        timestamp_part = parts[0]
+        quality = "unknown"
+    
+    # Try milliseconds first (sub-second captures), then seconds, then just the date
+    timestamp = None
+    for fmt in ("%Y%m%d_%H%M%S_%f", "%Y%m%d_%H%M%S", "%Y%m%d"):
+        try:
+            timestamp = datetime.strptime(timestamp_part, fmt)
+            break
+        except ValueError:
+            continue
+    if timestamp is None:
+        timestamp = datetime.now()
+    
+    if timestamp_part.count("_") == 2:
+        return timestamp.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3], quality
+    return timestamp.strftime("%Y-%m-%d %H:%M:%S"), quality
+
+def screenshot_caption(img_path, entry=None):
+    """Return the caption printed under a screenshot's PDF page, from its spool entry if there is one"""
+    if entry is not None and entry.get('captured_at'):
+        readable_timestamp = datetime.fromisoformat(entry['captured_at']).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        return f"Screenshot taken: {readable_timestamp} ({entry['quality']})"
+    readable_timestamp, quality = parse_screenshot_filename(img_path)
+    return f"Screenshot taken: {readable_timestamp} ({quality})"
+
+def prepare_fpdf_image(source):
+    """Decode and compress an image the way FPDF.image() would (runs in a worker process)
+
+    source is a file path, or (spool data path, offset, length, frame name) for a spooled frame.
+    """
+    from fpdf.image_parsing import get_img_info
+    try:
+        if isinstance(source, tuple):
+            data_path, offset, length, frame_name = source
+            return get_img_info(frame_name, read_spooled_frame(data_path, offset, length))
+        return get_img_info(source)
+    except Exception:
+        # Leave it to FPDF.image() in the parent, which reports the error for this page as usual
+        return None
+
+def iter_prepared_images(frames, workers, source_for=lambda frame: frame):
+    """Yield (frame, prepared image info) in order, preparing up to two images per worker ahead"""
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        remaining = iter(frames)
+        for frame in remaining:
+            pending.append((frame, executor.submit(prepare_fpdf_image, source_for(frame))))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            frame, future = pending.popleft()
+            next_frame = next(remaining, None)
+            if next_frame is not None:
+                pending.append((next_frame, executor.submit(prepare_fpdf_image, source_for(next_frame))))
+            yield frame, future.result()
+
+def add_prepared_image(pdf, name, info):
+    """Put an image prepared by a worker into FPDF's image cache under name, so FPDF.image() reuses it"""
+    # Mirror fpdf.image_parsing.preload_image; images with ICC profiles are left to FPDF
+    if info is None or info.get('iccp') is not None or name in pdf.image_cache.images:
+        return
+    info['i'] = len(pdf.image_cache.images) + 1
+    info['usages'] = 0
+    info['iccp_i'] = None
+    pdf.image_cache.images[name] = info
+
+def read_page_image(spool=None):
+    """Return a function giving the encoded image bytes of a (frame, prepared image) pair, or None if unreadable"""
+    def read(page):
+        frame = page[0]
+        try:
+            if spool is not None:
+                # A copy, since it is read on an OCR thread
+                return bytes(spool.read(frame))
+            with open(frame, 'rb') as f:
+                return f.read()
+        except (OSError, ValueError):
+            return None
+    return read
+
+def create_pdf_with_fpdf(screenshot_files, pdf_path, workers=1, progress=None, spool=None,
+                         metrics=None, ocr=None, on_page_text=None):
+    """Create a PDF from a list of screenshot files, or of FrameSpool entries, using FPDF
+
+    With spool given, screenshot_files are entries of that spool and each image is read
+    through its memory map. Page sizes come from the spool index, or from the image header
+    of a file; images are never decoded just to measure them. With workers > 1 (or None for one per
+    CPU), images are decoded and compressed in a process pool and the pages are then
+    assembled in order, giving the same document as the serial path.
+
+    progress, if given, is called as progress(pages_done, pages_total, image_bytes_done)
+    after each page. Build time, pages and PDF size are recorded in metrics (the process-wide
+    registry by default).
+
+    With an ocr.OCRPool, each image is recognized a few pages ahead of the one being added
+    and its text laid over the page invisibly, so the PDF can be searched; on_page_text, if
+    given, is then called as on_page_text(page_number, entry, lines) for each page.
+    """
+    metrics = metrics or REGISTRY
+    started = time.perf_counter()
     try:
         if not screenshot_files:
             print("No screenshots to create PDF")
             return False
 
-        pdf = FPDF()
+        pdf = fpdf.FPDF()
         
-        for img_path in screenshot_files:
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if spool is not None:
+            # Workers read spooled frames from the spool file themselves
+            source_for = lambda entry: (spool.data_path, entry['offset'], entry['length'], spool.frame_name(entry))
+        else:
+            source_for = lambda img_path: img_path
+        if workers > 1 and len(screenshot_files) > 1:
+            pages = iter_prepared_images(screenshot_files, workers, source_for)
+        else:
+            pages = ((frame, None) for frame in screenshot_files)
+        if ocr is not None:
+            pages = ((frame, prepared, lines) for (frame, prepared), lines in ocr.recognize_ahead(pages, read_page_image(spool)))
+        else:
+            pages = ((frame, prepared, None) for frame, prepared in pages)
+        
+        pages_done = 0
+        image_bytes_done = 0
+        for frame, prepared, lines in pages:
+            img_path = spool.frame_name(frame) if spool is not None else frame
             try:
                 # Get image dimensions
-                img = cv2.imread(img_path)
-                if img is None:
-                    print(f"Warning: Could not read image {img_path}, skipping")
-                    continue
-                    
-                height, width, _ = img.shape
+                if spool is not None:
+                    entry = frame
+                else:
+                    try:
+                        width, height = probe_image_size(img_path)
+                        # Captions of files come from their names
+                        entry = {'width': width, 'height': height, 'captured_at': None}
+                    except (OSError, ValueError):
+                        print(f"Warning: Could not read image {img_path}, skipping")
+                        continue
+                
+                width, height = entry['width'], entry['height']
                 
                 # Add a page with appropriate orientation
                 if width > height:
@@ -130,42 +354,38 @@ def create_pdf_with_fpdf(screenshot_files, pdf_path):
                 x = margin + (max_width - new_width) / 2
                 y = margin
                 
-                # Add image to the PDF
-                pdf.image(img_path, x=x, y=y, w=new_width, h=new_height)
-                
-                # Extract timestamp and quality from filename
-                filename = os.path.basename(img_path)
-                parts = filename.replace("screenshot_", "").replace(".png", "").split("_")
-                
-                # Handle both formats: timestamp_quality and timestamp
-                if len(parts) >= 2:
-                    timestamp_part = parts[0]
-                    quality = parts[-1]
-                else:
-                    timestamp_part = parts[0]
-                    quality = "unknown"
-                
-                try:
-                    # Try parsing with seconds first
-                    timestamp = datetime.strptime(timestamp_part, "%Y%m%d_%H%M%S")
-                except ValueError:
-                    try:
-                        # Fallback to just date if time parsing fails
-                        timestamp = datetime.strptime(timestamp_part, "%Y%m%d")
-                    except ValueError:
-                        timestamp = datetime.now()
-                
-                readable_timestamp = timestamp.strftime("%Y-%m-%d %H:%M:%S")
+                # Add image to the PDF; FPDF caches spooled frames under the stream's name
+                add_prepared_image(pdf, img_path, prepared)
+                image = spool.open_frame(frame) if spool is not None else img_path
+                pdf.image(image, x=x, y=y, w=new_width, h=new_height)
                 
                 pdf.set_font("Arial", size=10)
                 pdf.set_xy(x, y + new_height + 5)
-                pdf.cell(new_width, 10, f"Screenshot taken: {readable_timestamp} ({quality})", align='C')
+                pdf.cell(new_width, 10, screenshot_caption(img_path, entry), align='C')
+                
+                # Lay the recognized text over the image, invisibly
+                if lines:
+                    with pdf.local_context(text_mode='INVISIBLE'):
+                        for text, left, baseline, font_size, stretch in place_text_lines(lines, width, x, y, new_width):
+                            pdf.set_font_size(font_size)
+                            pdf.set_stretching(stretch)
+                            pdf.text(left, baseline, text)
+                if on_page_text is not None:
+                    on_page_text(pdf.page, entry, lines)
+                image_bytes_done += frame['length'] if spool is not None else os.path.getsize(img_path)
+                metrics.inc('snip_pdf_pages_total', builder='fpdf')
             except Exception as e:
                 print(f"Error processing image {img_path}: {str(e)}")
                 continue
+            finally:
+                pages_done += 1
+                if progress is not None:
+                    progress(pages_done, len(screenshot_files), image_bytes_done)
         
         # Save PDF
         pdf.output(pdf_path)
+        metrics.observe('snip_pdf_build_seconds', time.perf_counter() - started, builder='fpdf')
+        metrics.inc('snip_pdf_bytes_total', os.path.getsize(pdf_path), builder='fpdf')
         print(f"PDF created: {pdf_path}")
         return True
     except Exception as e:
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+import os
+import utils
+import pdf_writer
+
+# Export formats: one PDF page per frame, or one video frame per screenshot
+EXPORT_FORMATS = ['pdf', 'mp4', 'webm']
+# OpenCV codec per video format; MPEG-4 encodes in a few milliseconds per frame, VP9 makes
+# smaller files but can take a large fraction of a second per busy 720p frame
+VIDEO_CODECS = {'mp4': 'mp4v', 'webm': 'VP90'}
+# Playback rate of exported videos: a time-lapse, whatever the capture rate was
+DEFAULT_VIDEO_FPS = 4
+
+def export_path(path, export):
+    """Return path with the file extension of the export format"""
+    return os.path.splitext(path)[0] + '.' + export
+
+def open_writer(path, export='pdf', fps=DEFAULT_VIDEO_FPS):
+    """Return an IncrementalPDFWriter or VideoExportWriter writing path"""
+    if export == 'pdf':
+        return pdf_writer.IncrementalPDFWriter(path)
+    if export not in VIDEO_CODECS:
+        raise ValueError(f"Invalid export format: {export}")
+    return VideoExportWriter(path, fps)
+
+def write_video(frames, video_path, spool, fps=DEFAULT_VIDEO_FPS, progress=None):
+    """Encode spooled frames into a video in one pass; returns its path
+
+    progress, if given, is called as progress(frames_done, frames_total, image_bytes_done)
+    after each frame, like the progress callback of utils.create_pdf_with_fpdf.
+    """
+    writer = VideoExportWriter(video_path, fps)
+    image_bytes = 0
+    try:
+        for done, entry in enumerate(frames, 1):
+            writer.add_spooled_page(spool, entry, caption=utils.screenshot_caption(None, entry))
+            image_bytes += entry['length']
+            if progress is not None:
+                progress(done, len(frames), image_bytes)
+    except Exception:
+        writer.abort()
+        raise
+    return writer.close()
+
+def format_cue_time(seconds):
+    milliseconds = round(seconds * 1000)
+    hours, milliseconds = divmod(milliseconds, 3600 * 1000)
+    minutes, milliseconds = divmod(milliseconds, 60 * 1000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
+
+def fit_frame(image, width, height):
+    """Scale a BGR frame to fit width x height and pad it with black to exactly that size"""
+    import cv2
+    h, w = image.shape[:2]
+    scale = min(width / w, height / h)
+    new_w, new_h = max(1, min(width, round(w * scale))), max(1, min(height, round(h * scale)))
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_AREA)
+    top, left = (height - new_h) // 2, (width - new_w) // 2
+    return cv2.copyMakeBorder(image, top, height - new_h - top, left, width - new_w - left,
+                              cv2.BORDER_CONSTANT, value=(0, 0, 0))
+
+class VideoExportWriter:
+    """Encode frames into a video as they are captured, with their capture times in a WebVTT file
+
+    Has the interface of pdf_writer.IncrementalPDFWriter, so a capture writes either one.
+    Successive frames of a mostly static screen compress to almost nothing, unlike PDF
+    pages. The video takes the size of its first frame (rounded down to even numbers, which
+    codecs need); frames of other sizes are scaled to fit and padded. It is written to
+    NAME.part.EXT and moved into place by close(). NAME.vtt gets one cue per frame holding
+    its caption, so players show each frame's capture time as a subtitle.
+    """
+
+    def __init__(self, video_path, fps=DEFAULT_VIDEO_FPS):
+        base, ext = os.path.splitext(video_path)
+        self.video_path = video_path
+        self.codec = VIDEO_CODECS[ext.lstrip('.')]
+        self.fps = fps
+        # The container is chosen from the extension, so it stays last
+        self.part_path = f"{base}.part{ext}"
+        self.captions_path = base + '.vtt'
+        self.captions_part_path = self.captions_path + '.part'
+        # Opened with the first frame, once the size is known
+        self.video = None
+        self.frame_size = None
+        self.frames = 0
+        self.captions = open(self.captions_part_path, 'w', encoding='utf-8')
+        self.captions.write('WEBVTT\n\n')
+
+    @property
+    def page_count(self):
+        return self.frames
+
+    @property
+    def size(self):
+        """Bytes written to the partial video and captions so far"""
+        video_bytes = os.path.getsize(self.part_path) if os.path.exists(self.part_path) else 0
+        return video_bytes + self.captions.tell()
+
+    def add_spooled_page(self, spool, entry, caption=None):
+        """Append a frame from a FrameSpool"""
+        self.add_frame(pdf_writer.decode_image(spool.read(entry)), caption)
+
+    def add_page(self, img_path, caption=None):
+        """Append the image at img_path"""
+        with open(img_path, 'rb') as f:
+            self.add_frame(pdf_writer.decode_image(f.read()), caption)
+
+    def add_frame(self, image, caption=None):
+        """Append a BGR frame, with an optional caption shown while it plays"""
+        import cv2
+        if self.video is None:
+            height, width = image.shape[:2]
+            self.frame_size = (max(2, width - width % 2), max(2, height - height % 2))
+            self.video = cv2.VideoWriter(self.part_path, cv2.VideoWriter_fourcc(*self.codec), self.fps, self.frame_size)
+            if not self.video.isOpened():
+                self.video = None
+                raise RuntimeError(f"OpenCV cannot encode {self.codec} video to {self.part_path}")
+        width, height = self.frame_size
+        if image.shape[:2] != (height, width):
+            image = fit_frame(image, width, height)
+        self.video.write(image)
+
+        start = self.frames / self.fps
+        self.captions.write(f"{self.frames + 1}\n{format_cue_time(start)} --> "
+                            f"{format_cue_time(start + 1 / self.fps)}\n{caption or ''}\n\n")
+        self.captions.flush()
+        self.frames += 1
+
+    def close(self):
+        """Finish the video and captions and move them into place"""
+        if self.video is not None:
+            self.video.release()
+        self.captions.close()
+        if not self.frames:
+            self.abort()
+            raise ValueError("No frames were added to the video")
+        os.replace(self.part_path, self.video_path)
+        os.replace(self.captions_part_path, self.captions_path)
+        return self.video_path
+
+    def abort(self):
+        """Discard the partial video and captions"""
+        if self.video is not None:
+            self.video.release()
+            self.video = None
+        self.captions.close()
+        for path in (self.part_path, self.captions_part_path):
+            if os.path.exists(path):
+                os.remove(path)